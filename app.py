@@ -1,8 +1,31 @@
-from quart import Quart, request, jsonify
-from chatbot import route_user_query
+import asyncio
+import json
+from quart import Quart, request, jsonify, make_response
+from chatbot import diagnosis_cache, route_user_query, routing_stats, stream_user_query
+from splunk_helper import close_splunk_client, get_splunk_client
+from result_cache import result_cache
+from llm_gateway import close_llm_gateway, gateway
+from git_workspace import workspace
+from job_queue import job_queue
+from prefetch import prefetcher
+from telemetry import metrics
 
 app = Quart(__name__)
 
+@app.before_serving
+async def startup():
+    await workspace.cleanup()
+    await job_queue.start()
+    await prefetcher.start()
+    await get_splunk_client().start()
+
+@app.after_serving
+async def shutdown():
+    await prefetcher.stop()
+    await job_queue.stop()
+    await close_splunk_client()
+    await close_llm_gateway()
+
 @app.route("/query", methods=["POST"])
 async def query():
     data = await request.get_json()
@@ -11,8 +34,63 @@ async def query():
     if not user_input:
         return jsonify({"error": "No input provided"}), 400
 
-    result = await route_user_query(user_input)
+    session_id = data.get("session_id") or request.headers.get("X-Session-Id") or "default"
+    result = await route_user_query(user_input, session_id)
     return jsonify(result), 200
 
+@app.route("/query/stream", methods=["POST"])
+async def query_stream():
+    data = await request.get_json()
+    user_input = data.get("message")
+
+    if not user_input:
+        return jsonify({"error": "No input provided"}), 400
+
+    session_id = data.get("session_id") or request.headers.get("X-Session-Id") or "default"
+
+    # Server-Sent Events: one frame per pipeline stage, flushed as soon as it happens
+    async def events():
+        async for event in stream_user_query(user_input, session_id):
+            yield f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n".encode()
+
+    response = await make_response(events(), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    response.timeout = None
+    return response
+
+@app.route("/cache/stats", methods=["GET"])
+async def cache_stats():
+    return jsonify({
+        **result_cache.stats(),
+        "splunk_jobs": get_splunk_client().jobs.stats(),
+        "diagnoses": await asyncio.to_thread(diagnosis_cache.stats),
+    }), 200
+
+@app.route("/routing/stats", methods=["GET"])
+async def routing_stats_view():
+    return jsonify({**routing_stats, "llm_gateway": gateway.stats()}), 200
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_view():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+async def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+@app.route("/jobs/stats", methods=["GET"])
+async def job_stats():
+    return jsonify(job_queue.stats()), 200
+
+@app.route("/prefetch/stats", methods=["GET"])
+async def prefetch_stats():
+    return jsonify(prefetcher.stats()), 200
+
 if __name__ == "__main__":
     app.run(debug=True)
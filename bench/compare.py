@@ -0,0 +1,85 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from run import RESULTS_DIR
+
+# Compares two saved benchmark runs level by level; exits non-zero when a latency percentile regressed past the threshold
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _change(old, new):
+    if old is None or new is None or old == 0:
+        return None
+    return (new - old) / old
+
+
+def _fmt(old, new, scale=1000.0, unit="ms"):
+    change = _change(old, new)
+    delta = "" if change is None else f" ({change:+.1%})"
+    old_text = "-" if old is None else f"{old * scale:.1f}"
+    new_text = "-" if new is None else f"{new * scale:.1f}"
+    return f"{old_text} -> {new_text} {unit}{delta}"
+
+
+def compare(baseline, candidate, threshold):
+    regressions = []
+    print(f"baseline  {baseline['commit']}{'-dirty' if baseline['dirty'] else ''} {baseline['timestamp']} {baseline['label']}")
+    print(f"candidate {candidate['commit']}{'-dirty' if candidate['dirty'] else ''} {candidate['timestamp']} {candidate['label']}")
+    old_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for new in candidate["levels"]:
+        old = old_levels.get(new["concurrency"])
+        if old is None:
+            continue
+        print(f"\nconcurrency={new['concurrency']}")
+        print(f"  throughput  {_fmt(old['throughput_rps'], new['throughput_rps'], 1.0, 'req/s')}")
+        for q in ("p50", "p95", "p99"):
+            print(f"  latency {q} {_fmt(old['latency'][q], new['latency'][q])}")
+            change = _change(old["latency"][q], new["latency"][q])
+            if change is not None and change > threshold:
+                regressions.append(f"concurrency={new['concurrency']} latency {q} {change:+.1%}")
+        for stage in sorted(set(old["stages"]) | set(new["stages"])):
+            old_stage = old["stages"].get(stage, {})
+            new_stage = new["stages"].get(stage, {})
+            print(f"  {stage:<16} p50 {_fmt(old_stage.get('p50'), new_stage.get('p50'))}"
+                  f"   p95 {_fmt(old_stage.get('p95'), new_stage.get('p95'))}")
+            change = _change(old_stage.get("p95"), new_stage.get("p95"))
+            if change is not None and change > threshold:
+                regressions.append(f"concurrency={new['concurrency']} stage {stage} p95 {change:+.1%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", nargs="?", help="defaults to the second newest run")
+    parser.add_argument("candidate", nargs="?", help="defaults to the newest run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as a regression")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    args = parser.parse_args(argv)
+
+    if args.baseline and args.candidate:
+        baseline_path, candidate_path = args.baseline, args.candidate
+    else:
+        runs = sorted(glob.glob(os.path.join(args.results_dir, "*.json")))
+        if args.baseline:
+            runs = [args.baseline] + runs[-1:]
+        if len(runs) < 2:
+            parser.error("need two result files to compare")
+        baseline_path, candidate_path = runs[-2], runs[-1]
+
+    regressions = compare(load(baseline_path), load(candidate_path), args.threshold)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from quart import Quart, Response, request
+
+# Stand-in for the Azure OpenAI chat completions endpoint: scripted tool calls, echoing rephrases and canned diagnoses
+BENCH_LLM_FIRST_TOKEN = float(os.getenv("BENCH_LLM_FIRST_TOKEN", "0.3"))
+BENCH_LLM_TOKEN_SECONDS = float(os.getenv("BENCH_LLM_TOKEN_SECONDS", "0.01"))
+BENCH_SCENARIO = os.getenv("BENCH_SCENARIO", os.path.join(os.path.dirname(__file__), "scenario.json"))
+
+app = Quart(__name__)
+stats = {"completions": 0, "streams": 0, "tool_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def load_scenario(path=BENCH_SCENARIO):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+scenario = load_scenario()
+
+
+def _tokens(text):
+    return max(1, len(text or "") // 4)
+
+
+def _scripted_step(text):
+    # The rephrase step echoes the message, so the routing call sees the scenario text verbatim
+    for step in scenario:
+        if step["message"] in text:
+            return step
+    return scenario[0]
+
+
+def _answer(body):
+    messages = body["messages"]
+    last = messages[-1].get("content") or ""
+    if body.get("tools"):
+        user_turns = [m.get("content") or "" for m in messages if m.get("role") == "user"]
+        step = _scripted_step(user_turns[-1] if user_turns else last)
+        if "reply" in step:
+            return step["reply"], None
+        args = dict(step["args"])
+        if any("rephrased_query" in t["function"]["parameters"]["properties"] for t in body["tools"]):
+            args["rephrased_query"] = step["message"]
+        return None, {"name": step["tool"], "arguments": json.dumps(args)}
+    if "Original message:" in last:
+        match = re.search(r"Original message: '(.*)'", last, re.DOTALL)
+        return (match.group(1) if match else last), None
+    frame = re.search(r"(\w+\.java):(\d+)", last)
+    if "root cause" in last:
+        file_path, line = (frame.group(1), int(frame.group(2))) if frame else ("TestApp.java", 17)
+        diagnosis = {
+            "root_cause": "A field is dereferenced before it is initialised.",
+            "fix": 'String test = "";',
+            "file_path": file_path,
+            "pr_type": "hotfix",
+            "line_number": line,
+        }
+        return f"```json\n{json.dumps(diagnosis, indent=2)}\n```", None
+    return '```java\nString test = "";\n```', None
+
+
+def _usage(body, content):
+    prompt = sum(_tokens(m.get("content")) for m in body["messages"])
+    completion = _tokens(content)
+    stats["prompt_tokens"] += prompt
+    stats["completion_tokens"] += completion
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _pieces(text, size=4):
+    # Roughly one token per chunk, like the real stream
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@app.post("/openai/deployments/<deployment>/chat/completions")
+async def chat_completions(deployment):
+    body = await request.get_json()
+    content, tool_call = _answer(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    text = content if content is not None else tool_call["arguments"]
+    usage = _usage(body, text)
+
+    if not body.get("stream"):
+        stats["completions"] += 1
+        await asyncio.sleep(BENCH_LLM_FIRST_TOKEN + BENCH_LLM_TOKEN_SECONDS * usage["completion_tokens"])
+        message = {"role": "assistant", "content": content}
+        if tool_call is not None:
+            stats["tool_calls"] += 1
+            message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function", "function": tool_call}]
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": usage,
+        }
+
+    stats["streams"] += 1
+
+    async def events():
+        await asyncio.sleep(BENCH_LLM_FIRST_TOKEN)
+        yield f"data: {json.dumps(_chunk(completion_id, deployment, {'role': 'assistant', 'content': ''}))}\n\n".encode()
+        for piece in _pieces(text):
+            if BENCH_LLM_TOKEN_SECONDS:
+                await asyncio.sleep(BENCH_LLM_TOKEN_SECONDS)
+            yield f"data: {json.dumps(_chunk(completion_id, deployment, {'content': piece}))}\n\n".encode()
+        yield f"data: {json.dumps(_chunk(completion_id, deployment, {}, 'stop'))}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    response = Response(events(), content_type="text/event-stream")
+    response.timeout = None
+    return response
+
+
+@app.get("/bench/stats")
+async def bench_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat endpoint for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    app.run(host=args.host, port=args.port, use_reloader=False)
@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from quart import Quart, Response, request
+
+# Stand-in for the Splunk REST endpoints the bot uses: login, jobs (normal/blocking/oneshot), status, results, export
+BENCH_SPLUNK_LATENCY = float(os.getenv("BENCH_SPLUNK_LATENCY", "0.02"))
+# How long a search takes to reach DONE; blocking and oneshot searches wait this long before answering
+BENCH_SPLUNK_JOB_SECONDS = float(os.getenv("BENCH_SPLUNK_JOB_SECONDS", "0.5"))
+BENCH_SPLUNK_RESULTS = int(os.getenv("BENCH_SPLUNK_RESULTS", "500"))
+# Distinct error signatures spread over the results, i.e. how many clusters the diagnosis step sees
+BENCH_SPLUNK_SIGNATURES = int(os.getenv("BENCH_SPLUNK_SIGNATURES", "3"))
+
+app = Quart(__name__)
+jobs = {}
+stats = {"logins": 0, "submitted": 0, "status_polls": 0, "result_pages": 0, "exports": 0, "cancelled": 0}
+
+
+def _rows(search, count=BENCH_SPLUNK_RESULTS, signatures=BENCH_SPLUNK_SIGNATURES):
+    app_name = (re.search(r'app="([^"]+)"', search) or re.search(r'"ERROR (\w+)"', search) or re.search(r"\b(\w+App\w*)\b", search))
+    app_name = app_name.group(1) if app_name else "TestApp"
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(count):
+        signature = i % max(signatures, 1)
+        stamp = now - timedelta(seconds=i)
+        if "NullPointerException" in search:
+            raw = (
+                f"{stamp:%b %d, %Y %I:%M:%S %p} {app_name} main\nSEVERE: Exception occurred\n"
+                f"java.lang.NullPointerException\n        at {app_name}.step{signature}({app_name}.java:{17 + signature})"
+            )
+        elif "status!=200" in search:
+            raw = f"{stamp:%Y-%m-%d %H:%M:%S},{i % 1000:03d} WARN {app_name} request failed status={500 + signature} path=/api/v{signature}"
+        else:
+            raw = f"{stamp:%Y-%m-%d %H:%M:%S},{i % 1000:03d} ERROR {app_name} operation{signature} failed: timeout after {signature + 1}000ms"
+        rows.append({"_raw": raw, "_time": stamp.isoformat(timespec="milliseconds")})
+    return rows
+
+
+def _select(rows, fields):
+    return [{f: r[f] for f in fields if f in r} for r in rows] if fields else rows
+
+
+async def _latency():
+    if BENCH_SPLUNK_LATENCY:
+        await asyncio.sleep(BENCH_SPLUNK_LATENCY)
+
+
+@app.post("/services/auth/login")
+async def login():
+    await _latency()
+    stats["logins"] += 1
+    return {"sessionKey": uuid.uuid4().hex}
+
+
+@app.post("/services/search/jobs")
+async def submit():
+    await _latency()
+    form = await request.form
+    search = form.get("search", "")
+    mode = form.get("exec_mode", "normal")
+    stats["submitted"] += 1
+    if mode == "oneshot":
+        await asyncio.sleep(BENCH_SPLUNK_JOB_SECONDS)
+        count = int(form.get("count") or BENCH_SPLUNK_RESULTS)
+        return {"results": _select(_rows(search)[:count], form.getlist("f"))}
+    sid = f"bench_{uuid.uuid4().hex[:12]}"
+    jobs[sid] = {"search": search, "started": time.monotonic(), "cancelled": False}
+    if mode == "blocking":
+        await asyncio.sleep(BENCH_SPLUNK_JOB_SECONDS)
+    return {"sid": sid}, 201
+
+
+def _job_content(job):
+    progress = 1.0 if BENCH_SPLUNK_JOB_SECONDS <= 0 else min(1.0, (time.monotonic() - job["started"]) / BENCH_SPLUNK_JOB_SECONDS)
+    done = progress >= 1.0 or job["cancelled"]
+    return {
+        "dispatchState": "DONE" if done else "RUNNING",
+        "isDone": done,
+        "isFailed": False,
+        "doneProgress": progress,
+        "ttl": 600,
+    }
+
+
+@app.get("/services/search/jobs/<sid>")
+async def status(sid):
+    await _latency()
+    stats["status_polls"] += 1
+    job = jobs.get(sid)
+    if job is None:
+        return {"messages": [{"type": "FATAL", "text": "Unknown sid."}]}, 404
+    return {"entry": [{"name": sid, "content": _job_content(job)}]}
+
+
+@app.get("/services/search/jobs/<sid>/results")
+async def results(sid):
+    await _latency()
+    stats["result_pages"] += 1
+    job = jobs.get(sid)
+    if job is None:
+        return {"messages": [{"type": "FATAL", "text": "Unknown sid."}]}, 404
+    offset = int(request.args.get("offset", 0))
+    count = int(request.args.get("count", 100))
+    rows = job.get("rows")
+    if rows is None:
+        rows = job["rows"] = _rows(job["search"])
+    return {"results": _select(rows[offset:offset + count], request.args.getlist("f"))}
+
+
+@app.post("/services/search/jobs/<sid>/control")
+async def control(sid):
+    await _latency()
+    job = jobs.get(sid)
+    if job is None:
+        return {"messages": [{"type": "FATAL", "text": "Unknown sid."}]}, 404
+    job["cancelled"] = True
+    stats["cancelled"] += 1
+    return {"messages": [{"type": "INFO", "text": "Search job cancelled."}]}
+
+
+@app.post("/services/search/jobs/export")
+async def export():
+    await _latency()
+    form = await request.form
+    stats["exports"] += 1
+    rows = _rows(form.get("search", ""))
+
+    async def lines():
+        # Events trickle out over the job duration, like a real export of a running search
+        delay = BENCH_SPLUNK_JOB_SECONDS / max(len(rows), 1)
+        for row in rows:
+            if delay:
+                await asyncio.sleep(delay)
+            yield (json.dumps({"preview": False, "result": row}) + "\n").encode()
+
+    return Response(lines(), content_type="application/json")
+
+
+@app.get("/bench/stats")
+async def bench_stats():
+    return {**stats, "jobs": len(jobs)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Splunk REST API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+    app.run(host=args.host, port=args.port, use_reloader=False)
@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import httpx
+
+# Drives app.py's /query against the fake Splunk and LLM servers and records end-to-end and per-stage latency.
+#   python bench/run.py --concurrency 1,4,16 --requests 200
+#   python bench/compare.py            # latest two saved runs
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", os.path.join(BENCH_DIR, "results"))
+# Fine geometric buckets (1ms .. ~80s) so quantiles read off the app's histograms are within a few percent
+BENCH_BUCKETS = ",".join(f"{0.001 * 1.25 ** i:.6g}" for i in range(51))
+
+_SAMPLE_RE = re.compile(r'^(\w+)_bucket\{stage="([^"]*)",status="([^"]*)",le="([^"]*)"\} (\S+)$')
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = q * (len(ordered) - 1)
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def parse_stage_buckets(text):
+    # stage -> {le: cumulative count} for successful spans, from the Prometheus exposition
+    stages = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match or not match.group(1).endswith("stage_duration_seconds") or match.group(3) != "ok":
+            continue
+        le = float("inf") if match.group(4) == "+Inf" else float(match.group(4))
+        stages.setdefault(match.group(2), {})[le] = float(match.group(5))
+    return stages
+
+
+def histogram_quantile(q, buckets):
+    # Same interpolation as Prometheus' histogram_quantile
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if total <= 0:
+        return None
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def stage_summary(before, after):
+    summary = {}
+    for stage, buckets in after.items():
+        delta = {le: count - before.get(stage, {}).get(le, 0) for le, count in buckets.items()}
+        count = delta.get(float("inf"), 0)
+        if count <= 0:
+            continue
+        summary[stage] = {
+            "count": int(count),
+            **{f"p{int(q * 100)}": histogram_quantile(q, delta) for q in (0.5, 0.95, 0.99)},
+        }
+    return summary
+
+
+class Servers:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.splunk_port = _free_port()
+        self.llm_port = _free_port()
+        self.app_port = _free_port()
+        self.processes = []
+
+    @property
+    def app_url(self):
+        return f"http://127.0.0.1:{self.app_port}"
+
+    def _spawn(self, command, env, name):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.processes.append(subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+
+    def start(self):
+        args = self.args
+        base = {**os.environ, "PYTHONUNBUFFERED": "1"}
+        self._spawn(
+            [sys.executable, os.path.join(BENCH_DIR, "fake_splunk.py"), "--port", str(self.splunk_port)],
+            {
+                **base,
+                "BENCH_SPLUNK_LATENCY": str(args.splunk_latency),
+                "BENCH_SPLUNK_JOB_SECONDS": str(args.job_seconds),
+                "BENCH_SPLUNK_RESULTS": str(args.results),
+                "BENCH_SPLUNK_SIGNATURES": str(args.signatures),
+            },
+            "fake_splunk",
+        )
+        self._spawn(
+            [sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(self.llm_port)],
+            {
+                **base,
+                "BENCH_LLM_FIRST_TOKEN": str(args.llm_first_token),
+                "BENCH_LLM_TOKEN_SECONDS": str(args.llm_token_seconds),
+                "BENCH_SCENARIO": args.scenario,
+            },
+            "fake_llm",
+        )
+        app_env = {
+            **base,
+            "SPLUNK_API_BASE": f"http://127.0.0.1:{self.splunk_port}",
+            "SPLUNK_USERNAME": "bench",
+            "SPLUNK_PASSWORD": "bench",
+            "AZURE_OPENAI_API_BASE": f"http://127.0.0.1:{self.llm_port}",
+            "AZURE_OPENAI_API_KEY": "bench",
+            "AZURE_OPENAI_API_VERSION": "2024-02-01",
+            "AZURE_OPENAI_DEPLOYMENT_NAME": "bench",
+            "ROUTING_MODE": args.routing_mode,
+            "LOG_LEVEL": "WARNING",
+            "METRICS_LATENCY_BUCKETS": BENCH_BUCKETS,
+            "DIAGNOSIS_CACHE_PATH": os.path.join(self.workdir, "diagnosis_cache.db"),
+            "CONVERSATION_BACKEND": "memory",
+            "JOB_QUEUE_BACKEND": "memory",
+            "GIT_WORKSPACE_DIR": os.path.join(self.workdir, "workspace"),
+        }
+        if not args.warm:
+            # Every query takes the full path: no cached results or diagnoses between requests
+            app_env["RESULT_CACHE_TTL"] = "0"
+            app_env["DIAGNOSIS_CACHE_TTL"] = "0"
+            app_env["PREFETCH_MAX_CONCURRENCY"] = "0"
+        self._spawn(
+            [sys.executable, "-m", "hypercorn", "app:app", "--bind", f"127.0.0.1:{self.app_port}"],
+            app_env,
+            "app",
+        )
+
+    async def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        urls = [
+            f"http://127.0.0.1:{self.splunk_port}/bench/stats",
+            f"http://127.0.0.1:{self.llm_port}/bench/stats",
+            f"{self.app_url}/metrics",
+        ]
+        async with httpx.AsyncClient(timeout=2) as client:
+            for url in urls:
+                while True:
+                    try:
+                        if (await client.get(url)).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    if time.monotonic() > deadline or any(p.poll() is not None for p in self.processes):
+                        raise RuntimeError(f"Benchmark servers did not start:\n{self.log_tails()}")
+                    await asyncio.sleep(0.2)
+
+    def log_tails(self, lines=20):
+        # The work directory is removed on exit, so failures carry the end of each log with them
+        tails = []
+        for name in ("fake_splunk", "fake_llm", "app"):
+            with open(os.path.join(self.workdir, f"{name}.log"), errors="replace") as f:
+                tails.append(f"--- {name}.log ---\n" + "".join(f.readlines()[-lines:]))
+        return "\n".join(tails)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def _one_request(client, path, message, session_id, stream):
+    started = time.perf_counter()
+    marks = {}
+    if not stream:
+        response = await client.post(path, json={"message": message, "session_id": session_id})
+        body = response.json()
+        ok = response.status_code == 200 and ("diagnostics" in body or "response" in body)
+        return time.perf_counter() - started, ok, marks
+    ok = False
+    async with client.stream("POST", path, json={"message": message, "session_id": session_id}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                # Time to the first event of each kind, as seen by the client
+                marks.setdefault(event, time.perf_counter() - started)
+                ok = ok or event == "result"
+    return time.perf_counter() - started, ok, marks
+
+
+async def run_level(app_url, scenario, concurrency, requests, stream, timeout):
+    path = "/query/stream" if stream else "/query"
+    latencies, errors, marks = [], 0, {}
+    next_index = 0
+
+    async def worker(worker_id, client):
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            step = scenario[index % len(scenario)]
+            try:
+                elapsed, ok, request_marks = await _one_request(
+                    client, path, step["message"], f"bench-{worker_id}", stream
+                )
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if not ok:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            for event, at in request_marks.items():
+                marks.setdefault(event, []).append(at)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout, limits=limits) as client:
+        before = parse_stage_buckets((await client.get("/metrics")).text)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+        after = parse_stage_buckets((await client.get("/metrics")).text)
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency": {f"p{int(q * 100)}": percentile(latencies, q) for q in (0.5, 0.95, 0.99)},
+        "stages": stage_summary(before, after),
+        "client_events": {
+            event: {f"p{int(q * 100)}": percentile(values, q) for q in (0.5, 0.95, 0.99)}
+            for event, values in marks.items()
+        },
+    }
+
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_level(result):
+    latency = result["latency"]
+    print(
+        f"\nconcurrency={result['concurrency']} requests={result['requests']} errors={result['errors']} "
+        f"throughput={result['throughput_rps']:.2f} req/s p50={_ms(latency['p50'])}ms "
+        f"p95={_ms(latency['p95'])}ms p99={_ms(latency['p99'])}ms"
+    )
+    print(f"  {'stage':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, s in sorted(result["stages"].items(), key=lambda item: -(item[1]["p50"] or 0)):
+        print(f"  {stage:<18}{s['count']:>7}{_ms(s['p50']):>10}{_ms(s['p95']):>10}{_ms(s['p99']):>10}")
+    if result["client_events"]:
+        print(f"  {'first event':<18}{'':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for event, e in sorted(result["client_events"].items(), key=lambda item: item[1]["p50"]):
+            print(f"  {event:<18}{'':>7}{_ms(e['p50']):>10}{_ms(e['p95']):>10}{_ms(e['p99']):>10}")
+
+
+def save(report, output_dir=RESULTS_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{report['commit'] or 'nogit'}{'-dirty' if report['dirty'] else ''}"
+    if report["label"]:
+        name += f"-{re.sub(r'[^A-Za-z0-9_.-]', '-', report['label'])}"
+    path = os.path.join(output_dir, f"{name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+async def main(args):
+    with open(args.scenario, encoding="utf-8") as f:
+        scenario = json.load(f)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    with tempfile.TemporaryDirectory(prefix="splunkbot-bench-") as workdir:
+        servers = Servers(args, workdir)
+        servers.start()
+        try:
+            await servers.wait_ready()
+            if args.warmup:
+                await run_level(servers.app_url, scenario, 1, args.warmup, args.stream, args.timeout)
+            results = []
+            for concurrency in levels:
+                result = await run_level(servers.app_url, scenario, concurrency, args.requests, args.stream, args.timeout)
+                print_level(result)
+                results.append(result)
+        finally:
+            servers.stop()
+
+    report = {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "no_save")},
+        "levels": results,
+    }
+    if not args.no_save:
+        print(f"\nSaved {save(report, args.output)}")
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Splunk bot against fake Splunk and LLM servers")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="requests sent before measuring")
+    parser.add_argument("--scenario", default=os.path.join(BENCH_DIR, "scenario.json"))
+    parser.add_argument("--stream", action="store_true", help="use /query/stream and time each SSE event")
+    parser.add_argument("--routing-mode", default="two_step", choices=["two_step", "single", "fast"])
+    parser.add_argument("--warm", action="store_true", help="keep the result and diagnosis caches and the prefetcher enabled")
+    parser.add_argument("--splunk-latency", type=float, default=0.02, help="seconds added to every Splunk call")
+    parser.add_argument("--job-seconds", type=float, default=0.5, help="seconds a Splunk search takes to finish")
+    parser.add_argument("--results", type=int, default=500, help="rows returned per search")
+    parser.add_argument("--signatures", type=int, default=3, help="distinct error signatures in the results")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--llm-token-seconds", type=float, default=0.01, help="seconds per generated token")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--label", default="", help="free-form tag added to the result file name")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--no-save", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -1,90 +1,48 @@
-from openai import AzureOpenAI
+import asyncio
 import os
 from dotenv import load_dotenv
 import json
-import pprint
-from splunk_helper import splunk_login, splunk_submit_search, splunk_wait_for_job, splunk_get_results
-from github_helper import handle_llm_diagnostic, maybe_apply_fix_from_user
+import logging
+import re
+import time
+from splunk_helper import SplunkError, splunk_login, splunk_stream_search
+from github_helper import get_default_repo, get_file_blob_sha, handle_llm_diagnostic, maybe_apply_fix_from_user, parse_diagnostic_output, refresh_repo_mirrors
+from result_cache import make_cache_key, result_cache
+from fast_router import FastRouter
+from conversation_store import ConversationStore
+from llm_gateway import chat_completion, stream_chat_completion
+from diagnosis_cache import DiagnosisCache, fingerprint_log
+from log_clustering import cluster_rows
+from source_index import stack_frame
+from intents import intent_registry
+from time_range import parse_time_range
+from prefetch import prefetcher
+from telemetry import get_logger, record_cache, span, trace
 
 
 load_dotenv()
 
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE")
-)
-# Define functions
-functions = [
-    {
-        "name": "check_status",
-        "description": "Check the status of an application using Splunk logs.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "application_name": {"type": "string"},
-                "time_range": {
-                    "type": "string",
-                    "description": "A time range like 'last 24 hours', 'past 7 days', 'today', etc."
-                    }
-            },
-            "required": ["application_name"]
-        }
-    },
-    {
-        "name": "search_errors",
-        "description": "Search for errors in a specific application's logs.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "application_name": {"type": "string"},
-                "time_range": {
-                    "type": "string",
-                    "description": "A time range like 'last 24 hours', 'past 7 days', 'today', etc."
-                }
-            },
-            "required": ["application_name"]
-        }
-    },
-    {
-        "name": "search_null_pointer_exceptions",
-        "description": "Search for null pointer exceptions in a specific application's logs.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "application_name": {"type": "string"},
-                "time_range": {
-                    "type": "string",
-                    "description": "A time range like 'last 24 hours', 'past 7 days', 'today', etc."
-                }
-            },
-            "required": ["application_name"]
-        }
-    }
-]
-
-def parse_time_range(time_range: str) -> tuple[str, str]:
-    time_range = (time_range or "").lower().strip()
-
-    if "last 24 hours" in time_range or "past 24 hours" in time_range:
-        return "-24h", "now"
-    elif "last 7 days" in time_range or "past 7 days" in time_range or "past week" in time_range:
-        return "-7d", "now"
-    elif "last hour" in time_range or "past hour" in time_range:
-        return "-1h", "now"
-    elif "today" in time_range:
-        return "@d", "now"
-    elif "yesterday" in time_range:
-        return "@d-1d", "@d"
-    elif "last 30 minutes" in time_range or "past 30 minutes" in time_range:
-        return "-30m", "now"
-    elif "last 15 minutes" in time_range or "past 15 minutes" in time_range:
-        return "-15m", "now"
-    else:
-        # Default fallback
-        return "-1h", "now"
+log = get_logger(__name__)
+
+# Intents (schema, SPL template, time defaults, post-processor) live in intents.py; tool payloads are built there once
+functions = intent_registry.functions
+TOOLS = intent_registry.tools
+SINGLE_CALL_TOOLS = intent_registry.single_call_tools
+
+# "two_step": rephrase then route (two LLM calls); "single": one combined call;
+# "fast": local keyword classifier, falling back to "single" when the message is ambiguous
+ROUTING_MODE = os.getenv("ROUTING_MODE", "two_step")
+fast_router = FastRouter(functions, synonyms=intent_registry.synonyms)
+routing_stats = {}
 
-def get_rephrased_query(conversation: list, user_input: str) -> str:
+# How many distinct error signatures get their own diagnosis per query
+DIAGNOSE_TOP_K = int(os.getenv("DIAGNOSE_TOP_K", "3"))
+# Rows sent in the early "results" event of a streamed query
+RESULTS_PREVIEW_ROWS = int(os.getenv("RESULTS_PREVIEW_ROWS", "5"))
+# Rows returned as-is by intents using the "table" post-processor
+TABLE_MAX_ROWS = int(os.getenv("TABLE_MAX_ROWS", "100"))
+
+async def get_rephrased_query(conversation: list, user_input: str) -> str:
     system_prompt = {
         "role": "system",
         "content": (
@@ -97,29 +55,18 @@ def get_rephrased_query(conversation: list, user_input: str) -> str:
 
     messages = [system_prompt] + conversation + [{"role": "user", "content": f"Original message: '{user_input}'\n\nRephrase it as a clear and complete instruction."}]
 
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-        messages=messages,
-        temperature=0.2
-    )
+    with span("rephrase"):
+        response = await chat_completion(messages, temperature=0.2)
 
     return response.choices[0].message.content.strip()
 
 
-def generate_spl(function_name: str, app_name: str, earliest_time: str = "-1h", latest_time: str = "now") -> str:
-    time_filter = f' earliest="{earliest_time}" latest="{latest_time}"'
-
-    if function_name == "check_status":
-        return f'search index=main sourcetype=test1 app="{app_name}" status!=200{time_filter}'
-    elif function_name == "search_errors":
-        return f'search source="app_dummy_logs.log" host="DESKTOP-517J9U9" sourcetype="test1" "ERROR {app_name}"{time_filter}'
-    elif function_name == "search_null_pointer_exceptions":
-        return f'search source="test_log.txt" host="DESKTOP-517J9U9" sourcetype="test4" {app_name} "NullPointerException" AND "at " {time_filter}'
-    return "Unknown function"
+def generate_spl(function_name: str, app_name: str, earliest_time: str = "-1h", latest_time: str = "now", args: dict | None = None) -> str:
+    spl = intent_registry.render(function_name, {**(args or {}), "application_name": app_name}, earliest_time, latest_time)
+    return spl if spl is not None else "Unknown function"
 
 
-conversation = [
-    {"role": "system", 
+SYSTEM_MESSAGE = {"role": "system", 
     "content": """You are a Splunk assistant designed to help users generate Splunk queries for analyzing application logs. 
 
     Your role is to decide if a user's message clearly conveys a well-defined goal. If it does, choose the appropriate function from the available tools and provide only the necessary arguments. Do not make assumptions or guess missing information.
@@ -128,65 +75,458 @@ conversation = [
 
     Guidelines:
     - Never assume missing details like the application name.
+    - When the user asks about several applications, include every one of them, separated by commas, in `application_name`.
     - Only call a function if you are confident the user intends to perform one of the defined tasks (e.g., check status, search for errors).
     - If the user's request does not align with any defined functions, or seems incomplete, ask for clarification.
     - Do not give extra messages or explanations like ok now i am searching or going to call the function etc etc.
 
-    You must be accurate, cautious, and inquisitive when needed."""}]
+    You must be accurate, cautious, and inquisitive when needed."""}
 
-async def route_user_query(user_input: str) -> dict:
-    if "github.com" in user_input:
-        pr_response = maybe_apply_fix_from_user(user_input)
-        if "✅" in pr_response:
-            return {"response": pr_response}
+# Diagnoses keyed on the exception fingerprint; dropped when the blamed file changes in git
+diagnosis_cache = DiagnosisCache(blob_resolver=get_file_blob_sha, repo_resolver=get_default_repo)
+
+# Per-session history with a token budget; older turns are folded into a rolling summary
+conversation_store = ConversationStore(SYSTEM_MESSAGE)
+
+SINGLE_CALL_INSTRUCTIONS = {
+    "role": "system",
+    "content": (
+        "The latest user message may depend on earlier turns. Resolve any references using the conversation "
+        "before deciding. When you call a function, also set `rephrased_query` to the request rewritten as a "
+        "clear, fully self-contained instruction."
+    )
+}
+
+
+def _record_routing(mode, started):
+    elapsed = time.perf_counter() - started
+    stats = routing_stats.setdefault(mode, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+    stats["count"] += 1
+    stats["total_seconds"] += elapsed
+    stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+    stats["avg_seconds"] = stats["total_seconds"] / stats["count"]
+
+
+def _decision_from_message(message):
+    if message.content:
+        return {"reply": message.content}
+    if message.tool_calls:
+        # Parallel tool calls (e.g. one per application) are all kept and fanned out by the pipeline
+        return {"calls": [
+            {"function_name": tool.function.name, "args": json.loads(tool.function.arguments)}
+            for tool in message.tool_calls
+        ]}
+    return {}
+
+
+async def route_two_step(user_input, conversation):
     # Step 1: Get reframed query from GPT
-    clarified_input = get_rephrased_query(conversation, user_input)
+    clarified_input = await get_rephrased_query(conversation.messages(), user_input)
 
     # Step 2: Add reframed query to conversation
     conversation.append({"role": "user", "content": clarified_input})
-    pprint.pprint(conversation)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Routing rephrased query", extra={"query": clarified_input, "turns": len(conversation.turns)})
     # Step 3: Run assistant with function calling logic
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-        messages=conversation,
-        tools=[{"type": "function", "function": fn} for fn in functions],
-        tool_choice="auto"
+    with span("tool_routing", mode="two_step"):
+        response = await chat_completion(
+            conversation.messages(),
+            tools=TOOLS,
+            tool_choice="auto"
+        )
+    return _decision_from_message(response.choices[0].message)
+
+
+async def route_single_call(user_input, conversation):
+    # Rephrasing and tool selection in one completion
+    with span("tool_routing", mode="single"):
+        response = await chat_completion(
+            conversation.messages() + [SINGLE_CALL_INSTRUCTIONS, {"role": "user", "content": user_input}],
+            tools=SINGLE_CALL_TOOLS,
+            tool_choice="auto",
+            temperature=0.2
+        )
+    decision = _decision_from_message(response.choices[0].message)
+    rephrased = [call["args"].pop("rephrased_query", None) for call in decision.get("calls", [])]
+    conversation.append({"role": "user", "content": next(filter(None, rephrased), None) or user_input})
+    return decision
+
+
+def route_fast(user_input, conversation):
+    match = fast_router.classify(user_input)
+    if match is None:
+        return None
+    function_name, args = match
+    conversation.append({"role": "user", "content": user_input})
+    return {"calls": [{"function_name": function_name, "args": args}]}
+
+
+async def select_tool(user_input, conversation, mode=None):
+    with span("routing") as fields:
+        decision, fields["mode"] = await _select_tool(user_input, conversation, mode or ROUTING_MODE)
+        fields["functions"] = ",".join(call["function_name"] for call in decision.get("calls", []))
+        return decision
+
+
+async def _select_tool(user_input, conversation, mode):
+    started = time.perf_counter()
+    if mode == "fast":
+        decision = route_fast(user_input, conversation)
+        if decision is not None:
+            _record_routing("fast", started)
+            return decision, "fast"
+        mode = "single"
+    if mode == "single":
+        decision = await route_single_call(user_input, conversation)
+    else:
+        mode = "two_step"
+        decision = await route_two_step(user_input, conversation)
+    _record_routing(mode, started)
+    return decision, mode
+
+
+async def route_user_query(user_input: str, session_id: str = "default") -> dict:
+    conversation = await conversation_store.get(session_id)
+    try:
+        with trace(), span("query", session_id=session_id):
+            return await run_query_pipeline(user_input, conversation, session_id=session_id)
+    finally:
+        # Saved even when the request is cancelled
+        await asyncio.shield(conversation_store.save(session_id))
+
+
+async def stream_user_query(user_input: str, session_id: str = "default"):
+    # Same pipeline as route_user_query, but yields stage events as they happen and the result last
+    conversation = await conversation_store.get(session_id)
+    events = asyncio.Queue()
+
+    async def emit(event, **data):
+        await events.put({"event": event, **data})
+
+    async def run():
+        try:
+            with trace(), span("query", session_id=session_id, streamed=True):
+                result = await run_query_pipeline(user_input, conversation, emit, session_id)
+            await events.put({"event": "result", "result": result})
+        except Exception as e:
+            await events.put({"event": "error", "message": str(e)})
+        finally:
+            await events.put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+    finally:
+        # The client went away mid-stream (noticed on the next event we try to send): stop the pipeline.
+        # Its Splunk jobs are cancelled too, unless an identical request still in flight is sharing them
+        if not task.done():
+            task.cancel()
+        await asyncio.shield(conversation_store.save(session_id))
+
+
+async def _no_events(event, **data):
+    pass
+
+
+async def _preview_rows(rows, emit, limit=RESULTS_PREVIEW_ROWS):
+    # Passes rows through untouched, announcing the first few as soon as they arrive
+    preview = []
+    announced = False
+    try:
+        async for row in rows:
+            if len(preview) < limit:
+                preview.append(row)
+                if len(preview) == limit:
+                    await emit("results", rows=preview)
+                    announced = True
+            yield row
+    finally:
+        await rows.aclose()
+        if preview and not announced:
+            await emit("results", rows=preview)
+
+
+async def run_query_pipeline(user_input, conversation, emit=None, session_id=None):
+    stream_tokens = emit is not None
+    emit = emit or _no_events
+
+    if "github.com" in user_input:
+        queued = await maybe_apply_fix_from_user(user_input, conversation.pending_fix, session_id)
+        if queued is not None:
+            conversation.pending_fix = None
+            await emit("job_queued", job_id=queued["job_id"])
+            return queued
+
+    # Routing is the slowest step before any search starts; say so first, so the client sees the query was
+    # accepted and a client that has already gone away is noticed before a Splunk job is submitted
+    await emit("routing")
+    decision = await select_tool(user_input, conversation)
+
+    if decision.get("reply"):
+        conversation.append({"role": "assistant", "content": decision["reply"]})
+        return {"response": decision["reply"]}
+
+    if decision.get("calls"):
+        tasks = _group_calls(decision["calls"])
+        if len(tasks) == 1 and len(tasks[0]["apps"]) <= 1:
+            task = tasks[0]
+            app_name = task["apps"][0] if task["apps"] else None
+            result = await run_intent(task["function_name"], app_name, task["args"], emit, stream_tokens)
+            _remember_fix(conversation, result.get("diagnostics"))
+            return result
+
+        # Several applications and/or intents: one response split by application
+        results = await asyncio.gather(*(run_fanout(task, emit, stream_tokens) for task in tasks))
+        # Only one fix can be pending per session; the first application with one wins
+        diagnostics = [r.get("diagnostics") for result in results for r in result.get("applications", {}).values()]
+        _remember_fix(conversation, next((d for d in diagnostics if isinstance(d, dict) and d.get("parsed_fix")), None))
+        return results[0] if len(results) == 1 else {"results": results}
+
+    return {"response": "Unable to understand or process the query."}
+
+
+def _app_names(value):
+    # The LLM may send "A, B and C", a JSON list, or one name per parallel tool call
+    values = value if isinstance(value, list) else [value]
+    names = []
+    for item in values:
+        for name in re.split(r",|\s+and\s+", str(item or "")):
+            name = name.strip()
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def _group_calls(calls):
+    # Calls for the same intent and arguments (bar the application) become one task over several applications
+    tasks = {}
+    for call in calls:
+        args = dict(call["args"])
+        apps = _app_names(args.pop("application_name", None))
+        key = (call["function_name"], json.dumps(args, sort_keys=True))
+        task = tasks.setdefault(key, {"function_name": call["function_name"], "args": args, "apps": []})
+        task["apps"].extend(app for app in apps if app not in task["apps"])
+    return list(tasks.values())
+
+
+def _for_app(emit, app_name):
+    # Fanned-out searches share one event stream; every event says which application it belongs to
+    async def tagged(event, **data):
+        data.setdefault("application", app_name)
+        await emit(event, **data)
+    return tagged
+
+
+def _search_callbacks(emit):
+    async def on_start(mode, sid):
+        await emit("search_started", mode=mode, sid=sid)
+
+    async def on_progress(sid, state, progress):
+        await emit("job_progress", sid=sid, state=state, progress=progress)
+
+    return on_start, on_progress
+
+
+async def run_intent(function_name, app_name, args, emit=_no_events, stream_tokens=False):
+    intent = intent_registry.get(function_name)
+    if intent is None:
+        return {"response": "Unable to understand or process the query."}
+    earliest, latest = parse_time_range(args.get("time_range") or intent.default_time_range)
+    try:
+        spl_query = generate_spl(function_name, app_name, earliest, latest, args)
+    except ValueError as e:
+        return {"response": str(e)}
+    await emit(
+        "spl", function=function_name, application=app_name, spl=spl_query, earliest=earliest, latest=latest
     )
 
-    message = response.choices[0].message
+    # Hot (intent, app, window) tuples are kept warm in the background; a recent enough refresh answers directly
+    if app_name and not _extra_args(args):
+        prefetcher.record(function_name, app_name, earliest, latest)
+        prefetched = prefetcher.get(function_name, app_name, earliest, latest)
+        if prefetched is not None:
+            await emit("cache_hit", freshness=prefetched["freshness"])
+            return prefetched
+
+    cache_key = make_cache_key(spl_query, earliest, latest)
+    cached = result_cache.get(cache_key)
+    record_cache("result", cached is not None)
+    if cached is not None:
+        await emit("cache_hit")
+        return cached
+
+    session_key = await splunk_login()
+    if not session_key:
+        return {"response": "Splunk authentication failed."}
+
+    try:
+        result = await search_and_process(intent, app_name, spl_query, earliest, latest, emit, stream_tokens)
+    except SplunkError as e:
+        return {"response": str(e)}
+    result_cache.put(cache_key, result)
+    return result
+
+
+async def search_and_process(intent, app_name, spl_query, earliest, latest, emit=_no_events, stream_tokens=False):
+    on_start, on_progress = _search_callbacks(emit)
+    rows = splunk_stream_search(
+        spl_query,
+        earliest,
+        latest,
+        intent.expected_results,
+        fields=POST_PROCESSOR_FIELDS[intent.post_processor],
+        on_start=on_start,
+        on_progress=on_progress,
+        max_results=intent.max_results,
+    )
+    post_process = POST_PROCESSORS[intent.post_processor]
+    # Rows stream in while the post-processor runs, so this stage includes the Splunk fetch
+    with span("post_process", processor=intent.post_processor):
+        diagnostics = await post_process(
+            app_name, intent.name, spl_query, _preview_rows(rows, emit), emit, stream_tokens
+        )
+    return {
+        "diagnostics": diagnostics
+    }
 
-    if message.content:
-        conversation.append({"role": "assistant", "content": message.content})
-        return {"response": message.content}
 
-    if message.tool_calls:
-        tool = message.tool_calls[0]
-        function_name = tool.function.name
-        args = json.loads(tool.function.arguments)
-        app_name = args.get("application_name")
-        time_range = args.get("time_range", "")
-        earliest, latest = parse_time_range(time_range)
-        spl_query = generate_spl(function_name, app_name, earliest, latest)
+def _extra_args(args):
+    # Arguments beyond the window change the search, and prefetched tuples don't carry any
+    return {k: v for k, v in args.items() if k != "time_range" and v not in (None, "")}
 
 
-        session_key = splunk_login()
-        if not session_key:
-            return {"response": "Splunk authentication failed."}
+async def refresh_intent(function_name, app_name, earliest, latest):
+    # Background refresh for the prefetcher: same search and post-processing, no caches, errors raised
+    intent = intent_registry.get(function_name)
+    if intent is None:
+        raise ValueError(f"Unknown intent {function_name}")
+    spl_query = generate_spl(function_name, app_name, earliest, latest)
+    if not await splunk_login():
+        raise SplunkError("Splunk authentication failed.")
+    return await search_and_process(intent, app_name, spl_query, earliest, latest)
 
-        sid = splunk_submit_search(session_key, spl_query)
-        if not sid:
-            return {"response": "Failed to submit Splunk search."}
 
-        splunk_wait_for_job(session_key, sid)
-        results = splunk_get_results(session_key, sid)
+prefetcher.register(refresh_intent, parse_time_range)
 
-        diagnostics = await get_diagnostic_suggestion(app_name, function_name, spl_query, results)
 
-        return {
-            "diagnostics": diagnostics
-        }
+async def run_fanout(task, emit=_no_events, stream_tokens=False):
+    function_name, apps = task["function_name"], task["apps"]
+    intent = intent_registry.get(function_name)
+    if intent is None:
+        return {"function": function_name, "response": "Unable to understand or process the query."}
+    if intent.multi_template and len(apps) > 1:
+        with span("fanout", function=function_name, applications=len(apps), grouped=True):
+            try:
+                applications = await run_grouped(intent, apps, task["args"], emit, stream_tokens)
+            except Exception as e:
+                log.error("Grouped search failed", extra={"function": function_name, "error": str(e)})
+                applications = {app: {"response": str(e)} for app in apps}
+    else:
+        # No single-search form for this intent: the per-application searches run concurrently instead
+        with span("fanout", function=function_name, applications=len(apps), grouped=False):
+            outcomes = await asyncio.gather(*(
+                _app_outcome(app, run_intent(function_name, app, task["args"], _for_app(emit, app), stream_tokens))
+                for app in apps
+            ))
+        applications = dict(zip(apps, outcomes))
+    return {"function": function_name, "applications": applications}
+
+
+async def _app_outcome(app, work):
+    # One application failing (LLM outage, unparseable diagnosis) doesn't take the others' answers down with it
+    try:
+        return await work
+    except Exception as e:
+        log.error("Application query failed", extra={"application": app, "error": str(e)})
+        return {"response": str(e)}
+
+
+async def _iter_rows(rows):
+    for row in rows:
+        yield row
+
+
+def _group_value(row, field):
+    value = row.get(field)
+    # Multivalue fields come back as lists; the first value decides the group
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return str(value).lower() if value is not None else None
+
+
+async def run_grouped(intent, apps, args, emit=_no_events, stream_tokens=False):
+    # One Splunk search for every application (app IN (...)), split by the group field afterwards
+    function_name = intent.name
+    earliest, latest = parse_time_range(args.get("time_range") or intent.default_time_range)
+    try:
+        spl_query = intent_registry.render(function_name, args, earliest, latest, apps)
+    except ValueError as e:
+        return {app: {"response": str(e)} for app in apps}
+    fields = POST_PROCESSOR_FIELDS[intent.post_processor]
+    if fields:
+        # Cap events per application inside the search, so a noisy app can't use up the whole fetch
+        spl_query = f"{spl_query} | dedup {intent.max_results} {intent.group_field}"
+    await emit(
+        "spl", function=function_name, applications=apps, spl=spl_query, earliest=earliest, latest=latest
+    )
 
-    return {"response": "Unable to understand or process the query."}
+    cache_key = make_cache_key(spl_query, earliest, latest)
+    cached = result_cache.get(cache_key)
+    record_cache("result", cached is not None)
+    if cached is not None:
+        await emit("cache_hit", applications=apps)
+        return cached
+
+    session_key = await splunk_login()
+    if not session_key:
+        return {app: {"response": "Splunk authentication failed."} for app in apps}
+
+    on_start, on_progress = _search_callbacks(emit)
+    rows = splunk_stream_search(
+        spl_query,
+        earliest,
+        latest,
+        intent.expected_results * len(apps),
+        fields=fields + [intent.group_field] if fields else None,
+        on_start=on_start,
+        on_progress=on_progress,
+        max_results=intent.max_results * len(apps),
+    )
+    groups = {app: [] for app in apps}
+    by_name = {app.lower(): app for app in apps}
+    try:
+        async for row in rows:
+            app = by_name.get(_group_value(row, intent.group_field))
+            if app is not None and len(groups[app]) < intent.max_results:
+                groups[app].append(row)
+    except SplunkError as e:
+        return {app: {"response": str(e)} for app in apps}
+    finally:
+        await rows.aclose()
+
+    post_process = POST_PROCESSORS[intent.post_processor]
+
+    async def process(app):
+        app_emit = _for_app(emit, app)
+        with span("post_process", processor=intent.post_processor):
+            diagnostics = await post_process(
+                app, function_name, spl_query, _preview_rows(_iter_rows(groups[app]), app_emit), app_emit, stream_tokens
+            )
+        return {"diagnostics": diagnostics}
+
+    outcomes = await asyncio.gather(*(_app_outcome(app, process(app)) for app in apps))
+    applications = dict(zip(apps, outcomes))
+    # A failed application would otherwise keep failing from the cache until the entry expires
+    if all("diagnostics" in outcome for outcome in outcomes):
+        result_cache.put(cache_key, applications)
+    return applications
+
+
+def _remember_fix(conversation, diagnostics):
+    # The fix belongs to this session; a repo URL in its next message turns it into a PR job
+    if isinstance(diagnostics, dict) and diagnostics.get("parsed_fix"):
+        conversation.pending_fix = diagnostics["parsed_fix"]
 
 def create_diagnostic_prompt(app_name, function_called, spl_query, splunk_result_text):
     return f"""
@@ -224,27 +564,127 @@ def create_diagnostic_prompt(app_name, function_called, spl_query, splunk_result
     """
 
 
-async def get_diagnostic_suggestion(app_name, function_called, spl_query, splunk_results):
-    if not splunk_results.get("results"):
+async def diagnose_cluster(app_name, function_called, spl_query, cluster, on_token=None):
+    raw_log = cluster["sample"]
+    fingerprint, source_file = fingerprint_log(raw_log)
+    # Blob checks are only as fresh as the mirror, so fetch it first if it's older than GIT_BLOB_MAX_AGE
+    await refresh_repo_mirrors()
+    # The cache is sqlite plus git subprocesses for the blob check; both stay off the event loop
+    cached = await asyncio.to_thread(diagnosis_cache.get, fingerprint)
+    record_cache("diagnosis", cached is not None)
+    diagnostic = cached
+    if diagnostic is None:
+        prompt = create_diagnostic_prompt(app_name, function_called, spl_query, raw_log)
+        messages = [{"role": "user", "content": prompt}]
+
+        with span("diagnosis", fingerprint=fingerprint[:12], streamed=on_token is not None):
+            if on_token is not None:
+                diagnostic = (await stream_chat_completion(messages, on_token, temperature=0.4)).strip()
+            else:
+                response = await chat_completion(messages, temperature=0.4)
+                diagnostic = response.choices[0].message.content.strip()
+        log.debug("Diagnostic response", extra={"fingerprint": fingerprint[:12], "diagnostic": diagnostic})
+    parsed = parse_diagnostic_output(diagnostic)
+    # The frame the fix points at, so the PR flow can find the file without trusting the LLM's path
+    parsed["frame"] = stack_frame(raw_log, parsed["file_path"])
+    if cached is None:
+        await asyncio.to_thread(diagnosis_cache.put, fingerprint, diagnostic, parsed.get("file_path") or source_file)
+    return {
+        "fingerprint": fingerprint,
+        "template": cluster["template"],
+        "count": cluster["count"],
+        "latest": cluster["latest"],
+        "sample": raw_log,
+        "raw_diagnostic": diagnostic,
+        "parsed_fix": parsed
+    }
+
+
+def _dedupe_diagnoses(diagnoses):
+    # Different templates can share a stack fingerprint or end up with the same fix; merge those
+    merged = {}
+    for diagnosis in diagnoses:
+        fix = diagnosis["parsed_fix"]
+        key = (fix["file_path"], fix["line_number"], fix["fix_text"].strip())
+        existing = merged.get(key) or next(
+            (d for d in merged.values() if d["fingerprint"] == diagnosis["fingerprint"]), None
+        )
+        if existing is None:
+            merged[key] = {**diagnosis, "templates": [diagnosis["template"]]}
+        else:
+            existing["count"] += diagnosis["count"]
+            existing["templates"].append(diagnosis["template"])
+    return sorted(merged.values(), key=lambda d: d["count"], reverse=True)
+
+
+async def get_diagnostic_suggestion(app_name, function_called, spl_query, splunk_rows, emit=None, stream_tokens=False):
+    emit = emit or _no_events
+    # Group every returned row into templates, then diagnose the top signatures concurrently
+    clusters = await cluster_rows(splunk_rows)
+    if not clusters:
         return {"response": "No Splunk results found to analyze."}
+    await emit("clusters", clusters=[
+        {"template": c["template"], "count": c["count"], "latest": c["latest"]} for c in clusters[:DIAGNOSE_TOP_K]
+    ])
 
-    # Extract raw log line from first result
-    first_result = splunk_results["results"][0]
-    raw_log = first_result.get("_raw") or json.dumps(first_result)
+    async def diagnose(index, cluster):
+        async def on_token(text):
+            await emit("token", cluster=index, text=text)
 
-    prompt = create_diagnostic_prompt(app_name, function_called, spl_query, raw_log)
+        diagnosis = await diagnose_cluster(
+            app_name, function_called, spl_query, cluster, on_token if stream_tokens else None
+        )
+        await emit("diagnosis", cluster=index, parsed_fix=diagnosis["parsed_fix"])
+        return diagnosis
 
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.4
+    outcomes = await asyncio.gather(
+        *(diagnose(i, c) for i, c in enumerate(clusters[:DIAGNOSE_TOP_K])),
+        return_exceptions=True
     )
-
-    diagnostic = response.choices[0].message.content.strip()
-    print("Diagnostic response:", diagnostic)
-    summary, parsed = handle_llm_diagnostic(diagnostic)
+    diagnoses = [d for d in outcomes if isinstance(d, dict)]
+    if not diagnoses:
+        raise next(e for e in outcomes if isinstance(e, BaseException))
+    ranked = _dedupe_diagnoses(diagnoses)
+
+    # The highest-ranked fix is the one offered for the PR flow
+    top = ranked[0]
+    summary, parsed = handle_llm_diagnostic(top["raw_diagnostic"])
+    parsed["frame"] = top["parsed_fix"]["frame"]
     return {
         "diagnostic_suggestion": summary,
-        "raw_diagnostic": diagnostic,
-        "parsed_fix": parsed
-    }
\ No newline at end of file
+        "raw_diagnostic": top["raw_diagnostic"],
+        "parsed_fix": parsed,
+        "clusters_found": len(clusters),
+        "diagnoses": [{k: v for k, v in d.items() if k != "raw_diagnostic"} for d in ranked]
+    }
+
+
+async def tabulate_rows(app_name, function_called, spl_query, splunk_rows, emit=None, stream_tokens=False):
+    # For aggregate intents (stats/top/timechart): the rows are the answer, no diagnosis needed
+    rows = []
+    try:
+        async for row in splunk_rows:
+            rows.append(row)
+            if len(rows) >= TABLE_MAX_ROWS:
+                break
+    finally:
+        await splunk_rows.aclose()
+    if not rows:
+        return {"response": "No Splunk results found."}
+    return {"rows": rows, "row_count": len(rows)}
+
+
+POST_PROCESSORS = {
+    "diagnose": get_diagnostic_suggestion,
+    "table": tabulate_rows,
+}
+
+# Fields requested from Splunk per post-processor; None keeps every column (stats/top output)
+POST_PROCESSOR_FIELDS = {
+    "diagnose": ["_raw", "_time"],
+    "table": None,
+}
+
+for _intent in intent_registry:
+    if _intent.post_processor not in POST_PROCESSORS:
+        raise ValueError(f"Intent {_intent.name!r} uses unknown post-processor {_intent.post_processor!r}")
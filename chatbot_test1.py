@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 import json
 import pprint
+from intents import intent_registry
 load_dotenv()
 state = {
     "application_name": None,
@@ -13,38 +14,10 @@ client = AzureOpenAI(
     api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
     azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE")
 )
-# Define functions
-functions = [
-    {
-        "name": "check_status",
-        "description": "Check the status of an application using Splunk logs.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "application_name": {"type": "string"}
-            },
-            "required": ["application_name"]
-        }
-    },
-    {
-        "name": "search_errors",
-        "description": "Search for errors in a specific application's logs.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "application_name": {"type": "string"}
-            },
-            "required": ["application_name"]
-        }
-    }
-]
-
+# Intents and the SPL they generate are shared with chatbot.py
 def generate_spl(function_name: str, app_name: str) -> str:
-    if function_name == "check_status":
-        return f'search index=main sourcetype=app_logs app="{app_name}" status!=200'
-    elif function_name == "search_errors":
-        return f'search index=main sourcetype=app_logs app="{app_name}" error=*'
-    return "Unknown function"
+    spl = intent_registry.render(function_name, {"application_name": app_name}, "-1h", "now")
+    return spl if spl is not None else "Unknown function"
 
 conversation = [{
 "role": "system",
@@ -77,7 +50,7 @@ async def route_user_query(user_input: str) -> dict:
     response = client.chat.completions.create(
         model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
         messages=conversation,
-        tools=[{"type": "function", "function": fn} for fn in functions],
+        tools=intent_registry.tools,
         tool_choice="auto"
     )
 
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "2000"))
+CONVERSATION_WINDOW = int(os.getenv("CONVERSATION_WINDOW", "12"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "300"))
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+CONVERSATION_IDLE_TIMEOUT = float(os.getenv("CONVERSATION_IDLE_TIMEOUT", "1800"))
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+# Persisted sessions not written to for this long are deleted; checked at most once per purge interval
+CONVERSATION_RETENTION = float(os.getenv("CONVERSATION_RETENTION", str(7 * 24 * 3600)))
+CONVERSATION_PURGE_INTERVAL = float(os.getenv("CONVERSATION_PURGE_INTERVAL", "600"))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English prompts, plus per-message framing overhead
+    return len(text or "") // 4 + 4
+
+
+def summarize_turns(summary: str, dropped: list, max_tokens: int = CONVERSATION_SUMMARY_TOKENS) -> str:
+    # Cheap extractive summary: keep the start of each dropped turn and only the newest part of the summary
+    notes = [f"{m['role']}: {' '.join((m.get('content') or '').split())[:160]}" for m in dropped]
+    combined = "\n".join(filter(None, [summary] + notes))
+    max_chars = max_tokens * 4
+    return combined[-max_chars:] if len(combined) > max_chars else combined
+
+
+class Conversation:
+    def __init__(self, system_message, summary="", messages=None, pending_fix=None):
+        self.system_message = system_message
+        self.summary = summary
+        self.turns = list(messages or [])
+        # Last fix suggested in this session, applied when the user replies with a repo URL
+        self.pending_fix = pending_fix
+        self.last_used = time.monotonic()
+
+    def append(self, message):
+        self.turns.append(message)
+        self.last_used = time.monotonic()
+
+    def messages(self):
+        prefix = [self.system_message]
+        if self.summary:
+            prefix.append({"role": "system", "content": f"Summary of earlier conversation:\n{self.summary}"})
+        return prefix + self.turns
+
+    def token_count(self):
+        return sum(estimate_tokens(m.get("content")) for m in self.messages())
+
+    def compact(self, token_budget, window, summarizer=summarize_turns, summary_tokens=CONVERSATION_SUMMARY_TOKENS):
+        # Keep the newest turns verbatim; fold older ones into the rolling summary
+        dropped = []
+        while self.turns and (len(self.turns) > window or self.token_count() > token_budget):
+            if len(self.turns) == 1:
+                break
+            dropped.append(self.turns.pop(0))
+        if dropped:
+            self.summary = summarizer(self.summary, dropped, summary_tokens)
+        return len(dropped)
+
+    def to_state(self):
+        return {"summary": self.summary, "messages": self.turns, "pending_fix": self.pending_fix}
+
+
+class InMemoryBackend:
+    # Sessions only live as long as the process; evicting one from the LRU forgets it
+    discard_on_evict = True
+
+    def __init__(self):
+        self._states = {}
+
+    def load(self, session_id):
+        return self._states.get(session_id)
+
+    def save(self, session_id, state):
+        self._states[session_id] = state
+
+    def delete(self, session_id):
+        self._states.pop(session_id, None)
+
+    def purge_older_than(self, seconds):
+        # Nothing outlives its LRU entry here
+        pass
+
+
+class SQLiteBackend:
+    # Local stand-in for a shared store: evicted sessions are reloaded on their next message
+    discard_on_evict = False
+
+    def __init__(self, path=CONVERSATION_DB_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, state):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), time.time()),
+            )
+            self._db.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+    def purge_older_than(self, seconds):
+        with self._lock:
+            self._db.execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - seconds,))
+            self._db.commit()
+
+
+def make_backend(name=CONVERSATION_BACKEND):
+    if name == "sqlite":
+        return SQLiteBackend()
+    return InMemoryBackend()
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        system_message,
+        backend=None,
+        token_budget=CONVERSATION_TOKEN_BUDGET,
+        window=CONVERSATION_WINDOW,
+        max_sessions=CONVERSATION_MAX_SESSIONS,
+        idle_timeout=CONVERSATION_IDLE_TIMEOUT,
+        summarizer=summarize_turns,
+        summary_tokens=CONVERSATION_SUMMARY_TOKENS,
+        retention=CONVERSATION_RETENTION,
+        purge_interval=CONVERSATION_PURGE_INTERVAL,
+    ):
+        self.system_message = system_message
+        self.backend = backend or make_backend()
+        self.token_budget = token_budget
+        self.window = window
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.summarizer = summarizer
+        # The summary never takes more than a quarter of the budget
+        self.summary_tokens = min(summary_tokens, token_budget // 4)
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self._purged_at = None
+        self._sessions = OrderedDict()
+
+    # Backend calls are sqlite for the SQLite backend, so they run in a worker thread like the diagnosis cache's;
+    # the in-memory LRU is only touched on the event loop
+    async def get(self, session_id):
+        await self.evict_idle()
+        conversation = self._sessions.get(session_id)
+        if conversation is None:
+            state = await asyncio.to_thread(self.backend.load, session_id) or {}
+            # Another request for the same session may have loaded it while this one waited
+            conversation = self._sessions.get(session_id)
+            if conversation is None:
+                conversation = Conversation(
+                    self.system_message, state.get("summary", ""), state.get("messages"), state.get("pending_fix")
+                )
+                self._sessions[session_id] = conversation
+                while len(self._sessions) > self.max_sessions:
+                    await self._evict(next(iter(self._sessions)))
+        self._sessions.move_to_end(session_id)
+        conversation.last_used = time.monotonic()
+        return conversation
+
+    async def save(self, session_id):
+        conversation = self._sessions.get(session_id)
+        if conversation is None:
+            return
+        conversation.compact(self.token_budget, self.window, self.summarizer, self.summary_tokens)
+        await asyncio.to_thread(self.backend.save, session_id, conversation.to_state())
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        if self.retention > 0 and (self._purged_at is None or now - self._purged_at >= self.purge_interval):
+            self._purged_at = now
+            await asyncio.to_thread(self.backend.purge_older_than, self.retention)
+        cutoff = now - self.idle_timeout
+        # The OrderedDict is in last-used order, so idle sessions are at the front
+        while self._sessions:
+            session_id, conversation = next(iter(self._sessions.items()))
+            if conversation.last_used >= cutoff:
+                break
+            await self._evict(session_id)
+
+    async def _evict(self, session_id):
+        self._sessions.pop(session_id, None)
+        if self.backend.discard_on_evict:
+            await asyncio.to_thread(self.backend.delete, session_id)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from telemetry import get_logger
+
+DIAGNOSIS_CACHE_PATH = os.getenv("DIAGNOSIS_CACHE_PATH", "diagnosis_cache.db")
+DIAGNOSIS_CACHE_TTL = float(os.getenv("DIAGNOSIS_CACHE_TTL", str(7 * 24 * 3600)))
+DIAGNOSIS_CACHE_MAX_ENTRIES = int(os.getenv("DIAGNOSIS_CACHE_MAX_ENTRIES", "5000"))
+FINGERPRINT_TOP_FRAMES = int(os.getenv("FINGERPRINT_TOP_FRAMES", "5"))
+
+log = get_logger(__name__)
+
+_EXCEPTION_RE = re.compile(r"\b((?:[a-zA-Z_$][\w$]*\.)*[A-Z][\w$]*(?:Exception|Error|Throwable))\b")
+_FRAME_RE = re.compile(r"^\s*at\s+([\w$.<>/]+)\(([^)]*)\)", re.MULTILINE)
+
+# Volatile parts of a log line that differ between otherwise identical incidents
+_VOLATILE_PATTERNS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b[A-Z][a-z]{2} \d{1,2}, \d{4} \d{1,2}:\d{2}:\d{2}(?: [AP]M)?"), "<ts>"),
+    (re.compile(r"\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<ts>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|@[0-9a-fA-F]{6,}\b"), "<hex>"),
+    (re.compile(r"\[[^\]]*(?:thread|pool|worker)[^\]]*\]|\b(?:Thread|thread|tid|TID)[-=#:]?\s*\d+", re.IGNORECASE), "<thread>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE), "<uuid>"),
+    (re.compile(r"(?<![A-Za-z_$])\d+(?:\.\d+)?"), "<n>"),
+]
+
+
+def mask_volatile(text: str) -> str:
+    for pattern, replacement in _VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return " ".join(text.split())
+
+
+def fingerprint_log(raw_log: str, top_frames: int = FINGERPRINT_TOP_FRAMES) -> tuple[str, str | None]:
+    # Exception type + top frames identify a stack trace; anything else falls back to the masked line
+    exception = _EXCEPTION_RE.search(raw_log or "")
+    frames = _FRAME_RE.findall(raw_log or "")[:top_frames]
+    if exception:
+        signature = "|".join([exception.group(1)] + [f"{method}({location})" for method, location in frames])
+    else:
+        signature = mask_volatile(raw_log or "")
+    source_file = frames[0][1].split(":")[0] if frames else None
+    return hashlib.sha1(signature.encode("utf-8")).hexdigest(), source_file
+
+
+class DiagnosisCache:
+    def __init__(self, path=DIAGNOSIS_CACHE_PATH, ttl=DIAGNOSIS_CACHE_TTL, max_entries=DIAGNOSIS_CACHE_MAX_ENTRIES, blob_resolver=None, repo_resolver=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (file path, repo url) -> the file's current git blob sha in that repo, or None when unknown
+        self.blob_resolver = blob_resolver
+        # () -> the repo new diagnoses are checked against; stored with each one so later checks use the same repo
+        self.repo_resolver = repo_resolver
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS diagnoses ("
+            "fingerprint TEXT PRIMARY KEY, diagnostic TEXT NOT NULL, file_path TEXT, blob_sha TEXT, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL, repo_url TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(diagnoses)")}
+        if "repo_url" not in columns:
+            self._db.execute("ALTER TABLE diagnoses ADD COLUMN repo_url TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS diagnoses_last_access ON diagnoses (last_access)")
+        self._db.commit()
+
+    def _default_repo(self):
+        try:
+            return self.repo_resolver() if self.repo_resolver is not None else None
+        except Exception as e:
+            log.warning("Could not resolve default repo", extra={"error": str(e)})
+            return None
+
+    def _current_blob(self, file_path, repo_url):
+        if not file_path or not repo_url or self.blob_resolver is None:
+            return None
+        try:
+            return self.blob_resolver(file_path, repo_url)
+        except Exception as e:
+            log.warning("Could not resolve git blob", extra={"file_path": file_path, "repo_url": repo_url, "error": str(e)})
+            return None
+
+    def get(self, fingerprint):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT diagnostic, file_path, blob_sha, created_at, repo_url FROM diagnoses WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        diagnostic, file_path, blob_sha, created_at, repo_url = row
+        # Entries made before any repo was known adopt the current default along with its blob
+        repo_url = repo_url or self._default_repo()
+        current_blob = self._current_blob(file_path, repo_url)
+        expired = now - created_at > self.ttl
+        # A changed blob means the code the diagnosis talks about has been edited since
+        stale = blob_sha is not None and current_blob is not None and current_blob != blob_sha
+        with self._lock:
+            if expired or stale:
+                self._db.execute("DELETE FROM diagnoses WHERE fingerprint = ?", (fingerprint,))
+            else:
+                self._db.execute(
+                    "UPDATE diagnoses SET last_access = ?, blob_sha = COALESCE(blob_sha, ?), "
+                    "repo_url = COALESCE(repo_url, ?) WHERE fingerprint = ?",
+                    (now, current_blob, repo_url if current_blob is not None else None, fingerprint),
+                )
+            if expired or stale:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._db.commit()
+        return None if expired or stale else diagnostic
+
+    def put(self, fingerprint, diagnostic, file_path=None):
+        now = time.time()
+        repo_url = self._default_repo()
+        blob_sha = self._current_blob(file_path, repo_url)
+        if blob_sha is None:
+            repo_url = None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO diagnoses "
+                "(fingerprint, diagnostic, file_path, blob_sha, created_at, last_access, repo_url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, diagnostic, file_path, blob_sha, now, now, repo_url),
+            )
+            # LRU: drop the least recently read entries beyond the cap
+            self._db.execute(
+                "DELETE FROM diagnoses WHERE fingerprint IN ("
+                "SELECT fingerprint FROM diagnoses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def invalidate(self, fingerprint):
+        with self._lock:
+            self._db.execute("DELETE FROM diagnoses WHERE fingerprint = ?", (fingerprint,))
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM diagnoses").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,75 @@
+import os
+import re
+
+# Words in a function name that say nothing about which intent was meant
+_GENERIC_NAME_WORDS = {"search", "check", "get", "find", "for", "in"}
+
+# Messages that lean on earlier turns ("what about that one?") need the LLM to resolve them
+_CONTEXT_REFERENCE_RE = re.compile(
+    r"\b(it|its|that|this|those|them|same|again|there|previous|above|also|too)\b", re.IGNORECASE
+)
+
+# Application names look like "AppServer1"; extend with KNOWN_APPS=a,b,c for names without digits
+_APP_NAME_RE = re.compile(os.getenv("FAST_ROUTE_APP_PATTERN", r"\b[A-Z][A-Za-z]*\d+\b"))
+KNOWN_APPS = [a.strip() for a in os.getenv("KNOWN_APPS", "").split(",") if a.strip()]
+
+
+def _word_pattern(word):
+    stem = word[:-1] if word.endswith("s") else word
+    return re.compile(rf"\b{re.escape(stem)}s?\b", re.IGNORECASE)
+
+
+class FastRouter:
+    def __init__(self, functions, synonyms=None, known_apps=KNOWN_APPS):
+        # Everything is compiled once; classify() only runs precompiled regexes
+        synonyms = synonyms or {}
+        self._intents = []
+        for fn in functions:
+            words = [w for w in fn["name"].split("_") if w not in _GENERIC_NAME_WORDS]
+            self._intents.append((
+                fn["name"],
+                [_word_pattern(w) for w in words],
+                [re.compile(p, re.IGNORECASE) for p in synonyms.get(fn["name"], [])],
+            ))
+        self._known_apps = [
+            (app, re.compile(rf"\b{re.escape(app)}\b", re.IGNORECASE)) for app in known_apps
+        ]
+
+    def _find_apps(self, text):
+        # In order of appearance, so "AppServer1, AppServer2" keeps the user's order
+        found = [(m.start(), m.group(0)) for m in _APP_NAME_RE.finditer(text)]
+        for app, pattern in self._known_apps:
+            match = pattern.search(text)
+            if match:
+                found.append((match.start(), app))
+        apps = []
+        for _, app in sorted(found):
+            if app not in apps:
+                apps.append(app)
+        return apps
+
+    def _score(self, text):
+        scores = {}
+        for name, name_words, synonyms in self._intents:
+            if name_words and all(p.search(text) for p in name_words):
+                scores[name] = len(name_words)
+            elif any(p.search(text) for p in synonyms):
+                scores[name] = 1
+        return scores
+
+    def classify(self, text):
+        # Returns (function_name, args) only when the message is unambiguous; otherwise None
+        if not text or _CONTEXT_REFERENCE_RE.search(text):
+            return None
+        apps = self._find_apps(text)
+        if not apps:
+            return None
+        scores = self._score(text)
+        if not scores:
+            return None
+        ranked = sorted(scores.values(), reverse=True)
+        if len(ranked) > 1 and ranked[0] == ranked[1]:
+            return None
+        function_name = max(scores, key=scores.get)
+        # parse_time_range looks for known phrases anywhere in the text, so hand it the whole message
+        return function_name, {"application_name": ", ".join(apps), "time_range": text}
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import time
+import uuid
+from contextlib import asynccontextmanager
+from source_index import SourceIndex
+from telemetry import get_logger, span
+
+GIT_WORKSPACE_DIR = os.getenv("GIT_WORKSPACE_DIR", "workspace")
+# Partial clone: commits and trees up front, file contents only when a worktree checks them out
+GIT_FETCH_FILTER = os.getenv("GIT_FETCH_FILTER", "blob:none")
+# A mirror fetched this recently is considered up to date
+GIT_FETCH_INTERVAL = float(os.getenv("GIT_FETCH_INTERVAL", "30"))
+GIT_COMMAND_TIMEOUT = float(os.getenv("GIT_COMMAND_TIMEOUT", "300"))
+# Worktrees left behind by a crash are removed once they are this old
+GIT_WORKTREE_MAX_AGE = float(os.getenv("GIT_WORKTREE_MAX_AGE", "3600"))
+# Cached diagnoses are only checked against a mirror fetched at most this many seconds ago
+GIT_BLOB_MAX_AGE = float(os.getenv("GIT_BLOB_MAX_AGE", "300"))
+# Repo the diagnosis cache checks source files against; unset, the last repo a fix ran on (kept across restarts)
+GIT_DEFAULT_REPO_URL = os.getenv("GIT_DEFAULT_REPO_URL")
+
+log = get_logger(__name__)
+
+
+class GitError(Exception):
+    pass
+
+
+async def run_git(*args, cwd=None, timeout=GIT_COMMAND_TIMEOUT):
+    process = await asyncio.create_subprocess_exec(
+        "git", *args, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        # Timeout or cancellation: don't leave a git process holding the repo lock files
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    if process.returncode != 0:
+        raise GitError(f"git {' '.join(args)} failed: {stderr.decode(errors='replace').strip()}")
+    return stdout.decode(errors="replace").strip()
+
+
+def _slug(url):
+    name = re.sub(r"\.git$", "", url.rstrip("/").rsplit("/", 1)[-1]) or "repo"
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '-', name)}-{hashlib.sha1(url.encode()).hexdigest()[:10]}"
+
+
+class Worktree:
+    def __init__(self, mirror, path, branch):
+        self.mirror = mirror
+        self.path = path
+        self.branch = branch
+
+    async def git(self, *args, timeout=GIT_COMMAND_TIMEOUT):
+        return await run_git(*args, cwd=self.path, timeout=timeout)
+
+
+class RepoMirror:
+    def __init__(self, url, root):
+        self.url = url
+        slug = _slug(url)
+        self.path = os.path.join(root, "mirrors", f"{slug}.git")
+        self.worktree_root = os.path.join(root, "worktrees", slug)
+        # Class/method -> file and line ranges at the last checked-out commit, persisted next to the mirror
+        self.index = SourceIndex(os.path.join(root, "index", f"{slug}.db"))
+        self.default_branch = None
+        self.fetched_at = 0.0
+        # Fetches and worktree bookkeeping write to the mirror, so they are serialised per repo;
+        # work inside a worktree runs outside the lock, in parallel with other fixes
+        self._lock = asyncio.Lock()
+
+    @property
+    def base_ref(self):
+        return f"refs/remotes/origin/{self.default_branch}"
+
+    async def git(self, *args, timeout=GIT_COMMAND_TIMEOUT):
+        return await run_git(*args, cwd=self.path, timeout=timeout)
+
+    async def sync(self, max_age=GIT_FETCH_INTERVAL):
+        async with self._lock:
+            if not os.path.exists(self.path):
+                await self._clone()
+            elif time.monotonic() - self.fetched_at > max_age:
+                await self.git("fetch", "--prune", "origin")
+            else:
+                return
+            self.fetched_at = time.monotonic()
+            if self.default_branch is None:
+                head = await self.git("symbolic-ref", "--short", "HEAD")
+                self.default_branch = head.rsplit("/", 1)[-1]
+
+    async def _clone(self):
+        log.info("Creating mirror", extra={"url": self.url})
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial = [f"--filter={GIT_FETCH_FILTER}"] if GIT_FETCH_FILTER else []
+        tmp_path = f"{self.path}.tmp-{uuid.uuid4().hex[:8]}"
+        try:
+            await run_git("clone", "--bare", "--no-tags", *partial, self.url, tmp_path)
+            # Track the remote under refs/remotes so fix branches created here never collide with fetched ones
+            await run_git("config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*", cwd=tmp_path)
+            await run_git("fetch", "--prune", "origin", cwd=tmp_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        os.replace(tmp_path, self.path)
+
+    async def add_worktree(self, branch_prefix="auto-fix"):
+        branch = f"{branch_prefix}-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        path = os.path.join(self.worktree_root, branch.replace("/", "-"))
+        async with self._lock:
+            os.makedirs(self.worktree_root, exist_ok=True)
+            await self.git("worktree", "add", "--no-track", "-b", branch, os.path.abspath(path), self.base_ref)
+        return Worktree(self, path, branch)
+
+    async def remove_worktree(self, worktree):
+        async with self._lock:
+            try:
+                await self.git("worktree", "remove", "--force", os.path.abspath(worktree.path))
+            except GitError as e:
+                log.warning("Could not remove worktree", extra={"path": worktree.path, "error": str(e)})
+                shutil.rmtree(worktree.path, ignore_errors=True)
+                await self.git("worktree", "prune")
+            try:
+                # The branch lives on in the remote once pushed; the local copy is only scratch
+                await self.git("branch", "-D", worktree.branch)
+            except GitError:
+                pass
+
+    def _rev_parse(self, spec):
+        result = subprocess.run(["git", "rev-parse", "--verify", "-q", spec], cwd=self.path, capture_output=True, text=True)
+        return result.stdout.strip() or None
+
+    def _load_default_branch(self):
+        # After a restart the mirror is still on disk but hasn't been synced yet
+        if self.default_branch is None and os.path.exists(self.path):
+            result = subprocess.run(["git", "symbolic-ref", "--short", "HEAD"], cwd=self.path, capture_output=True, text=True)
+            self.default_branch = result.stdout.strip().rsplit("/", 1)[-1] or None
+        return self.default_branch
+
+    def blob_sha(self, file_path):
+        # Synchronous so it can back the diagnosis cache; trees are local even in a partial clone
+        if self._load_default_branch() is None:
+            return None
+        sha = self._rev_parse(f"{self.base_ref}:{file_path}")
+        if sha:
+            return sha
+        if self.index.commit is not None:
+            path = self.index.resolve_path(file_path)
+            return self._rev_parse(f"{self.base_ref}:{path}") if path else None
+        listing = subprocess.run(
+            ["git", "ls-tree", "-r", "--name-only", self.base_ref], cwd=self.path, capture_output=True, text=True
+        )
+        matches = [p for p in listing.stdout.splitlines() if p.endswith(f"/{file_path}")]
+        return self._rev_parse(f"{self.base_ref}:{matches[0]}") if matches else None
+
+
+class GitWorkspace:
+    def __init__(self, root=GIT_WORKSPACE_DIR, default_repo=GIT_DEFAULT_REPO_URL):
+        self.root = root
+        self._mirrors = {}
+        self._default_repo = default_repo
+        self._default_repo_pinned = default_repo is not None
+        self._default_repo_file = os.path.join(root, "default_repo")
+
+    def mirror(self, url):
+        mirror = self._mirrors.get(url)
+        if mirror is None:
+            mirror = self._mirrors[url] = RepoMirror(url, self.root)
+        return mirror
+
+    @property
+    def default_repo(self):
+        if self._default_repo is None and os.path.exists(self._default_repo_file):
+            with open(self._default_repo_file) as f:
+                self._default_repo = f.read().strip() or None
+        return self._default_repo
+
+    def _remember_repo(self, url):
+        if self._default_repo_pinned or url == self.default_repo:
+            return
+        self._default_repo = url
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._default_repo_file, "w") as f:
+            f.write(url)
+
+    @asynccontextmanager
+    async def worktree(self, url, branch_prefix="auto-fix"):
+        # A fresh checkout of the default branch on a unique branch, removed again when the block exits
+        mirror = self.mirror(url)
+        with span("git_sync"):
+            await mirror.sync()
+        self._remember_repo(url)
+        worktree = await mirror.add_worktree(branch_prefix)
+        try:
+            try:
+                # The checkout has just fetched every blob at HEAD, so indexing the changed files is all local
+                await mirror.index.update(worktree)
+            except Exception as e:
+                log.warning("Could not update source index", extra={"url": url, "error": str(e)})
+            yield worktree
+        finally:
+            await asyncio.shield(mirror.remove_worktree(worktree))
+
+    def blob_sha(self, file_path, url=None):
+        url = url or self.default_repo
+        return self.mirror(url).blob_sha(file_path) if url else None
+
+    async def refresh(self, max_age=GIT_BLOB_MAX_AGE):
+        # Otherwise mirrors are only fetched when a fix runs, and upstream edits would never make a cached diagnosis stale
+        urls = set(self._mirrors)
+        if self.default_repo:
+            urls.add(self.default_repo)
+        for url in sorted(urls):
+            mirror = self.mirror(url)
+            if not os.path.exists(mirror.path):
+                continue
+            try:
+                await mirror.sync(max_age)
+            except (GitError, asyncio.TimeoutError) as e:
+                log.warning("Could not refresh mirror", extra={"url": url, "error": str(e)})
+                # Back off for a max_age rather than retrying the fetch on every lookup
+                mirror.fetched_at = time.monotonic()
+
+    async def cleanup(self, max_age=GIT_WORKTREE_MAX_AGE):
+        # Removes worktrees a crashed process never got to clean up
+        mirrors_dir = os.path.join(self.root, "mirrors")
+        if not os.path.isdir(mirrors_dir):
+            return
+        cutoff = time.time() - max_age
+        worktrees_dir = os.path.join(self.root, "worktrees")
+        for name in os.listdir(mirrors_dir):
+            path = os.path.join(mirrors_dir, name)
+            if ".tmp-" in name:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            slug_dir = os.path.join(worktrees_dir, name[:-len(".git")])
+            if os.path.isdir(slug_dir):
+                for entry in os.listdir(slug_dir):
+                    entry_path = os.path.join(slug_dir, entry)
+                    if os.path.getmtime(entry_path) < cutoff:
+                        shutil.rmtree(entry_path, ignore_errors=True)
+            try:
+                await run_git("worktree", "prune", cwd=path)
+            except GitError as e:
+                log.warning("Could not prune worktrees", extra={"path": path, "error": str(e)})
+
+
+workspace = GitWorkspace()
@@ -1,22 +1,17 @@
+import asyncio
 import os
 import re
-import subprocess
-from git import Repo
 from dotenv import load_dotenv
 import json
-from openai import AzureOpenAI
+from llm_gateway import chat_completion
+from git_workspace import workspace
+from job_queue import job_queue
+from source_index import read_lines, replace_line
+from telemetry import get_logger, span
 # Load environment variables
 load_dotenv()
 
-# --- Bot state to hold the pending fix ---
-bot_state = {
-    "pending_fix": None
-}
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE")
-)
+log = get_logger(__name__)
 
 # --- Utility Functions ---
 
@@ -41,13 +36,8 @@ def parse_diagnostic_output(diagnostic_text: str) -> dict:
         "pr_type": data.get("pr_type", "hotfix")
     }
 
-def refine_fix_with_context(file_path, fix_text, line_number):
-    with open(file_path, "r") as f:
-        lines = f.readlines()
-
-    start = max(0, line_number - 11)
-    end = min(len(lines), line_number + 10)
-    code_context = "".join(lines[start:end])
+async def refine_fix_with_context(file_path, fix_text, line_number):
+    code_context = "".join(read_lines(file_path, line_number - 10, line_number + 10))
 
     refinement_prompt = f"""
 You previously suggested this fix for a bug:
@@ -68,78 +58,103 @@ Only give the code for the specific line that needs to be fixed, not the entire
 Also make sure that the code is syntactically correct and is not repeated in the file.
 """
 
-    response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-        messages=[{"role": "user", "content": refinement_prompt}],
-        temperature=0.2
-    )
+    response = await chat_completion([{"role": "user", "content": refinement_prompt}], temperature=0.2)
 
     fix = response.choices[0].message.content.strip()
     match = re.search(r"```(?:java)?\s*(.*?)```", fix, re.DOTALL)
     return match.group(1).strip() if match else fix
 
 # --- GitHub PR Logic ---
-WORKDIR = "workspace"
-CLONE_DIR = os.path.join(WORKDIR, "repo")
 GITHUB_USER = os.getenv("GITHUB_USER")
 
 
-def clone_repo(repo_url):
-    if os.path.exists(CLONE_DIR):
-        print("Repo already exists. Pulling latest changes...")
-        repo = Repo(CLONE_DIR)
-        repo.git.checkout("main")
-        repo.remotes.origin.pull()
-    else:
-        print("Cloning repo...")
-        Repo.clone_from(repo_url, CLONE_DIR)
+def get_file_blob_sha(file_path, repo_url=None):
+    # Current blob sha of a file on the default branch of repo_url (the workspace's default repo if not given);
+    # None when unknown
+    return workspace.blob_sha(file_path, repo_url)
 
-def apply_fix_and_push(file_path, fix_text, line_number, pr_type="hotfix"):
-    branch_name = f"{pr_type}/auto-fix-{os.path.basename(file_path).replace('.', '-')}"
-    repo = Repo(CLONE_DIR)
 
-    repo.git.checkout("-b", branch_name)
+def get_default_repo():
+    return workspace.default_repo
 
-    full_path = os.path.join(CLONE_DIR, file_path)
-    refined_fix = refine_fix_with_context(full_path, fix_text, line_number)
 
-    with open(full_path, "r") as f:
-        lines = f.readlines()
+async def refresh_repo_mirrors():
+    await workspace.refresh()
 
-    lines[line_number - 1] = refined_fix + "\n"
 
-    with open(full_path, "w") as f:
-        f.writelines(lines)
+def _repo_name(repo_url):
+    return os.path.basename(repo_url.rstrip("/")).replace(".git", "")
 
-    repo.git.add(file_path)
-    repo.git.commit(m=f"{pr_type}: Automated fix for {file_path} @ line {line_number}")
-    repo.git.push("--set-upstream", "origin", branch_name)
 
-    subprocess.run([
-        "gh", "pr", "create",
-        "--repo", f"{GITHUB_USER}/{os.path.basename(os.getenv('GITHUB_REPO')).replace('.git', '')}",
-        "--title", f"{pr_type.title()}: Auto Fix for {file_path}",
-        "--body", f"Fix applied via bot:\n\n```\n{refined_fix}\n```",
-        "--base", "main"
-    ])
+async def apply_fix_and_push(worktree, repo_url, file_path, fix_text, line_number, pr_type="hotfix", frame=None):
+    # The stack frame pins the exact file and line; failing that, the LLM's (often bare) file name is looked up
+    location = worktree.mirror.index.locate(file_path, line_number, frame)
+    if location is not None:
+        log.info("Resolved fix location", extra={"file_path": file_path, "frame": frame, **location})
+        file_path, line_number = location["path"], location["line"]
+    full_path = os.path.join(worktree.path, file_path)
+    refined_fix = await refine_fix_with_context(full_path, fix_text, line_number)
 
-def run_bot_pr_workflow(repo_url, file_path, fix_text, line_number, pr_type="hotfix"):
-    os.environ["GITHUB_REPO"] = repo_url
-    clone_repo(repo_url)
-    apply_fix_and_push(file_path, fix_text, line_number, pr_type)
+    replace_line(full_path, line_number, refined_fix)
+
+    await worktree.git("add", file_path)
+    await worktree.git("commit", "-m", f"{pr_type}: Automated fix for {file_path} @ line {line_number}")
+    await worktree.git("push", "--set-upstream", "origin", worktree.branch)
+
+    pushed = {
+        "branch": worktree.branch,
+        "base": worktree.mirror.default_branch,
+        "file_path": file_path,
+        "refined_fix": refined_fix,
+        "pr_type": pr_type,
+    }
+    # From here a retry only needs to open the pull request; redoing the fix would push a second branch
+    job_queue.checkpoint(pushed=pushed)
+    return await create_pull_request(repo_url, pushed)
+
+async def create_pull_request(repo_url, pushed):
+    process = await asyncio.create_subprocess_exec(
+        "gh", "pr", "create",
+        "--repo", f"{GITHUB_USER}/{_repo_name(repo_url)}",
+        "--title", f"{pushed['pr_type'].title()}: Auto Fix for {pushed['file_path']}",
+        "--body", f"Fix applied via bot:\n\n```\n{pushed['refined_fix']}\n```",
+        "--base", pushed["base"],
+        "--head", pushed["branch"],
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"gh pr create failed: {stderr.decode(errors='replace').strip()}")
+    # gh prints the URL of the new pull request
+    return {"branch": pushed["branch"], "pr_url": stdout.decode(errors="replace").strip()}
+
+async def run_bot_pr_workflow(repo_url, file_path, fix_text, line_number, pr_type="hotfix", frame=None, pushed=None):
+    # Each fix gets its own worktree and branch off a shared, incrementally fetched mirror of the repo
+    branch_prefix = f"{pr_type}/auto-fix-{os.path.basename(file_path).replace('.', '-')}"
+    with span("pr_workflow", repo=_repo_name(repo_url), file_path=file_path, resumed=pushed is not None):
+        if pushed is not None:
+            # An earlier attempt already pushed the fix branch; only the pull request is missing
+            return await create_pull_request(repo_url, pushed)
+        async with workspace.worktree(repo_url, branch_prefix) as worktree:
+            return await apply_fix_and_push(worktree, repo_url, file_path, fix_text, line_number, pr_type, frame)
+
+# Refinement, push and PR creation run on the job queue, off the request path
+job_queue.register("pr_fix", run_bot_pr_workflow)
 
 # --- Triggered when LLM gives a fix ---
 def handle_llm_diagnostic(diagnostic_text):
     parsed = parse_diagnostic_output(diagnostic_text)
-    bot_state["pending_fix"] = parsed
     return f"Suggested fix for `{parsed['file_path']}`:\n\n{parsed['fix_text']}", parsed
 
 # --- Triggered when user provides a GitHub repo to apply fix ---
-def maybe_apply_fix_from_user(user_input: str):
-    if "github.com" in user_input and bot_state.get("pending_fix"):
-        repo_url = extract_github_url(user_input)
-        fix = bot_state["pending_fix"]
-        run_bot_pr_workflow(repo_url, **fix)
-        bot_state["pending_fix"] = None
-        return "✅ Fix applied and pull request created."
-    return "Please provide a valid GitHub repo URL to apply the fix."
+async def maybe_apply_fix_from_user(user_input: str, pending_fix, session_id=None):
+    repo_url = extract_github_url(user_input)
+    if not repo_url or not pending_fix:
+        return None
+    # Jobs on the same repo are capped by the queue's per-key concurrency
+    job_id = await job_queue.submit("pr_fix", {"repo_url": repo_url, **pending_fix}, key=repo_url, session_id=session_id)
+    return {
+        "response": f"✅ Fix queued; the pull request will be created in the background. Track it at /jobs/{job_id}.",
+        "job_id": job_id,
+    }
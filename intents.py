@@ -0,0 +1,224 @@
+import json
+import os
+import re
+from functools import lru_cache
+from string import Formatter
+
+# Optional JSON file with extra intents, e.g.
+# [{"name": "top_error_sources", "description": "...", "template": "search ERROR {application_name}{time_filter} | top source",
+#   "expected_results": 50, "max_results": 500, "post_processor": "table", "synonyms": ["top sources"]},
+#  {"name": "error_counts", "description": "...", "template": "search ERROR app={application_name}{time_filter} | stats count by app",
+#   "multi_template": "search ERROR app IN ({application_names}){time_filter} | stats count by app", "post_processor": "table"}]
+INTENTS_CONFIG = os.getenv("INTENTS_CONFIG")
+SPL_PLAN_CACHE_SIZE = int(os.getenv("SPL_PLAN_CACHE_SIZE", "1024"))
+
+_TIME_FIELDS = {"earliest", "latest", "time_filter"}
+# Filled in by the fan-out renderer with the quoted, comma-separated application list
+_MULTI_FIELDS = {"application_names"}
+# Values come from the LLM or the user; anything that could end the quoted string or start a new command is refused
+_UNSAFE_VALUE_RE = re.compile(r'[|\[\]`"\\\r\n]')
+# A field placed outside quotes must also stay one term: no spaces (so no OR/AND/NOT), comparisons or grouping
+_UNQUOTED_UNSAFE_RE = re.compile(r"[\s=<>!(),']")
+
+_APPLICATION_PROPERTY = {
+    "type": "string",
+    "description": "The application name. For several applications, list every name separated by commas."
+}
+
+_TIME_RANGE_PROPERTY = {
+    "type": "string",
+    "description": "A time range like 'last 24 hours', 'past 7 days', 'today', etc."
+}
+
+
+def _safe_value(field, value, quoted=True):
+    value = str(value or "")
+    if _UNSAFE_VALUE_RE.search(value) or (not quoted and _UNQUOTED_UNSAFE_RE.search(value)):
+        raise ValueError(f"Unsupported characters in {field}: {value!r}")
+    return value
+
+
+def _unquoted_fields(template):
+    # Fields that sit outside a "..." string in the template
+    unquoted, inside = set(), False
+    for literal, field, _, _ in Formatter().parse(template):
+        if literal.replace('\\"', "").count('"') % 2:
+            inside = not inside
+        if field and not inside:
+            unquoted.add(field)
+    return unquoted
+
+
+class Intent:
+    def __init__(
+        self,
+        name,
+        description,
+        template,
+        parameters=None,
+        required=("application_name",),
+        expected_results=100,
+        max_results=None,
+        default_time_range="last hour",
+        post_processor="diagnose",
+        synonyms=(),
+        multi_template=None,
+        group_field="app",
+    ):
+        self.name = name
+        self.template = template
+        # Rough number of rows the intent usually gets back; drives the Splunk search mode (oneshot/export/job)
+        self.expected_results = expected_results
+        # Most rows fetched per application, however the search runs; clustering sees at most this many
+        self.max_results = max_results or expected_results
+        self.default_time_range = default_time_range
+        self.post_processor = post_processor
+        self.synonyms = list(synonyms)
+        # One search covering several applications, e.g. app IN ({application_names}); rows are split on group_field
+        self.multi_template = multi_template
+        self.group_field = group_field
+        self.schema = {
+            "name": name,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "application_name": dict(_APPLICATION_PROPERTY),
+                    "time_range": dict(_TIME_RANGE_PROPERTY),
+                    **(parameters or {}),
+                },
+                "required": list(required),
+            },
+        }
+        declared = _TIME_FIELDS | self.schema["parameters"]["properties"].keys()
+        self.fields = self._template_fields(template, declared)
+        self.multi_fields = (
+            self._template_fields(multi_template, (declared | _MULTI_FIELDS) - {"application_name"})
+            if multi_template else set()
+        )
+        self.unquoted_fields = _unquoted_fields(template) | (_unquoted_fields(multi_template) if multi_template else set())
+
+    def _template_fields(self, template, declared):
+        fields = {field for _, field, _, _ in Formatter().parse(template) if field}
+        unknown = fields - declared
+        if unknown:
+            raise ValueError(f"Intent {self.name!r} template uses undeclared fields: {', '.join(sorted(unknown))}")
+        return fields
+
+    @classmethod
+    def from_config(cls, entry):
+        return cls(**entry)
+
+    def render(self, args, earliest, latest, applications=None):
+        # With applications, renders multi_template for all of them in one search
+        template, fields = (self.multi_template, self.multi_fields) if applications else (self.template, self.fields)
+        values = {"earliest": earliest, "latest": latest, "time_filter": f' earliest="{earliest}" latest="{latest}"'}
+        for field in fields - _TIME_FIELDS - _MULTI_FIELDS:
+            values[field] = _safe_value(field, args.get(field), field not in self.unquoted_fields)
+        if applications:
+            values["application_names"] = ", ".join(
+                f'"{_safe_value("application_name", app)}"' for app in applications
+            )
+        return template.format(**values)
+
+
+class IntentRegistry:
+    def __init__(self, intents=(), plan_cache_size=SPL_PLAN_CACHE_SIZE):
+        self._intents = {}
+        # Rendered SPL per (intent, arguments, time window); repeated questions skip template rendering
+        self._plan = lru_cache(maxsize=plan_cache_size)(self._render)
+        for intent in intents:
+            self._intents[intent.name] = intent
+        self._build()
+
+    def register(self, intent):
+        self._intents[intent.name] = intent
+        self._build()
+
+    def load_config(self, path):
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries:
+            self._intents[entry["name"]] = Intent.from_config(entry)
+        self._build()
+
+    def _build(self):
+        # Everything the LLM calls need is built here once, not per request
+        self.functions = [intent.schema for intent in self._intents.values()]
+        self.tools = [{"type": "function", "function": fn} for fn in self.functions]
+        # In single-call mode the tool call also returns the self-contained rewrite of the user's message
+        self.single_call_tools = [
+            {
+                "type": "function",
+                "function": {
+                    **fn,
+                    "parameters": {
+                        **fn["parameters"],
+                        "properties": {
+                            **fn["parameters"]["properties"],
+                            "rephrased_query": {
+                                "type": "string",
+                                "description": "The user's request rewritten as a clear, fully self-contained instruction."
+                            }
+                        }
+                    }
+                }
+            }
+            for fn in self.functions
+        ]
+        self.synonyms = {intent.name: intent.synonyms for intent in self._intents.values() if intent.synonyms}
+        self._plan.cache_clear()
+
+    def get(self, name):
+        return self._intents.get(name)
+
+    def __contains__(self, name):
+        return name in self._intents
+
+    def __iter__(self):
+        return iter(self._intents.values())
+
+    def _render(self, name, args, earliest, latest, applications=None):
+        return self._intents[name].render(dict(args), earliest, latest, applications)
+
+    def render(self, name, args, earliest, latest, applications=None):
+        intent = self._intents.get(name)
+        if intent is None:
+            return None
+        fields = intent.multi_fields if applications else intent.fields
+        key = tuple(sorted((field, str(args.get(field) or "")) for field in fields - _TIME_FIELDS - _MULTI_FIELDS))
+        return self._plan(name, key, earliest, latest, tuple(applications) if applications else None)
+
+    def plan_stats(self):
+        info = self._plan.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+
+BUILTIN_INTENTS = [
+    Intent(
+        "check_status",
+        "Check the status of an application using Splunk logs.",
+        'search index=main sourcetype=test1 app="{application_name}" status!=200{time_filter}',
+        max_results=1000,
+        multi_template="search index=main sourcetype=test1 app IN ({application_names}) status!=200{time_filter}",
+        synonyms=[r"health\w*", r"\bup\b", r"\bdown\b", r"running", r"alive"],
+    ),
+    Intent(
+        "search_errors",
+        "Search for errors in a specific application's logs.",
+        'search source="app_dummy_logs.log" host="DESKTOP-517J9U9" sourcetype="test1" "ERROR {application_name}"{time_filter}',
+        max_results=10000,
+        synonyms=[r"failures?", r"failed", r"issues?", r"problems?"],
+    ),
+    Intent(
+        "search_null_pointer_exceptions",
+        "Search for null pointer exceptions in a specific application's logs.",
+        'search source="test_log.txt" host="DESKTOP-517J9U9" sourcetype="test4" "{application_name}" "NullPointerException" AND "at " {time_filter}',
+        max_results=200,
+        synonyms=[r"\bnpes?\b", r"nullpointer(?:exception)?s?"],
+    ),
+]
+
+intent_registry = IntentRegistry(BUILTIN_INTENTS)
+if INTENTS_CONFIG:
+    intent_registry.load_config(INTENTS_CONFIG)
@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from telemetry import get_logger
+
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")
+JOB_QUEUE_DB_PATH = os.getenv("JOB_QUEUE_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+# Jobs sharing a key (the repo URL for PR jobs) run at most this many at a time
+JOB_PER_KEY_CONCURRENCY = int(os.getenv("JOB_PER_KEY_CONCURRENCY", "1"))
+# The in-memory store forgets finished jobs this many seconds after they finish, or beyond this many
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(24 * 3600)))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "1000"))
+
+log = get_logger(__name__)
+
+# Id of the job whose handler is running in the current task, for JobQueue.checkpoint
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+_FIELDS = ("id", "kind", "payload", "key", "session_id", "status", "attempts", "result", "error", "created_at", "updated_at")
+
+
+class InMemoryJobStore:
+    def __init__(self, retention=JOB_RETENTION, max_finished=JOB_MAX_FINISHED):
+        self.retention = retention
+        self.max_finished = max_finished
+        self._jobs = {}
+
+    def _evict(self):
+        cutoff = time.time() - self.retention
+        finished = sorted(
+            (j for j in self._jobs.values() if j["status"] not in ("queued", "running")), key=lambda j: j["updated_at"]
+        )
+        excess = len(finished) - self.max_finished
+        for i, job in enumerate(finished):
+            if i < excess or job["updated_at"] < cutoff:
+                del self._jobs[job["id"]]
+
+    def insert(self, job):
+        self._evict()
+        self._jobs[job["id"]] = dict(job)
+
+    def update(self, job_id, **fields):
+        self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def unfinished(self):
+        return [dict(j) for j in self._jobs.values() if j["status"] in ("queued", "running")]
+
+
+class SQLiteJobStore:
+    # Durable queue: jobs that were queued or running when the process died are picked up again on start
+    def __init__(self, path=JOB_QUEUE_DB_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, key TEXT, session_id TEXT, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._db.commit()
+
+    def _row(self, row):
+        job = dict(zip(_FIELDS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def insert(self, job):
+        values = {**job, "payload": json.dumps(job["payload"]), "result": json.dumps(job["result"])}
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO jobs ({', '.join(_FIELDS)}) VALUES ({', '.join('?' for _ in _FIELDS)})",
+                [values[f] for f in _FIELDS],
+            )
+            self._db.commit()
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        if "payload" in fields:
+            fields["payload"] = json.dumps(fields["payload"])
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                [*fields.values(), job_id],
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+
+def make_job_store(name=JOB_QUEUE_BACKEND):
+    if name == "sqlite":
+        return SQLiteJobStore()
+    return InMemoryJobStore()
+
+
+class JobQueue:
+    def __init__(
+        self,
+        store=None,
+        workers=JOB_WORKERS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        retry_backoff=JOB_RETRY_BACKOFF,
+        per_key_concurrency=JOB_PER_KEY_CONCURRENCY,
+    ):
+        self.store = store or make_job_store()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.per_key_concurrency = per_key_concurrency
+        self._handlers = {}
+        self._queue = None
+        self._tasks = []
+        self._retries = set()
+        self._running = Counter()
+        # key -> job ids waiting because their key is at its concurrency cap; they don't hold a worker meanwhile
+        self._deferred = {}
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        for job in self.store.unfinished():
+            # A job that was running when the process stopped gets another go
+            self.store.update(job["id"], status="queued")
+            self._queue.put_nowait(job["id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+
+    async def submit(self, kind, payload, key=None, session_id=None):
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        await self.start()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self.store.insert({
+            "id": job_id, "kind": kind, "payload": payload, "key": key, "session_id": session_id,
+            "status": "queued", "attempts": 0, "result": None, "error": None, "created_at": now, "updated_at": now,
+        })
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def checkpoint(self, **fields):
+        # Merges fields into the running job's payload, so a retry gets them as arguments and can skip
+        # side effects that already happened; a no-op outside a job
+        job_id = _current_job.get()
+        job = self.store.get(job_id) if job_id is not None else None
+        if job is not None:
+            self.store.update(job_id, payload={**job["payload"], **fields})
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+            key = job["key"]
+            if key is not None and self._running[key] >= self.per_key_concurrency:
+                self._deferred.setdefault(key, deque()).append(job_id)
+                continue
+            self._running[key] += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running[key] -= 1
+                waiting = self._deferred.get(key)
+                if waiting:
+                    self._queue.put_nowait(waiting.popleft())
+                    if not waiting:
+                        del self._deferred[key]
+
+    async def _run(self, job):
+        attempts = job["attempts"] + 1
+        self.store.update(job["id"], status="running", attempts=attempts)
+        token = _current_job.set(job["id"])
+        try:
+            result = await self._handlers[job["kind"]](**job["payload"])
+        except asyncio.CancelledError:
+            self.store.update(job["id"], status="queued")
+            raise
+        except Exception as e:
+            log.error("Job attempt failed", extra={"job_id": job["id"], "kind": job["kind"], "attempt": attempts, "error": str(e)})
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                self.store.update(job["id"], status="failed", error=str(e))
+                return
+            self.retried += 1
+            self.store.update(job["id"], status="queued", error=str(e))
+            delay = random.uniform(0.5, 1.0) * self.retry_backoff * 2 ** (attempts - 1)
+            retry = asyncio.create_task(self._requeue(job["id"], delay))
+            self._retries.add(retry)
+            retry.add_done_callback(self._retries.discard)
+            return
+        finally:
+            _current_job.reset(token)
+        self.completed += 1
+        self.store.update(job["id"], status="succeeded", result=result, error=None)
+
+    async def _requeue(self, job_id, delay):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job_id)
+
+    def stats(self):
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(self._running.values()),
+            "deferred": sum(len(d) for d in self._deferred.values()),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import httpx
+from dotenv import load_dotenv
+from openai import APIConnectionError, APIStatusError, AsyncAzureOpenAI
+from telemetry import LLM_TOKENS, get_logger, record_llm_usage, span
+
+load_dotenv()
+
+log = get_logger(__name__)
+
+LLM_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+
+def _retry_after_seconds(headers):
+    # Azure sends retry-after-ms on 429s; plain Retry-After is in seconds
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name) if headers is not None else None
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            continue
+    return None
+
+
+def _is_retryable(error):
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        max_connections=LLM_MAX_CONNECTIONS,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        backoff_base=LLM_BACKOFF_BASE,
+        backoff_max=LLM_BACKOFF_MAX,
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = None
+        # Caps concurrent completions so a burst queues here instead of piling 429s onto Azure
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self.calls = 0
+        self.retries = 0
+        self.coalesced = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = AsyncAzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_API_BASE"),
+                # Retries are handled here so they also respect the concurrency limit
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def _backoff(self, attempt, error):
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        retry_after = _retry_after_seconds(headers)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter keeps retrying callers from hitting the endpoint in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _create_with_retries(self, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self.calls += 1
+                    with span("llm", operation="chat", attempt=attempt):
+                        response = await self.client.chat.completions.create(**kwargs)
+                    record_llm_usage(getattr(response, "usage", None))
+                    return response
+            except (APIStatusError, APIConnectionError) as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                self.retries += 1
+                log.warning("LLM call failed, retrying", extra={"error": e.__class__.__name__, "delay_s": round(delay, 2)})
+            await asyncio.sleep(delay)
+
+    async def stream_chat(self, messages, on_token, **kwargs):
+        # Streams content deltas to on_token as they arrive and returns the full text
+        kwargs.setdefault("model", LLM_DEPLOYMENT)
+        for attempt in range(self.max_retries + 1):
+            parts = []
+            try:
+                async with self._semaphore:
+                    self.calls += 1
+                    usage = None
+                    with span("llm", operation="stream", attempt=attempt):
+                        stream = await self.client.chat.completions.create(messages=messages, stream=True, **kwargs)
+                        async for chunk in stream:
+                            usage = getattr(chunk, "usage", None) or usage
+                            # Azure sends a leading chunk with no choices (content filter results)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                parts.append(delta)
+                                await on_token(delta)
+                    if usage is not None:
+                        record_llm_usage(usage)
+                    else:
+                        # Streams only report usage on API versions that support it; each delta is roughly one token
+                        LLM_TOKENS.inc(len(parts), kind="completion")
+                return "".join(parts)
+            except (APIStatusError, APIConnectionError) as e:
+                # Tokens already handed to the caller can't be taken back, so only retry before the first one
+                if parts or attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                self.retries += 1
+                log.warning("LLM stream failed, retrying", extra={"error": e.__class__.__name__, "delay_s": round(delay, 2)})
+            await asyncio.sleep(delay)
+
+    async def chat(self, messages, **kwargs):
+        kwargs.setdefault("model", LLM_DEPLOYMENT)
+        kwargs["messages"] = messages
+        key = hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+
+        # Identical prompts already in flight share one completion
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self._create_with_retries(**kwargs))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+gateway = LLMGateway()
+
+
+async def chat_completion(messages, **kwargs):
+    return await gateway.chat(messages, **kwargs)
+
+
+async def stream_chat_completion(messages, on_token, **kwargs):
+    return await gateway.stream_chat(messages, on_token, **kwargs)
+
+
+async def close_llm_gateway():
+    await gateway.close()
@@ -0,0 +1,713 @@
+import asyncio
+import codecs
+import fnmatch
+import glob
+import heapq
+import itertools
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+from splunk_helper import SearchJobRegistry, SplunkClient, SplunkJobNotFound, SplunkSearchFailed, SplunkSession
+from telemetry import get_logger
+from time_range import resolve_time_modifier
+
+log = get_logger(__name__)
+
+LOCAL_LOG_DIR = os.getenv("LOCAL_LOG_DIR", ".")
+LOCAL_LOG_PATTERNS = [p.strip() for p in os.getenv("LOCAL_LOG_PATTERNS", "*.log,*.txt").split(",") if p.strip()]
+# Metadata Splunk would attach at ingest, per file name, e.g. {"test_log.txt": {"host": "DESKTOP-517J9U9", "sourcetype": "test4"}}
+LOCAL_SOURCE_FIELDS = json.loads(os.getenv("LOCAL_SOURCE_FIELDS", "{}"))
+LOCAL_INDEX_CHUNK_BYTES = int(os.getenv("LOCAL_INDEX_CHUNK_BYTES", str(8 * 1024 * 1024)))
+# Bytes indexed per hold of the index lock; searches wait for at most one step of indexing
+LOCAL_INDEX_STEP_BYTES = int(os.getenv("LOCAL_INDEX_STEP_BYTES", str(4 * 1024 * 1024)))
+# Seconds between background passes picking up appended or rotated logs
+LOCAL_INDEX_REFRESH_INTERVAL = float(os.getenv("LOCAL_INDEX_REFRESH_INTERVAL", "5"))
+LOCAL_MAX_RESULTS = int(os.getenv("LOCAL_MAX_RESULTS", "50000"))
+LOCAL_JOB_TTL = float(os.getenv("LOCAL_JOB_TTL", "600"))
+LOCAL_MAX_JOBS = int(os.getenv("LOCAL_MAX_JOBS", "100"))
+
+_METADATA_FIELDS = ("source", "host", "sourcetype", "index")
+# Pure numbers aren't indexed (times are indexed separately); terms made of them are checked against the raw event
+_TOKEN_RE = re.compile(r"\d*[a-z_]\w*", re.ASCII)
+_TIME_CACHE_SIZE = 100000
+_MONTHS = {m: i for i, m in enumerate(("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)}
+
+# A line starting with a timestamp starts a new event; anything else continues the previous one (stack traces)
+_EVENT_START_RE = re.compile(
+    r"^(?:(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,6}))?"
+    r"|(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* (\d{1,2}),? (\d{4}) (\d{1,2}):(\d{2}):(\d{2})(?: ?([AP]M))?)",
+    re.MULTILINE,
+)
+
+_SPL_ITEM_RE = re.compile(
+    r'(?P<in_field>[A-Za-z_][\w.]*)\s+IN\s*\((?P<in_values>(?:[^)"]|"(?:[^"\\]|\\.)*")*)\)'
+    r'|(?P<field>[A-Za-z_][\w.]*)(?P<op>!=|=)(?P<value>"(?:[^"\\]|\\.)*"|[^\s"|]*)'
+    r'|"(?P<phrase>(?:[^"\\]|\\.)*)"'
+    r"|(?P<pipe>\|)"
+    r'|(?P<word>[^\s"|]+)'
+)
+
+
+class LocalSearchError(SplunkSearchFailed):
+    pass
+
+
+def detect_encoding(head: bytes) -> tuple[str, int]:
+    # Returns (codec, BOM length). Windows tools often write UTF-16 LE, like test_log.txt
+    for bom, codec in ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be")):
+        if head.startswith(bom):
+            return codec, len(bom)
+    sample = head[:4096]
+    if sample and sample.count(0) > len(sample) // 4:
+        # ASCII text in UTF-16 without a BOM has a NUL in every other byte
+        return ("utf-16-le" if sample[1::2].count(0) > sample[0::2].count(0) else "utf-16-be"), 0
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8", 0
+    except UnicodeDecodeError:
+        return "latin-1", 0
+
+
+def tokenize(text: str) -> set:
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+_minute_epochs = {}
+
+
+def _minute_epoch(year, month, day, hour, minute):
+    # Converting a local time to epoch is the slow part, and consecutive events share the minute
+    key = (year, month, day, hour, minute)
+    epoch = _minute_epochs.get(key)
+    if epoch is None:
+        if len(_minute_epochs) >= _TIME_CACHE_SIZE:
+            _minute_epochs.clear()
+        epoch = _minute_epochs[key] = datetime(year, month, day, hour, minute).timestamp()
+    return epoch
+
+
+def _event_time(match):
+    groups = match.groups()
+    try:
+        if groups[0]:
+            year, month, day, hour, minute, second = map(int, groups[:6])
+            fraction = float("0." + groups[6]) if groups[6] else 0.0
+        else:
+            month = _MONTHS[groups[7]]
+            day, year, hour, minute, second = map(int, groups[8:13])
+            if groups[13]:
+                hour = hour % 12 + (12 if groups[13] == "PM" else 0)
+            fraction = 0.0
+        if second > 60:
+            return None
+        return _minute_epoch(year, month, day, hour, minute) + second + fraction
+    except ValueError:
+        return None
+
+
+_IN_VALUE_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[^\s,"]+')
+# The commands supported locally after a pipe, enough for fan-out searches: "| stats count by app" and "| dedup 50 app"
+_STATS_RE = re.compile(r"^\s*stats\s+count(?:\s+as\s+(\w+))?\s+by\s+([\w.]+(?:\s*,\s*[\w.]+)*)\s*$", re.IGNORECASE)
+_DEDUP_RE = re.compile(r"^\s*dedup\s+(\d+)\s+([\w.]+)\s*$", re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def _field_pattern(name):
+    # Search-time key=value extraction, like Splunk's automatic KV extraction
+    return re.compile(rf'(?<![\w.]){re.escape(name)}=(?:"([^"]*)"|([^\s,;"]*))')
+
+
+def extract_field(raw, name):
+    return [quoted or bare for quoted, bare in _field_pattern(name).findall(raw)]
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _wildcard_regex(text):
+    return re.compile(".*?".join(re.escape(part) for part in text.split("*")), re.IGNORECASE)
+
+
+class SearchTerm:
+    def __init__(self, text, negate=False, phrase=False):
+        self.text = text
+        self.negate = negate
+        # Wildcard terms can't be looked up as whole tokens, so they are only checked against the raw event
+        self.tokens = set() if "*" in text else tokenize(text)
+        pattern = _wildcard_regex(text.strip()).pattern
+        if not phrase:
+            # A bare term matches whole tokens: "500" must not match "1500ms"
+            pattern = rf"(?<![0-9A-Za-z_]){pattern}(?![0-9A-Za-z_])"
+        self._pattern = re.compile(pattern, re.IGNORECASE)
+
+    def matches(self, raw):
+        return bool(self._pattern.search(raw))
+
+
+class FieldFilter:
+    def __init__(self, name, op, value, negate=False):
+        # value is a list for "field IN (a, b)", which matches any of them
+        values = value if isinstance(value, list) else [value]
+        self.name = name
+        self.negate = negate != (op == "!=")
+        # Splunk's "!=" only matches events that have the field, unlike NOT field=value
+        self.require_field = op == "!="
+        self.values = [v.lower() for v in values]
+        indexable = len(values) == 1 and not (negate or op == "!=" or "*" in values[0] or name in _METADATA_FIELDS)
+        self.tokens = tokenize(f"{name} {values[0]}") if indexable else set()
+
+    def _value_matches(self, value):
+        value = value.lower()
+        return any(fnmatch.fnmatchcase(value, pattern) for pattern in self.values)
+
+    def matches_metadata(self, values):
+        # Metadata nobody configured is unknown rather than different, so it doesn't rule the file out
+        if not values:
+            return True
+        return any(self._value_matches(v) for v in values) != self.negate
+
+    def matches(self, raw):
+        values = extract_field(raw, self.name)
+        if not values:
+            return not self.require_field and self.negate
+        return any(self._value_matches(v) for v in values) != self.negate
+
+
+class SearchQuery:
+    def __init__(self, terms, fields, earliest=None, latest=None, stats=None, dedup=None):
+        self.terms = terms
+        # (count field name, group-by fields) for a trailing "| stats count by ..."
+        self.stats = stats
+        # (events kept per value, field) for a trailing "| dedup N field"
+        self.dedup = dedup
+        self.fields = [f for f in fields if f.name not in _METADATA_FIELDS]
+        self.metadata = [f for f in fields if f.name in _METADATA_FIELDS]
+        self.earliest = earliest
+        self.latest = latest
+        self.tokens = set().union(*(t.tokens for t in terms if not t.negate), *(f.tokens for f in self.fields))
+
+    def time_bounds(self, now=None):
+        start = resolve_time_modifier(self.earliest, now).timestamp() if self.earliest else float("-inf")
+        end = resolve_time_modifier(self.latest, now).timestamp() if self.latest else float("inf")
+        return start, end
+
+    def matches_file(self, file_index):
+        return all(f.matches_metadata(file_index.metadata(f.name)) for f in self.metadata)
+
+    def matches(self, raw):
+        return all(t.matches(raw) != t.negate for t in self.terms) and all(f.matches(raw) for f in self.fields)
+
+
+def parse_spl(spl: str) -> SearchQuery:
+    # The subset generate_spl produces: terms, quoted phrases, AND/NOT, field=value, field!=value, field IN (...),
+    # earliest/latest, and optionally "| stats count by <fields>" or "| dedup N <field>"
+    terms, fields = [], []
+    earliest = latest = stats = dedup = None
+    negate = False
+    spl = spl.strip()
+    items = list(_SPL_ITEM_RE.finditer(spl))
+    if items and (items[0].group("word") or "").lower() == "search":
+        items = items[1:]
+    for item in items:
+        if item.group("pipe"):
+            command = spl[item.end():]
+            match = _STATS_RE.match(command)
+            if match:
+                stats = (match.group(1) or "count", [f.strip() for f in match.group(2).split(",")])
+                break
+            match = _DEDUP_RE.match(command)
+            if match:
+                dedup = (int(match.group(1)), match.group(2))
+                break
+            raise LocalSearchError(
+                "The local search backend only supports '| stats count by <fields>' or '| dedup N <field>' after a pipe."
+            )
+        if item.group("in_field"):
+            values = [_unquote(v) for v in _IN_VALUE_RE.findall(item.group("in_values"))]
+            fields.append(FieldFilter(item.group("in_field"), "=", values, negate))
+            negate = False
+            continue
+        word = item.group("word")
+        if word in ("AND", "NOT", "OR"):
+            if word == "OR":
+                raise LocalSearchError("The local search backend does not support OR.")
+            negate = negate or word == "NOT"
+            continue
+        if item.group("field"):
+            name, value = item.group("field"), _unquote(item.group("value"))
+            if name == "earliest":
+                earliest = value
+            elif name == "latest":
+                latest = value
+            else:
+                fields.append(FieldFilter(name, item.group("op"), value, negate))
+        else:
+            text = word if word is not None else re.sub(r"\\(.)", r"\1", item.group("phrase"))
+            if text.strip():
+                terms.append(SearchTerm(text, negate, phrase=word is None))
+        negate = False
+    return SearchQuery(terms, fields, earliest, latest, stats, dedup)
+
+
+class FileIndex:
+    def __init__(self, path, source_fields=None):
+        self.path = path
+        self.source = os.path.basename(path)
+        self.fields = {"source": self.source, **(source_fields or {})}
+        self._mm = None
+        self._reset()
+
+    def _reset(self):
+        self._close_map()
+        self.codec = None
+        self._bom = 0
+        self._unit = 1
+        self._newline = b"\n"
+        self._identity = None
+        self._head = b""
+        self.indexed_bytes = 0
+        # Event i lives at bytes offsets[i]:offsets[i]+lengths[i] and happened at times[i] (epoch seconds)
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.times = array("d")
+        self.postings = {}
+        # Log files are almost always in time order, which lets a time range become a bisect instead of a scan
+        self.ordered = True
+
+    def _close_map(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def close(self):
+        self._reset()
+
+    def metadata(self, name):
+        if name == "source":
+            return [self.source, self.path]
+        value = self.fields.get(name)
+        return [value] if value else []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def refresh(self, max_bytes=None):
+        # Indexes up to max_bytes of whatever was appended since the last call and returns the bytes still left;
+        # rotated or rewritten files start over
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return 0
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self._identity or stat.st_size < self.indexed_bytes:
+            self._reset()
+            self._identity = identity
+        if stat.st_size == self.indexed_bytes:
+            return 0
+
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(self._head)] != self._head:
+            self._reset()
+            self._identity = identity
+        self._close_map()
+        self._mm = mapped
+        if self.codec is None:
+            self.codec, self._bom = detect_encoding(mapped[:4096])
+            self._newline = "\n".encode(self.codec)
+            self._unit = len(self._newline)
+            self._head = mapped[:min(1024, len(mapped))]
+
+        start = self._retract_last_event() if self.offsets else self._bom
+        end = len(mapped)
+        if max_bytes and end - start > max_bytes:
+            # Stop at a line; the next step retracts the last event and picks it up again, like an append
+            end = self._last_newline(start, start + max_bytes) or end
+        self._index_range(start, end, stat.st_mtime)
+        self.indexed_bytes = end
+        return len(mapped) - end
+
+    def read(self, event_id):
+        offset = self.offsets[event_id]
+        return self._mm[offset:offset + self.lengths[event_id]].decode(self.codec, errors="replace").rstrip("\r\n")
+
+    def _retract_last_event(self):
+        # The last event may have been cut off mid stack trace; un-index it and read it again with the new bytes
+        event_id = len(self.offsets) - 1
+        for token in tokenize(self.read(event_id)):
+            posting = self.postings[token]
+            posting.pop()
+            if not posting:
+                del self.postings[token]
+        self.lengths.pop()
+        self.times.pop()
+        return self.offsets.pop()
+
+    def _last_newline(self, start, end):
+        while True:
+            i = self._mm.rfind(self._newline, start, end)
+            if i < 0:
+                return None
+            if (i - self._bom) % self._unit == 0:
+                return i + len(self._newline)
+            end = i + len(self._newline) - 1
+
+    def _index_range(self, start, end, mtime):
+        chunk_bytes = LOCAL_INDEX_CHUNK_BYTES
+        position = start
+        while position < end:
+            limit = min(end, position + chunk_bytes)
+            if limit < end:
+                limit = self._last_newline(position, limit) or limit
+            text = self._mm[position:limit].decode(self.codec, errors="replace")
+            resume = self._index_chunk(text, position, limit, limit >= end, mtime)
+            if resume == position:
+                # A single event bigger than the chunk: read a bigger chunk instead of splitting it
+                chunk_bytes *= 2
+                continue
+            position = resume
+            chunk_bytes = LOCAL_INDEX_CHUNK_BYTES
+
+    def _index_chunk(self, text, chunk_start, chunk_end, final, mtime):
+        starts = list(_EVENT_START_RE.finditer(text))
+        # Every chunk begins at an event start, so text before the first timestamp only happens at the top of a
+        # file with a preamble; each of those lines becomes an event of its own
+        first = starts[0].start() if starts else len(text)
+        bounds = []
+        line_start = 0
+        for line in text[:first].splitlines(keepends=True):
+            bounds.append((line_start, None))
+            line_start += len(line)
+        bounds.extend((m.start(), _event_time(m)) for m in starts)
+
+        pending = None
+        if not final and starts:
+            # The last event may continue in the next chunk; it is indexed when that chunk is read
+            pending = bounds.pop()
+        ends = [b[0] for b in bounds[1:]] + [pending[0] if pending else len(text)]
+        byte_of = self._byte_offsets(text, chunk_start, chunk_end, [b[0] for b in bounds] + ends[-1:])
+
+        lowered = text.lower()
+        findall = _TOKEN_RE.findall
+        postings = self.postings
+        event_id = len(self.offsets)
+        previous = self.times[-1] if self.times else mtime
+        for (char_start, moment), char_end in zip(bounds, ends):
+            tokens = set(findall(lowered, char_start, char_end))
+            if not tokens and not text[char_start:char_end].strip():
+                continue
+            if moment is None:
+                moment = previous
+            elif moment < previous and self.times:
+                self.ordered = False
+            previous = moment
+            self.offsets.append(byte_of[char_start])
+            self.lengths.append(byte_of[char_end] - byte_of[char_start])
+            self.times.append(moment)
+            for token in tokens:
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = array("I")
+                posting.append(event_id)
+            event_id += 1
+        return byte_of[pending[0]] if pending else chunk_end
+
+    def _byte_offsets(self, text, chunk_start, chunk_end, char_offsets):
+        if chunk_end - chunk_start == len(text) * self._unit:
+            # Fixed-width text (ASCII, or UTF-16 without surrogate pairs): no need to re-encode
+            return {c: chunk_start + c * self._unit for c in char_offsets}
+        byte_of = {}
+        previous, position = 0, chunk_start
+        for c in sorted(set(char_offsets)):
+            position += len(text[previous:c].encode(self.codec, errors="replace"))
+            byte_of[c] = position
+            previous = c
+        return byte_of
+
+    def _candidates(self, tokens):
+        postings = []
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                return []
+            postings.append(posting)
+        if not postings:
+            return None
+        postings.sort(key=len)
+        ids = postings[0]
+        for posting in postings[1:]:
+            if len(ids) * 16 < len(posting):
+                # Few survivors against a long posting list: binary search beats building a set
+                ids = [i for i in ids if (j := bisect_left(posting, i)) < len(posting) and posting[j] == i]
+            else:
+                members = set(posting)
+                ids = [i for i in ids if i in members]
+            if not ids:
+                break
+        return ids
+
+    def search(self, query, start, end):
+        # Yields (time, event_id, raw, self) newest first for events matching the query
+        if not self.offsets or not query.matches_file(self):
+            return
+        candidates = self._candidates(query.tokens)
+        if self.ordered:
+            low, high = bisect_left(self.times, start), bisect_left(self.times, end)
+            if candidates is None:
+                ordered_ids = range(high - 1, low - 1, -1)
+            else:
+                ordered_ids = (i for i in reversed(candidates) if low <= i < high)
+        else:
+            ids = range(len(self.offsets)) if candidates is None else candidates
+            ordered_ids = sorted(
+                (i for i in ids if start <= self.times[i] < end), key=lambda i: (self.times[i], i), reverse=True
+            )
+        for event_id in ordered_ids:
+            raw = self.read(event_id)
+            if query.matches(raw):
+                yield self.times[event_id], event_id, raw, self
+
+
+class LocalLogIndex:
+    def __init__(
+        self,
+        directory=LOCAL_LOG_DIR,
+        patterns=LOCAL_LOG_PATTERNS,
+        source_fields=LOCAL_SOURCE_FIELDS,
+        step_bytes=LOCAL_INDEX_STEP_BYTES,
+        refresh_interval=LOCAL_INDEX_REFRESH_INTERVAL,
+    ):
+        self.directory = directory
+        self.patterns = patterns
+        self.source_fields = source_fields
+        self.step_bytes = step_bytes
+        self.refresh_interval = refresh_interval
+        self._files = {}
+        # Refreshes remap files, so searches and refresh steps never overlap
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        # Set once the background thread has caught up with the logs for the first time
+        self._warm = threading.Event()
+
+    def _paths(self):
+        paths = set()
+        for pattern in self.patterns:
+            paths.update(p for p in glob.glob(os.path.join(self.directory, pattern)) if os.path.isfile(p))
+        return paths
+
+    def _refresh_step(self):
+        # Caller holds the lock; returns the bytes still left to index
+        paths = self._paths()
+        for path in self._files.keys() - paths:
+            self._files.pop(path).close()
+        pending = 0
+        for path in sorted(paths):
+            if path not in self._files:
+                self._files[path] = FileIndex(path, self.source_fields.get(os.path.basename(path)))
+            pending += self._files[path].refresh(self.step_bytes)
+        return pending
+
+    def refresh(self):
+        # Indexes everything pending, letting go of the lock between steps so searches run in between
+        while not self._stopping.is_set():
+            with self._lock:
+                if not self._refresh_step():
+                    return
+
+    def start(self):
+        # Builds the index in the background, then keeps it current, so no query pays for a multi-GB build
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="local-log-index", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+                self._warm.set()
+            except Exception as e:
+                log.error("Local log indexing failed", extra={"directory": self.directory, "error": str(e)})
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def search(self, spl, max_results=LOCAL_MAX_RESULTS, fields=None, now=None):
+        query = parse_spl(spl)
+        start, end = query.time_bounds(now)
+        if self._thread is None:
+            # Nobody indexes in the background (scripts, tests): catch up here
+            self.refresh()
+        with self._lock:
+            # Once warm, pick up a small append inline so fresh events show; anything bigger is left to the background thread.
+            # While the first build runs, answer from what is indexed so far rather than waiting
+            if self._warm.is_set() and self._refresh_step():
+                self._wake.set()
+            streams = [file_index.search(query, start, end) for file_index in self._files.values()]
+            merged = heapq.merge(*streams, key=lambda hit: (hit[0], hit[1]), reverse=True)
+            if query.stats:
+                return [_project(row, fields) for row in self._stats(query.stats, merged)[:max_results]]
+            if query.dedup:
+                merged = self._dedup(query.dedup, merged)
+            hits = list(itertools.islice(merged, max_results))
+        return [_project(self._row(*hit), fields) for hit in hits]
+
+    def _dedup(self, dedup, hits):
+        # Newest first in, so the first N events per value are the N most recent; events without the field are dropped
+        keep, name = dedup
+        seen = Counter()
+        for hit in hits:
+            values = _field_values(name, hit[2], hit[3])
+            if values and seen[values[0]] < keep:
+                seen[values[0]] += 1
+                yield hit
+
+    def _stats(self, stats, hits):
+        count_name, by_fields = stats
+        counts = Counter()
+        for _, _, raw, file_index in hits:
+            key = []
+            for name in by_fields:
+                values = _field_values(name, raw, file_index)
+                if not values:
+                    # Like Splunk, events missing a group-by field are left out
+                    break
+                key.append(values[0])
+            else:
+                counts[tuple(key)] += 1
+        # Splunk sorts stats output by the group-by values and returns numbers as strings
+        return [{**dict(zip(by_fields, key)), count_name: str(n)} for key, n in sorted(counts.items())]
+
+    def _row(self, moment, event_id, raw, file_index):
+        row = {"_raw": raw, "_time": datetime.fromtimestamp(moment).astimezone().isoformat(timespec="milliseconds")}
+        row.update(file_index.fields)
+        return row
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "events": sum(len(f) for f in self._files.values()),
+                "tokens": sum(len(f.postings) for f in self._files.values()),
+                "indexed_bytes": sum(f.indexed_bytes for f in self._files.values()),
+                "warm": self._warm.is_set(),
+            }
+
+    def close(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._warm.clear()
+        self._stopping.clear()
+        with self._lock:
+            for file_index in self._files.values():
+                file_index.close()
+            self._files.clear()
+
+
+def _field_values(name, raw, file_index):
+    return file_index.metadata(name) if name in _METADATA_FIELDS else extract_field(raw, name)
+
+
+def _project(row, fields):
+    if not fields:
+        return row
+    projected = {}
+    for name in fields:
+        if name in row:
+            projected[name] = row[name]
+        elif "_raw" in row:
+            # Fields Splunk would extract at search time (app=..., status=...)
+            values = extract_field(row["_raw"], name)
+            if values:
+                projected[name] = values[0] if len(values) == 1 else values
+    return projected
+
+
+class LocalSearchClient(SplunkClient):
+    # Same interface as SplunkClient, answered from log files on disk; used for dev and CI without Splunk
+    def __init__(self, index=None, job_ttl=LOCAL_JOB_TTL, max_jobs=LOCAL_MAX_JOBS):
+        self.base_url = "local"
+        self.index = index or LocalLogIndex()
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        # sid -> (expiry, result rows) of a finished local "job", oldest first; rows go once the job's ttl has passed
+        self._results = OrderedDict()
+        self.session = SplunkSession(self)
+        self.jobs = SearchJobRegistry(self)
+
+    async def start(self):
+        self.index.start()
+
+    async def close(self):
+        self._results.clear()
+        # Joining the indexing thread can wait out one indexing step
+        await asyncio.to_thread(self.index.close)
+
+    def _rows(self, sid):
+        now = time.monotonic()
+        while self._results and next(iter(self._results.values()))[0] <= now:
+            self._results.popitem(last=False)
+        if sid not in self._results:
+            raise SplunkJobNotFound(f"Local job {sid} no longer exists.")
+        return self._results[sid][1]
+
+    async def login(self, timeout=None):
+        return "local"
+
+    async def _search(self, search_query, max_results=None, fields=None):
+        # Indexing and matching are CPU-bound, so keep them off the event loop
+        return await asyncio.to_thread(self.index.search, search_query, max_results or LOCAL_MAX_RESULTS, fields)
+
+    async def submit_search(self, search_query, timeout=None):
+        rows = await self._search(search_query)
+        sid = f"local_{uuid.uuid4().hex[:16]}"
+        self._results[sid] = (time.monotonic() + self.job_ttl, rows)
+        while len(self._results) > self.max_jobs:
+            self._results.popitem(last=False)
+        return sid
+
+    async def submit_blocking(self, search_query, timeout=None):
+        return await self.submit_search(search_query)
+
+    async def get_job_status(self, sid, timeout=None):
+        rows = self._rows(sid)
+        return {
+            "dispatchState": "DONE",
+            "isDone": True,
+            "isFailed": False,
+            "doneProgress": 1.0,
+            "resultCount": len(rows),
+            "ttl": self.job_ttl,
+        }
+
+    async def cancel_job(self, sid, timeout=None):
+        return self._results.pop(sid, None) is not None
+
+    async def iter_results(self, sid, max_results=None, fields=None, first_page=None, page_size=None, timeout=None):
+        for row in self._rows(sid)[:max_results]:
+            yield _project(row, fields)
+
+    async def oneshot(self, search_query, max_results=LOCAL_MAX_RESULTS, fields=None, timeout=None):
+        return {"results": await self._search(search_query, max_results, fields)}
+
+    async def export(self, search_query, max_results=LOCAL_MAX_RESULTS, fields=None, timeout=None):
+        for row in await self._search(search_query, max_results, fields):
+            yield row
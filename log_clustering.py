@@ -0,0 +1,99 @@
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+
+CLUSTER_CHUNK_SIZE = int(os.getenv("CLUSTER_CHUNK_SIZE", "5000"))
+CLUSTER_MAX_ROWS = int(os.getenv("CLUSTER_MAX_ROWS", "50000"))
+CLUSTER_RECENCY_HALF_LIFE = float(os.getenv("CLUSTER_RECENCY_HALF_LIFE", "3600"))
+
+# Rows are masked as one joined block per chunk; the separator must survive every mask below
+_SEPARATOR = "\x1e"
+
+# Drain-style masking of the variable parts of a log event, applied in order. Dates and times need no
+# pattern of their own: once digit runs are masked every timestamp in a given format looks the same.
+# Patterns that start with a literal are found by a fast scan, so they are preferred where possible.
+_MASKS = [
+    (re.compile(r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* (?=\d)"), "<mon> "),
+    (re.compile(r"[0-9a-fA-F]{8}(?:-?[0-9a-fA-F]{4}){3}-?[0-9a-fA-F]{12}"), "<id>"),
+    (re.compile(r"0x[0-9a-fA-F]+"), "<hex>"),
+    (re.compile(r"@[0-9a-fA-F]{6,}"), "@<hex>"),
+    (re.compile(r"(?<![A-Za-z_$])\d+"), "<n>"),
+    (re.compile(r"  +"), " "),
+]
+_WHITESPACE_TO_SPACE = str.maketrans("\t\r\n", "   ")
+
+
+def mask_block(events: list) -> list:
+    # One C-level pass per mask over the whole chunk instead of a Python loop per line
+    block = _SEPARATOR.join(events).translate(_WHITESPACE_TO_SPACE)
+    for pattern, replacement in _MASKS:
+        block = pattern.sub(replacement, block)
+    return block.split(_SEPARATOR)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            return datetime.fromtimestamp(float(value), tz=timezone.utc)
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class LogClusterer:
+    def __init__(self):
+        self.counts = Counter()
+        # template -> (_time, _raw) of its newest row; Splunk returns rows newest first
+        self.newest = {}
+        self.rows = 0
+
+    def add_chunk(self, rows):
+        raws = [(row.get("_raw") or "").replace(_SEPARATOR, " ") for row in rows]
+        templates = mask_block(raws)
+        self.counts.update(templates)
+        times = [row.get("_time") for row in rows]
+        # dict(zip(...)) keeps the last pair per key, so feed it reversed to keep the first (newest)
+        first_seen = dict(zip(reversed(templates), zip(reversed(times), reversed(raws))))
+        for template in first_seen.keys() - self.newest.keys():
+            self.newest[template] = first_seen[template]
+        self.rows += len(rows)
+
+    def ranked(self, half_life=CLUSTER_RECENCY_HALF_LIFE):
+        latest_times = {t: _parse_time(latest) for t, (latest, _) in self.newest.items()}
+        # Age is measured from the newest row in the result set, so old searches still rank sensibly
+        known = [t for t in latest_times.values() if t is not None]
+        reference = max(known) if known else None
+        clusters = []
+        for template, count in self.counts.items():
+            latest, sample = self.newest[template]
+            parsed = latest_times[template]
+            age = (reference - parsed).total_seconds() if parsed and reference else 0.0
+            # Frequent clusters win, but an old burst decays below a fresh, smaller one
+            score = count * 0.5 ** (age / half_life) if half_life else count
+            clusters.append({"template": template, "count": count, "latest": latest, "sample": sample, "score": score})
+        clusters.sort(key=lambda c: (c["score"], c["count"]), reverse=True)
+        return clusters
+
+
+async def cluster_rows(rows, chunk_size=CLUSTER_CHUNK_SIZE, max_rows=CLUSTER_MAX_ROWS):
+    # Consumes an async row iterator chunk by chunk, so memory is bounded by the chunk, not the search
+    clusterer = LogClusterer()
+    chunk = []
+    try:
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                clusterer.add_chunk(chunk)
+                chunk = []
+            if max_rows and clusterer.rows + len(chunk) >= max_rows:
+                break
+    finally:
+        await rows.aclose()
+    if chunk:
+        clusterer.add_chunk(chunk)
+    return clusterer.ranked()
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+from splunk_helper import get_splunk_client
+from telemetry import get_logger, metrics, record_cache, span
+from time_range import canonical_modifier
+
+# Queries refreshed in the background so interactive requests find a precomputed result.
+# Hot (intent, application, window) tuples are learned from traffic; PREFETCH_TARGETS pins more:
+# [{"intent": "check_status", "application": "TestApp", "time_range": "last hour"}]
+PREFETCH_TARGETS = json.loads(os.getenv("PREFETCH_TARGETS", "[]"))
+# Only these intents are learned from traffic; others only run when pinned
+PREFETCH_INTENTS = [i.strip() for i in os.getenv("PREFETCH_INTENTS", "check_status,search_errors").split(",") if i.strip()]
+# How many learned tuples are kept warm, and the decayed ask count it takes to count as hot
+# (1.5 = asked twice within one half-life)
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "24"))
+PREFETCH_MIN_HITS = float(os.getenv("PREFETCH_MIN_HITS", "1.5"))
+# Traffic counts halve every this many seconds, so yesterday's incident stops being "hot"
+PREFETCH_HALF_LIFE = float(os.getenv("PREFETCH_HALF_LIFE", "3600"))
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "120"))
+# Refresh times are spread by up to this fraction of the interval so tuples don't all fire together
+PREFETCH_JITTER = float(os.getenv("PREFETCH_JITTER", "0.2"))
+# Concurrent background searches; 0 turns prefetching off
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "2"))
+# Prefetched results older than this are not served
+PREFETCH_MAX_AGE = float(os.getenv("PREFETCH_MAX_AGE", "300"))
+# Load signals: a refresh slower than this, or this many interactive searches in flight
+PREFETCH_SLOW_SECONDS = float(os.getenv("PREFETCH_SLOW_SECONDS", "30"))
+PREFETCH_YIELD_INFLIGHT = int(os.getenv("PREFETCH_YIELD_INFLIGHT", "8"))
+# The interval stretches up to this many times while Splunk is struggling
+PREFETCH_MAX_BACKOFF = float(os.getenv("PREFETCH_MAX_BACKOFF", "16"))
+PREFETCH_TICK = float(os.getenv("PREFETCH_TICK", "1"))
+
+log = get_logger(__name__)
+
+PREFETCH_REFRESHES = metrics.counter(
+    "prefetch_refreshes_total", "Background prefetch refreshes by outcome (ok/error/slow).", ["outcome"]
+)
+
+
+def _window(earliest, latest):
+    try:
+        return canonical_modifier(earliest), canonical_modifier(latest)
+    except ValueError:
+        return earliest, latest
+
+
+def prefetch_key(intent, application, earliest, latest):
+    return (intent, (application or "").lower(), *_window(earliest, latest))
+
+
+def _describe(target):
+    return {k: target[k] for k in ("intent", "application", "earliest", "latest")}
+
+
+class Prefetcher:
+    def __init__(
+        self,
+        targets=PREFETCH_TARGETS,
+        intents=PREFETCH_INTENTS,
+        top_n=PREFETCH_TOP_N,
+        min_hits=PREFETCH_MIN_HITS,
+        half_life=PREFETCH_HALF_LIFE,
+        interval=PREFETCH_INTERVAL,
+        jitter=PREFETCH_JITTER,
+        max_concurrency=PREFETCH_MAX_CONCURRENCY,
+        max_age=PREFETCH_MAX_AGE,
+        slow_seconds=PREFETCH_SLOW_SECONDS,
+        yield_inflight=PREFETCH_YIELD_INFLIGHT,
+        max_backoff=PREFETCH_MAX_BACKOFF,
+        tick=PREFETCH_TICK,
+    ):
+        self.targets = targets
+        self.intents = set(intents)
+        self.top_n = top_n
+        self.min_hits = min_hits
+        self.half_life = half_life
+        self.interval = interval
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.max_age = max_age
+        self.slow_seconds = slow_seconds
+        self.yield_inflight = yield_inflight
+        self.max_backoff = max_backoff
+        self.tick = tick
+        # Set by chatbot: async (intent, application, earliest, latest) -> result, bypassing every cache
+        self._refresh = None
+        self._window_parser = None
+        # key -> (decayed ask count, last update, application as it was asked for) for learned tuples
+        self._traffic = {}
+        # key -> {"intent", "application", "earliest", "latest", "next_at"}
+        self._schedule = {}
+        # key -> {"result", "as_of", "refreshed_at"}
+        self._results = {}
+        self._running = {}
+        self._task = None
+        # Multiplies the interval and divides the concurrency while Splunk shows signs of load
+        self.backoff = 1.0
+        self.refreshed = 0
+        self.failed = 0
+        self.yielded = 0
+
+    def register(self, refresh, window_parser):
+        # window_parser turns a human time range into (earliest, latest), for the pinned targets
+        self._refresh = refresh
+        self._window_parser = window_parser
+
+    @property
+    def enabled(self):
+        return self.max_concurrency > 0 and self._refresh is not None
+
+    def _decayed(self, key, now):
+        count, updated, _ = self._traffic.get(key, (0.0, now, None))
+        return count * 0.5 ** ((now - updated) / self.half_life) if self.half_life > 0 else count
+
+    def record(self, intent, application, earliest, latest):
+        # Only rolling windows are worth refreshing; a fixed window's answer doesn't change
+        if not self.enabled or not application or intent not in self.intents or _window(earliest, latest)[1] != "now":
+            return
+        now = time.monotonic()
+        key = prefetch_key(intent, application, earliest, latest)
+        self._traffic[key] = (self._decayed(key, now) + 1.0, now, application)
+        if len(self._traffic) > max(self.top_n * 10, 100):
+            self._traffic = {k: v for k, v in self._traffic.items() if self._decayed(k, now) >= 0.1}
+
+    def get(self, intent, application, earliest, latest):
+        # The prefetched result with its freshness, or None when there is none young enough
+        if not self.enabled or not application:
+            return None
+        entry = self._results.get(prefetch_key(intent, application, earliest, latest))
+        age = time.monotonic() - entry["refreshed_at"] if entry is not None else None
+        record_cache("prefetch", age is not None and age <= self.max_age)
+        if age is None or age > self.max_age:
+            return None
+        return {**entry["result"], "freshness": {"as_of": entry["as_of"], "age_seconds": round(age, 1), "source": "prefetch"}}
+
+    def _hot(self, now):
+        hot = {}
+        for target in self.targets:
+            earliest, latest = self._window_parser(target.get("time_range"))
+            key = prefetch_key(target["intent"], target["application"], earliest, latest)
+            hot[key] = {"intent": target["intent"], "application": target["application"], "earliest": earliest, "latest": latest}
+        scores = sorted(((self._decayed(k, now), k) for k in self._traffic), reverse=True)
+        for score, key in scores[:self.top_n]:
+            if score >= self.min_hits and key not in hot:
+                intent, _, earliest, latest = key
+                application = self._traffic[key][2]
+                hot[key] = {"intent": intent, "application": application, "earliest": earliest, "latest": latest}
+        return hot
+
+    def _next_at(self, now):
+        spread = 1 + random.uniform(-self.jitter, self.jitter)
+        return now + self.interval * self.backoff * spread
+
+    def _sync_schedule(self, now):
+        hot = self._hot(now)
+        for key in list(self._schedule):
+            if key not in hot:
+                # Cooled off: stop refreshing it and let its result go
+                del self._schedule[key]
+                self._results.pop(key, None)
+        for key, target in hot.items():
+            if key not in self._schedule:
+                # First refresh lands somewhere in the first jitter window, not all at once
+                self._schedule[key] = {**target, "next_at": now + random.uniform(0, self.interval * self.jitter)}
+
+    def _limit(self):
+        return max(1, int(self.max_concurrency / self.backoff))
+
+    def _interactive_inflight(self):
+        return get_splunk_client().jobs.stats()["inflight"] - len(self._running)
+
+    def _loaded(self):
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def _healthy(self):
+        self.backoff = max(1.0, self.backoff / 2)
+
+    async def _refresh_one(self, key, target):
+        started = time.monotonic()
+        try:
+            with span("prefetch", intent=target["intent"], application=target["application"]):
+                result = await self._refresh(target["intent"], target["application"], target["earliest"], target["latest"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            PREFETCH_REFRESHES.inc(outcome="error")
+            self._loaded()
+            log.warning("Prefetch refresh failed", extra={**_describe(target), "error": str(e), "backoff": self.backoff})
+            return
+        finally:
+            self._running.pop(key, None)
+            if key in self._schedule:
+                self._schedule[key]["next_at"] = self._next_at(time.monotonic())
+        elapsed = time.monotonic() - started
+        self.refreshed += 1
+        if key in self._schedule:
+            self._results[key] = {
+                "result": result,
+                "as_of": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "refreshed_at": time.monotonic(),
+            }
+        if elapsed > self.slow_seconds:
+            PREFETCH_REFRESHES.inc(outcome="slow")
+            self._loaded()
+            log.info("Prefetch refresh was slow, backing off", extra={**_describe(target), "seconds": round(elapsed, 1), "backoff": self.backoff})
+        else:
+            PREFETCH_REFRESHES.inc(outcome="ok")
+            self._healthy()
+
+    async def _run(self):
+        while True:
+            try:
+                now = time.monotonic()
+                self._sync_schedule(now)
+                due = sorted(
+                    (t["next_at"], key) for key, t in self._schedule.items() if t["next_at"] <= now and key not in self._running
+                )
+                if due and self._interactive_inflight() >= self.yield_inflight:
+                    # Users are waiting on Splunk right now; try again next tick
+                    self.yielded += 1
+                    due = []
+                for _, key in due[:max(0, self._limit() - len(self._running))]:
+                    self._running[key] = asyncio.create_task(self._refresh_one(key, self._schedule[key]))
+            except Exception as e:
+                log.error("Prefetch scheduler error", extra={"error": str(e)})
+            await asyncio.sleep(self.tick)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            log.info("Prefetcher started", extra={"pinned": len(self.targets), "max_concurrency": self.max_concurrency})
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._running.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running.clear()
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "scheduled": len(self._schedule),
+            "warm": len(self._results),
+            "running": len(self._running),
+            "backoff": self.backoff,
+            "concurrency_limit": self._limit(),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "yielded": self.yielded,
+            "hot": [
+                {
+                    **_describe(t),
+                    "asks": round(self._decayed(key, now), 2),
+                    "as_of": self._results[key]["as_of"] if key in self._results else None,
+                }
+                for key, t in self._schedule.items()
+            ],
+        }
+
+
+prefetcher = Prefetcher()
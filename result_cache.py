@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from time_range import canonical_modifier, resolve_time_modifier
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "120"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Relative windows ("-1h") are resolved against the clock snapped to this many seconds
+RESULT_CACHE_GRANULARITY = float(os.getenv("RESULT_CACHE_GRANULARITY", "60"))
+
+_SPL_TOKEN_RE = re.compile(r'"[^"]*"|\S+')
+_SPL_TIME_RE = re.compile(r'^(earliest|latest)=("?)([^"\s]+)\2$')
+
+
+def _canonical_time_token(token):
+    match = _SPL_TIME_RE.match(token)
+    if not match:
+        return token
+    try:
+        return f'{match.group(1)}="{canonical_modifier(match.group(3))}"'
+    except ValueError:
+        return token
+
+
+def normalize_spl(spl: str) -> str:
+    # Collapse whitespace between tokens but leave quoted phrases untouched; equivalent time modifiers
+    # ("-24h" vs "-1d") are spelled one way so identical windows share cache entries and search jobs
+    return " ".join(_canonical_time_token(t) for t in _SPL_TOKEN_RE.findall(spl or ""))
+
+
+def make_cache_key(spl: str, earliest: str, latest: str, granularity: float = RESULT_CACHE_GRANULARITY, now: float | None = None) -> str:
+    now = time.time() if now is None else now
+    snapped = datetime.fromtimestamp(now // granularity * granularity)
+    try:
+        start = int(resolve_time_modifier(earliest, snapped).timestamp())
+        end = int(resolve_time_modifier(latest, snapped).timestamp())
+    except ValueError:
+        start, end = earliest, latest
+    return f"{normalize_spl(spl)}|{start}|{end}"
+
+
+class ResultCache:
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, size, value = entry
+        if time.monotonic() >= expires_at:
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        if key in self._entries:
+            self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,325 @@
+import asyncio
+import mmap
+import os
+import re
+import sqlite3
+import threading
+from telemetry import get_logger, span
+
+# Files larger than this (generated sources, vendored bundles) are path-indexed but not parsed for symbols
+SOURCE_INDEX_MAX_FILE_BYTES = int(os.getenv("SOURCE_INDEX_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+
+log = get_logger(__name__)
+
+# "at com.acme.TestApp.simulateError(TestApp.java:17)" in a log; the "at" is optional once a frame is isolated
+_LOG_FRAME_RE = re.compile(r"^\s*at\s+([\w$.<>/]+)\(([^():]+):(\d+)\)", re.MULTILINE)
+_FRAME_RE = re.compile(r"([\w$.<>/]+)\(([^():]+):(\d+)\)")
+
+_JAVA_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+_JAVA_TYPE_RE = re.compile(r"(?<![\w$.])(class|interface|enum|record)\s+([A-Za-z_$][\w$]*)")
+_JAVA_METHOD_RE = re.compile(r"(?<![\w$@.])([A-Za-z_$][\w$]*)\s*\(")
+_JAVA_NOT_METHODS = {
+    "if", "for", "while", "switch", "catch", "synchronized", "return", "new", "throw", "else", "try", "do",
+    "super", "this", "assert", "case", "yield",
+}
+_JAVA_SCOPE_RE = re.compile(r"[{};]")
+# Comments, string and char literals; blanked out before scanning so braces inside them don't count
+_JAVA_NOISE_RE = re.compile(r'/\*.*?\*/|//[^\n]*|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+
+
+def _blank(match):
+    # Keep newlines so line numbers survive
+    return re.sub(r"[^\n]", " ", match.group(0))
+
+
+def _java_declaration(segment, scope, owner, line_number):
+    # The type or method declared by the code in front of a "{", if any; only type bodies declare methods
+    if scope in ("file", "type"):
+        declared = _JAVA_TYPE_RE.search(segment)
+        if declared:
+            name = f"{owner}.{declared.group(2)}" if owner else declared.group(2)
+            return "type", name, line_number + segment.count("\n", 0, declared.start(2))
+    if scope == "type":
+        method = _JAVA_METHOD_RE.search(segment)
+        if method and method.group(1) not in _JAVA_NOT_METHODS and "=" not in segment[:method.start()]:
+            return "method", f"{owner}.{method.group(1)}", line_number + segment.count("\n", 0, method.start(1))
+    return None
+
+
+def _matching_brace(code, position):
+    # Index of the "}" closing the "{" just before position; find/count keep the walk out of Python loops
+    depth = 1
+    while True:
+        close = code.find("}", position)
+        if close == -1:
+            return len(code)
+        depth += code.count("{", position, close) - 1
+        position = close + 1
+        if depth == 0:
+            return close
+
+
+def parse_java(source):
+    # Types and methods with their line ranges; a brace scan, not a full parser, which is plenty for stack frames.
+    # Method bodies are skipped whole: classes declared inside them resolve to the enclosing method.
+    package = _JAVA_PACKAGE_RE.search(source)
+    code = _JAVA_NOISE_RE.sub(_blank, source)
+    symbols = []
+    # Open scopes: (kind, qualified name or None, start line); owners holds the named ones
+    stack = []
+    owners = []
+    pending = None
+    line_number = 1
+    last = 0
+    while True:
+        token = _JAVA_SCOPE_RE.search(code, last)
+        if token is None:
+            break
+        segment = code[last:token.start()]
+        last = token.end()
+        if pending is None and segment and not segment.isspace():
+            scope = stack[-1][0] if stack else "file"
+            pending = _java_declaration(segment, scope, owners[-1] if owners else None, line_number)
+        line_number += segment.count("\n")
+        char = token.group()
+        if char == "{" and pending is not None and pending[0] == "method":
+            close = _matching_brace(code, last)
+            end_line = line_number + code.count("\n", last, close)
+            symbols.append((pending[1], "method", pending[2], end_line))
+            line_number = end_line
+            last = close + 1
+            pending = None
+        elif char == "{":
+            stack.append(pending or (None, None, line_number))
+            if pending is not None:
+                owners.append(pending[1])
+            pending = None
+        elif char == "}":
+            if stack:
+                kind, name, start = stack.pop()
+                if name is not None:
+                    owners.pop()
+                    symbols.append((name, kind, start, line_number))
+        else:
+            pending = None
+    return (package.group(1) if package else None), symbols
+
+
+PARSERS = {
+    ".java": parse_java,
+}
+
+
+def stack_frame(raw_log, file_name=None):
+    # The first frame of a trace that points into file_name (any frame when it is not given)
+    base = os.path.basename(file_name) if file_name else None
+    for match in _LOG_FRAME_RE.finditer(raw_log or ""):
+        if base is None or match.group(2) == base:
+            return f"{match.group(1)}({match.group(2)}:{match.group(3)})"
+    return None
+
+
+def _line_offset(view, line_number, start=0, start_line=1):
+    # Byte offset where line_number begins, walking newlines from a known line; end of file when out of range
+    position = start
+    for _ in range(line_number - start_line):
+        position = view.find(b"\n", position) + 1
+        if position == 0:
+            return len(view)
+    return position
+
+
+def read_lines(path, start, end):
+    # Lines start..end (1-based, inclusive) straight from a memory map, without reading the rest of the file
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            begin = _line_offset(view, max(start, 1))
+            stop = _line_offset(view, end + 1, begin, max(start, 1))
+            return view[begin:stop].decode("utf-8", errors="replace").splitlines(keepends=True)
+
+
+def replace_line(path, line_number, text):
+    # Swaps one line in place, keeping the file's own line ending
+    with open(path, "rb") as f:
+        data = f.read()
+    begin = _line_offset(data, line_number)
+    if line_number < 1 or begin >= len(data):
+        raise ValueError(f"{path} has no line {line_number}")
+    stop = data.find(b"\n", begin) + 1 or len(data)
+    ending = b"\r\n" if data[begin:stop].endswith(b"\r\n") else b"\n"
+    with open(path, "wb") as f:
+        f.write(data[:begin] + text.rstrip("\r\n").encode("utf-8") + ending + data[stop:])
+
+
+class SourceIndex:
+    # Paths and symbols of one repository at one commit; moved forward by diffing against the indexed commit
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._update_lock = asyncio.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, basename TEXT NOT NULL, blob_sha TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS symbols ("
+            "qualified TEXT NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL, path TEXT NOT NULL, "
+            "start_line INTEGER NOT NULL, end_line INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_basename ON files (basename)")
+        # Frames are located through their class; partial indexes keep the per-method rows out of these two
+        self._db.execute("CREATE INDEX IF NOT EXISTS symbols_type_qualified ON symbols (qualified) WHERE kind = 'type'")
+        self._db.execute("CREATE INDEX IF NOT EXISTS symbols_type_name ON symbols (name) WHERE kind = 'type'")
+        self._db.execute("CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path, start_line)")
+        self._db.commit()
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'commit'").fetchone()
+        self.commit = row[0] if row else None
+
+    async def update(self, worktree):
+        # Brings the index to the worktree's HEAD; only files changed since the indexed commit are re-read
+        async with self._update_lock:
+            head = await worktree.git("rev-parse", "HEAD")
+            if head == self.commit:
+                return
+            with span("source_index", full=self.commit is None) as fields:
+                changes = None
+                if self.commit is not None:
+                    try:
+                        changes = _parse_diff_tree(
+                            await worktree.git("diff-tree", "-r", "--no-renames", "--no-commit-id", self.commit, head)
+                        )
+                    except Exception as e:
+                        # The indexed commit is gone (force push, gc); start over
+                        log.info("Rebuilding source index", extra={"commit": self.commit, "error": str(e)})
+                        fields["full"] = True
+                full = changes is None
+                if full:
+                    changes = _parse_ls_tree(await worktree.git("ls-tree", "-r", head))
+                fields["files"] = len(changes)
+                await asyncio.to_thread(self._apply, head, worktree.path, changes, full)
+
+    def _apply(self, head, root, changes, full):
+        parsed = []
+        for path, blob_sha in changes:
+            parser = PARSERS.get(os.path.splitext(path)[1])
+            if blob_sha is None or parser is None:
+                continue
+            full_path = os.path.join(root, path)
+            try:
+                if os.path.getsize(full_path) > SOURCE_INDEX_MAX_FILE_BYTES:
+                    continue
+                with open(full_path, encoding="utf-8", errors="replace") as f:
+                    package, symbols = parser(f.read())
+            except OSError as e:
+                log.warning("Could not index source file", extra={"path": path, "error": str(e)})
+                continue
+            for name, kind, start, end in symbols:
+                parsed.append((f"{package}.{name}" if package else name, name, kind, path, start, end))
+        with self._lock:
+            if full:
+                self._db.execute("DELETE FROM files")
+                self._db.execute("DELETE FROM symbols")
+            else:
+                self._db.executemany("DELETE FROM symbols WHERE path = ?", [(path,) for path, _ in changes])
+                self._db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p, sha in changes if sha is None])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files (path, basename, blob_sha) VALUES (?, ?, ?)",
+                [(path, os.path.basename(path), sha) for path, sha in changes if sha is not None],
+            )
+            self._db.executemany(
+                "INSERT INTO symbols (qualified, name, kind, path, start_line, end_line) VALUES (?, ?, ?, ?, ?, ?)",
+                parsed,
+            )
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('commit', ?)", (head,))
+            self._db.commit()
+            self.commit = head
+
+    def resolve_path(self, file_path):
+        # Repo-relative path for a path the logs or the LLM gave us (often just the file name); None when unknown or ambiguous
+        file_path = re.sub(r"^(?:\./|/)+", "", file_path.replace("\\", "/"))
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM files WHERE path = ?", (file_path,)).fetchone():
+                return file_path
+            rows = self._db.execute(
+                "SELECT path FROM files WHERE basename = ?", (os.path.basename(file_path),)
+            ).fetchall()
+        matches = [path for (path,) in rows if path.endswith(f"/{file_path}")]
+        if len(matches) > 1:
+            log.warning("Ambiguous source path", extra={"file_path": file_path, "matches": matches[:5]})
+        return matches[0] if len(matches) == 1 else None
+
+    def enclosing_symbol(self, path, line_number):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT qualified, kind, start_line, end_line FROM symbols "
+                "WHERE path = ? AND start_line <= ? AND end_line >= ? ORDER BY start_line DESC LIMIT 1",
+                (path, line_number, line_number),
+            ).fetchone()
+        if row is None:
+            return {}
+        return dict(zip(("symbol", "kind", "start_line", "end_line"), row))
+
+    def resolve_frame(self, frame):
+        # "com.acme.TestApp.simulateError(TestApp.java:17)" -> path, line and the enclosing symbol
+        match = _FRAME_RE.search(frame or "")
+        if not match:
+            return None
+        method_path, file_name, line_number = match.group(1), match.group(2), int(match.group(3))
+        # Nested classes show up as Outer$Inner, lambdas as lambda$method$0; the class part is what locates the file
+        class_name = method_path.rsplit(".", 1)[0].split("$")[0] if "." in method_path else None
+        paths = []
+        for column, value in (("qualified", class_name), ("name", class_name and class_name.rsplit(".", 1)[-1])):
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT DISTINCT path FROM symbols WHERE kind = 'type' AND {column} = ?", (value,)
+                ).fetchall()
+            paths = [path for (path,) in rows if os.path.basename(path) == file_name]
+            if paths:
+                break
+        if len(paths) != 1:
+            # Not a symbol we know: fall back to the package path, then the bare file name
+            package_dir = class_name.rsplit(".", 1)[0].replace(".", "/") if class_name and "." in class_name else None
+            path = self.resolve_path(f"{package_dir}/{file_name}" if package_dir else file_name)
+            if path is None and package_dir:
+                path = self.resolve_path(file_name)
+            if path is None:
+                return None
+            paths = [path]
+        return {"path": paths[0], "line": line_number, **self.enclosing_symbol(paths[0], line_number)}
+
+    def locate(self, file_path, line_number, frame=None):
+        # Where a fix goes: the stack frame wins when it points at the same file, else the indexed path for file_path
+        location = self.resolve_frame(frame) if frame else None
+        if location is not None and (not file_path or os.path.basename(file_path) == os.path.basename(location["path"])):
+            return location
+        path = self.resolve_path(file_path) if file_path else None
+        if path is None:
+            return None
+        return {"path": path, "line": line_number, **self.enclosing_symbol(path, line_number)}
+
+
+def _parse_ls_tree(output):
+    changes = []
+    for line in output.splitlines():
+        meta, _, path = line.partition("\t")
+        mode, kind, sha = meta.split()
+        # Submodules and symlinks have no source to index
+        if kind == "blob" and mode != "120000":
+            changes.append((path, sha))
+    return changes
+
+
+def _parse_diff_tree(output):
+    # (path, new blob sha), with None for deleted files
+    changes = []
+    for line in output.splitlines():
+        meta, _, path = line.partition("\t")
+        _, new_mode, _, new_sha, status = meta.lstrip(":").split()
+        if status == "D" or new_mode in ("160000", "120000"):
+            changes.append((path, None))
+        else:
+            changes.append((path, new_sha))
+    return changes
@@ -1,62 +1,663 @@
-import requests
-import time
+import asyncio
 import os
+import time
+import json
+import httpx
 from dotenv import load_dotenv
-import pprint
+from time_range import window_seconds
+from result_cache import make_cache_key
+from telemetry import get_logger, record_cache, span
 
 load_dotenv()
 
+log = get_logger(__name__)
+
 SPLUNK_BASE = os.getenv("SPLUNK_API_BASE")
 SPLUNK_USERNAME = os.getenv("SPLUNK_USERNAME")
 SPLUNK_PASSWORD = os.getenv("SPLUNK_PASSWORD")
+# "local" answers searches from log files on disk (local_search.py) instead of the REST API
+SPLUNK_BACKEND = os.getenv("SPLUNK_BACKEND", "splunk")
+
+# Default timeouts (seconds) and pool size for the shared Splunk connection pool
+SPLUNK_TIMEOUT = float(os.getenv("SPLUNK_TIMEOUT", "30"))
+SPLUNK_CONNECT_TIMEOUT = float(os.getenv("SPLUNK_CONNECT_TIMEOUT", "10"))
+SPLUNK_LOGIN_TIMEOUT = float(os.getenv("SPLUNK_LOGIN_TIMEOUT", "10"))
+SPLUNK_MAX_CONNECTIONS = int(os.getenv("SPLUNK_MAX_CONNECTIONS", "20"))
+SPLUNK_KEEPALIVE_EXPIRY = float(os.getenv("SPLUNK_KEEPALIVE_EXPIRY", "60"))
+
+# Splunk expires idle session keys (server default 1h); refresh a little before that
+SPLUNK_SESSION_TTL = float(os.getenv("SPLUNK_SESSION_TTL", "3600"))
+SPLUNK_SESSION_REFRESH_MARGIN = float(os.getenv("SPLUNK_SESSION_REFRESH_MARGIN", "60"))
+
+# Job polling: start fast for tiny searches, back off for long ones, give up at the deadline
+SPLUNK_POLL_INITIAL = float(os.getenv("SPLUNK_POLL_INITIAL", "0.05"))
+SPLUNK_POLL_MAX = float(os.getenv("SPLUNK_POLL_MAX", "2"))
+SPLUNK_POLL_BACKOFF = float(os.getenv("SPLUNK_POLL_BACKOFF", "1.6"))
+SPLUNK_JOB_DEADLINE = float(os.getenv("SPLUNK_JOB_DEADLINE", "120"))
+
+# Search mode selection: small bounded searches skip the submit/poll/fetch round-trips
+SPLUNK_FAST_PATH_MAX_WINDOW = float(os.getenv("SPLUNK_FAST_PATH_MAX_WINDOW", str(24 * 3600)))
+SPLUNK_ONESHOT_MAX_RESULTS = int(os.getenv("SPLUNK_ONESHOT_MAX_RESULTS", "100"))
+SPLUNK_EXPORT_MAX_WINDOW = float(os.getenv("SPLUNK_EXPORT_MAX_WINDOW", str(7 * 24 * 3600)))
+SPLUNK_EXPORT_MAX_RESULTS = int(os.getenv("SPLUNK_EXPORT_MAX_RESULTS", "1000"))
+
+# Result paging: first page is small so callers that need one row don't download hundreds
+SPLUNK_RESULTS_FIRST_PAGE = int(os.getenv("SPLUNK_RESULTS_FIRST_PAGE", "10"))
+SPLUNK_RESULTS_PAGE_SIZE = int(os.getenv("SPLUNK_RESULTS_PAGE_SIZE", "500"))
+
+# Finished job artifacts are reused until shortly before Splunk's own TTL removes them
+SPLUNK_JOB_REUSE_MARGIN = float(os.getenv("SPLUNK_JOB_REUSE_MARGIN", "30"))
+SPLUNK_JOB_VERIFY_INTERVAL = float(os.getenv("SPLUNK_JOB_VERIFY_INTERVAL", "10"))
+SPLUNK_JOB_REGISTRY_SIZE = int(os.getenv("SPLUNK_JOB_REGISTRY_SIZE", "1000"))
+
+
+class SplunkError(Exception):
+    pass
+
 
-def splunk_login():
-    url = f"{SPLUNK_BASE}/services/auth/login"
-    print(f"[DEBUG] Trying to connect to Splunk: {url}")
+class SplunkAuthError(SplunkError):
+    pass
+
+
+class SplunkSearchFailed(SplunkError):
+    pass
+
+
+class SplunkJobTimeout(SplunkError):
+    pass
+
+
+class SplunkJobNotFound(SplunkError):
+    pass
+
+
+def _json(response):
     try:
-        response = requests.post(
-            url,
-            data={"username": SPLUNK_USERNAME, "password": SPLUNK_PASSWORD},
+        body = response.json()
+    except ValueError as e:
+        raise SplunkError(f"Splunk returned a non-JSON body (HTTP {response.status_code}): {response.text[:200]}") from e
+    if not isinstance(body, dict):
+        raise SplunkError(f"Splunk returned an unexpected body (HTTP {response.status_code}): {response.text[:200]}")
+    return body
+
+
+class SplunkSession:
+    def __init__(self, client, ttl=SPLUNK_SESSION_TTL, refresh_margin=SPLUNK_SESSION_REFRESH_MARGIN):
+        self._client = client
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._key = None
+        self._expires_at = 0.0
+        # Serialises logins so a burst of requests after expiry triggers a single POST
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        return self._key is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    async def get_key(self):
+        if self._is_fresh():
+            return self._key
+        async with self._lock:
+            if self._is_fresh():
+                return self._key
+            key = await self._client.login()
+            if not key:
+                raise SplunkAuthError("Splunk authentication failed.")
+            self._key = key
+            self._expires_at = time.monotonic() + self.ttl
+            return key
+
+    def touch(self, key):
+        # Splunk's session timeout is idle-based, so every successful call extends it
+        if key == self._key:
+            self._expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self, key):
+        # Only drop the key that failed; another request may already have refreshed it
+        if key == self._key:
+            self._key = None
+            self._expires_at = 0.0
+
+
+class SearchJobRegistry:
+    def __init__(
+        self,
+        client,
+        reuse_margin=SPLUNK_JOB_REUSE_MARGIN,
+        verify_interval=SPLUNK_JOB_VERIFY_INTERVAL,
+        max_entries=SPLUNK_JOB_REGISTRY_SIZE,
+    ):
+        self._client = client
+        self.reuse_margin = reuse_margin
+        self.verify_interval = verify_interval
+        self.max_entries = max_entries
+        # key -> {"sid", "expires_at", "verified_at"} for finished jobs whose artifact should still exist
+        self._jobs = {}
+        # key -> {"task", "waiters"} for searches being dispatched right now
+        self._inflight = {}
+        # key -> progress callbacks of every caller waiting on that dispatch
+        self._listeners = {}
+        self.reused = 0
+        self.shared = 0
+        self.dispatched = 0
+
+    async def _artifact_alive(self, job):
+        now = time.monotonic()
+        if now >= job["expires_at"]:
+            return False
+        if now - job["verified_at"] < self.verify_interval:
+            return True
+        try:
+            content = await self._client.get_job_status(job["sid"])
+        except SplunkJobNotFound:
+            return False
+        if content.get("isFailed") or not content.get("isDone"):
+            return False
+        job["verified_at"] = now
+        return True
+
+    async def lookup(self, key):
+        job = self._jobs.get(key)
+        if job is not None and await self._artifact_alive(job):
+            self.reused += 1
+            record_cache("splunk_job", True)
+            return job["sid"]
+        record_cache("splunk_job", False)
+        self._jobs.pop(key, None)
+        return None
+
+    def remember(self, key, sid, ttl):
+        now = time.monotonic()
+        if len(self._jobs) >= self.max_entries:
+            self._jobs = {k: j for k, j in self._jobs.items() if j["expires_at"] > now}
+            while len(self._jobs) >= self.max_entries:
+                self._jobs.pop(next(iter(self._jobs)))
+        self._jobs[key] = {"sid": sid, "expires_at": now + ttl - self.reuse_margin, "verified_at": now}
+
+    async def single_flight(self, key, factory):
+        # Identical concurrent requests await one shared task; a caller going away doesn't cancel it for the rest,
+        # but once the last one has gone the task is cancelled, so wait_for_job cancels the Splunk job as well
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = {"task": asyncio.ensure_future(factory()), "waiters": 0}
+
+            def finished(_):
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+
+            entry["task"].add_done_callback(finished)
+        else:
+            self.shared += 1
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                # Later callers start afresh instead of joining a search that is being torn down
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+                entry["task"].cancel()
+
+    async def get_sid(self, key, search_query, blocking=False, on_progress=None):
+        sid = await self.lookup(key)
+        if sid is not None:
+            return sid
+        listeners = self._listeners.setdefault(key, set())
+        if on_progress is not None:
+            listeners.add(on_progress)
+        try:
+            return await self.single_flight(("job", key), lambda: self._dispatch(key, search_query, blocking))
+        finally:
+            listeners.discard(on_progress)
+            if not listeners:
+                self._listeners.pop(key, None)
+
+    async def _notify(self, key, sid, state, progress):
+        for listener in list(self._listeners.get(key, ())):
+            try:
+                await listener(sid, state, progress)
+            except Exception as e:
+                log.warning("Progress listener failed", extra={"sid": sid, "error": str(e)})
+
+    async def _dispatch(self, key, search_query, blocking):
+        self.dispatched += 1
+        if blocking:
+            sid = await self._client.submit_blocking(search_query)
+        else:
+            sid = await self._client.submit_search(search_query)
+        if not sid:
+            raise SplunkSearchFailed("Failed to submit Splunk search.")
+        if blocking:
+            content = await self._client.get_job_status(sid)
+        else:
+            content = await self._client.wait_for_job(
+                sid, on_progress=lambda *status: self._notify(key, *status)
+            )
+        self.remember(key, sid, float(content.get("ttl") or 600))
+        return sid
+
+    def stats(self):
+        return {
+            "live_jobs": len(self._jobs),
+            "inflight": len(self._inflight),
+            "dispatched": self.dispatched,
+            "reused": self.reused,
+            "shared": self.shared,
+        }
+
+
+class SplunkClient:
+    def __init__(
+        self,
+        base_url=SPLUNK_BASE,
+        username=SPLUNK_USERNAME,
+        password=SPLUNK_PASSWORD,
+        timeout=SPLUNK_TIMEOUT,
+        connect_timeout=SPLUNK_CONNECT_TIMEOUT,
+        max_connections=SPLUNK_MAX_CONNECTIONS,
+        keepalive_expiry=SPLUNK_KEEPALIVE_EXPIRY,
+    ):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        # One keep-alive pool shared by every request, so repeated calls reuse TCP/TLS connections
+        self._http = httpx.AsyncClient(
+            base_url=base_url or "",
             verify=False,
-            timeout=10
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
         )
-        response.raise_for_status()
-        print("Login done")
-        return response.text.split("<sessionKey>")[1].split("</sessionKey>")[0]
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Splunk login failed: {e}")
-        return None
+        self.session = SplunkSession(self)
+        self.jobs = SearchJobRegistry(self)
 
-def splunk_submit_search(session_key, search_query):
-    headers = {"Authorization": f"Splunk {session_key}"}
-    response = requests.post(
-        f"{SPLUNK_BASE}/services/search/jobs",
-        headers=headers,
-        data={"search": search_query, "output_mode": "json"},
-        verify=False
-    )
-    return response.json().get("sid")
-
-def splunk_wait_for_job(session_key, sid):
-    headers = {"Authorization": f"Splunk {session_key}"}
-    while True:
-        response = requests.get(
-            f"{SPLUNK_BASE}/services/search/jobs/{sid}",
-            headers=headers,
+    async def start(self):
+        # Nothing to warm up for a remote Splunk; the local backend starts indexing here
+        pass
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def _request(self, method, path, auth=True, timeout=None, stream=False, check=True, **kwargs):
+        # Transport failures, and error statuses unless the caller asked to see them (check=False), become SplunkError
+        try:
+            response = await self._send(method, path, auth, timeout, stream, **kwargs)
+        except httpx.HTTPError as e:
+            raise SplunkError(f"Splunk request {method} {path} failed: {type(e).__name__}: {e}") from e
+        if check and response.status_code >= 400:
+            await response.aread()
+            await response.aclose()
+            raise SplunkError(f"Splunk request {method} {path} failed with HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    async def _send(self, method, path, auth, timeout, stream, **kwargs):
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if not auth:
+            return await self._http.request(method, path, **kwargs)
+
+        headers = kwargs.pop("headers", {})
+        for _ in range(2):
+            session_key = await self.session.get_key()
+            request = self._http.build_request(
+                method, path, headers={**headers, "Authorization": f"Splunk {session_key}"}, **kwargs
+            )
+            response = await self._http.send(request, stream=stream)
+            if response.status_code != 401:
+                self.session.touch(session_key)
+                return response
+            await response.aclose()
+            # Key expired or was revoked server-side: refresh once and replay
+            self.session.invalidate(session_key)
+        raise SplunkAuthError("Splunk rejected a freshly issued session key.")
+
+    async def login(self, timeout=SPLUNK_LOGIN_TIMEOUT):
+        log.debug("Logging in to Splunk", extra={"url": f"{self.base_url}/services/auth/login"})
+        try:
+            with span("splunk_login"):
+                response = await self._request(
+                    "POST",
+                    "/services/auth/login",
+                    auth=False,
+                    data={"username": self.username, "password": self.password, "output_mode": "json"},
+                    timeout=timeout,
+                )
+                return _json(response)["sessionKey"]
+        except (SplunkError, KeyError, TypeError) as e:
+            log.error("Splunk login failed", extra={"error": str(e)})
+            return None
+
+    async def submit_search(self, search_query, timeout=None):
+        with span("splunk_submit", exec_mode="normal"):
+            response = await self._request(
+                "POST",
+                "/services/search/jobs",
+                data={"search": search_query, "output_mode": "json"},
+                timeout=timeout,
+            )
+            return _json(response).get("sid")
+
+    async def get_job_status(self, sid, timeout=None):
+        response = await self._request(
+            "GET",
+            f"/services/search/jobs/{sid}",
             params={"output_mode": "json"},
-            verify=False
+            timeout=timeout,
+            check=False,
         )
-        state = response.json()["entry"][0]["content"]["dispatchState"]
-        if state == "DONE":
-            break
-        time.sleep(1)
-
-def splunk_get_results(session_key, sid):
-    headers = {"Authorization": f"Splunk {session_key}"}
-    response = requests.get(
-        f"{SPLUNK_BASE}/services/search/jobs/{sid}/results",
-        headers=headers,
-        params={"output_mode": "json"},
-        verify=False
+        if response.status_code == 404:
+            raise SplunkJobNotFound(f"Splunk job {sid} no longer exists.")
+        if response.status_code >= 400:
+            raise SplunkError(f"Status of Splunk job {sid} failed with HTTP {response.status_code}: {response.text[:200]}")
+        try:
+            return _json(response)["entry"][0]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise SplunkError(f"Unexpected status response for Splunk job {sid}: {response.text[:200]}") from e
+
+    async def cancel_job(self, sid, timeout=None):
+        try:
+            response = await self._request(
+                "POST",
+                f"/services/search/jobs/{sid}/control",
+                data={"action": "cancel", "output_mode": "json"},
+                timeout=timeout,
+                check=False,
+            )
+            return response.status_code < 400
+        except SplunkError as e:
+            log.error("Failed to cancel Splunk job", extra={"sid": sid, "error": str(e)})
+            return False
+
+    async def wait_for_job(
+        self,
+        sid,
+        deadline=SPLUNK_JOB_DEADLINE,
+        on_progress=None,
+        initial_interval=SPLUNK_POLL_INITIAL,
+        max_interval=SPLUNK_POLL_MAX,
+        backoff=SPLUNK_POLL_BACKOFF,
+        timeout=None,
+    ):
+        started = time.monotonic()
+        give_up_at = started + deadline
+        interval = initial_interval
+        try:
+            with span("splunk_poll", sid=sid, polls=0) as fields:
+                while True:
+                    content = await self.get_job_status(sid, timeout=timeout)
+                    fields["polls"] += 1
+                    state = content.get("dispatchState")
+                    progress = float(content.get("doneProgress") or 0)
+                    if on_progress is not None:
+                        await on_progress(sid, state, progress)
+
+                    if content.get("isFailed") or state == "FAILED":
+                        messages = content.get("messages") or []
+                        detail = "; ".join(m.get("text", "") for m in messages if isinstance(m, dict))
+                        raise SplunkSearchFailed(f"Splunk search {sid} failed. {detail}".strip())
+                    if content.get("isDone") or state == "DONE":
+                        return content
+
+                    now = time.monotonic()
+                    if now >= give_up_at:
+                        await self.cancel_job(sid)
+                        raise SplunkJobTimeout(f"Splunk search {sid} did not finish within {deadline:g}s.")
+
+                    # When Splunk reports progress, don't sleep much past its projected finish time
+                    delay = interval
+                    if 0 < progress < 1:
+                        projected = (now - started) * (1 - progress) / progress
+                        delay = min(interval, max(initial_interval, projected))
+                    await asyncio.sleep(min(delay, give_up_at - now))
+                    interval = min(interval * backoff, max_interval)
+        except asyncio.CancelledError:
+            # The caller went away (client disconnect, shutdown): free the search slot too
+            await asyncio.shield(self.cancel_job(sid))
+            raise
+
+    async def iter_results(
+        self,
+        sid,
+        max_results=None,
+        fields=None,
+        first_page=SPLUNK_RESULTS_FIRST_PAGE,
+        page_size=SPLUNK_RESULTS_PAGE_SIZE,
+        timeout=None,
+    ):
+        offset = 0
+        count = first_page
+        while max_results is None or offset < max_results:
+            if max_results is not None:
+                count = min(count, max_results - offset)
+            params = {"output_mode": "json", "offset": offset, "count": count}
+            if fields:
+                params["f"] = list(fields)
+            with span("splunk_fetch", sid=sid, offset=offset, count=count):
+                response = await self._request(
+                    "GET",
+                    f"/services/search/jobs/{sid}/results",
+                    params=params,
+                    timeout=timeout,
+                )
+                # Only one page is ever held in memory
+                page = _json(response).get("results", [])
+            for row in page:
+                yield row
+            if len(page) < count:
+                return
+            offset += len(page)
+            count = min(count * 4, page_size)
+
+    async def get_results(self, sid, max_results=None, fields=None, timeout=None):
+        rows = [row async for row in self.iter_results(sid, max_results, fields, timeout=timeout)]
+        return {"results": rows}
+
+    # --- Single round-trip search modes ---
+
+    async def oneshot(self, search_query, max_results=SPLUNK_ONESHOT_MAX_RESULTS, fields=None, timeout=SPLUNK_JOB_DEADLINE):
+        data = {"search": search_query, "exec_mode": "oneshot", "count": max_results, "output_mode": "json"}
+        if fields:
+            data["f"] = list(fields)
+        # Submit, wait and fetch in one round-trip, so the whole call is one span
+        with span("splunk_oneshot"):
+            response = await self._request("POST", "/services/search/jobs", data=data, timeout=timeout, check=False)
+            if response.status_code >= 400:
+                raise SplunkSearchFailed(f"Oneshot search failed with HTTP {response.status_code}: {response.text[:200]}")
+            return _json(response)
+
+    async def submit_blocking(self, search_query, timeout=SPLUNK_JOB_DEADLINE):
+        # A blocking submit returns once the job is done, so it covers the poll stage as well
+        with span("splunk_submit", exec_mode="blocking"):
+            response = await self._request(
+                "POST",
+                "/services/search/jobs",
+                data={"search": search_query, "exec_mode": "blocking", "output_mode": "json"},
+                timeout=timeout,
+                check=False,
+            )
+            if response.status_code >= 400:
+                raise SplunkSearchFailed(f"Blocking search failed with HTTP {response.status_code}: {response.text[:200]}")
+            return _json(response).get("sid")
+
+    async def export(self, search_query, max_results=SPLUNK_EXPORT_MAX_RESULTS, fields=None, timeout=SPLUNK_JOB_DEADLINE):
+        # /export streams one JSON object per line as events are found; stop reading once we have enough
+        # The stream is read at the caller's pace, so the span only covers the time to the first byte
+        with span("splunk_export"):
+            response = await self._request(
+                "POST",
+                "/services/search/jobs/export",
+                data={"search": search_query, "output_mode": "json"},
+                timeout=timeout,
+                stream=True,
+                check=False,
+            )
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                raise SplunkSearchFailed(f"Export search failed with HTTP {response.status_code}: {response.text[:200]}")
+            returned = 0
+            lines = response.aiter_lines()
+            while True:
+                # The connection can drop halfway through the stream
+                try:
+                    line = await anext(lines)
+                except StopAsyncIteration:
+                    break
+                except httpx.HTTPError as e:
+                    raise SplunkError(f"Splunk export stream broke off: {type(e).__name__}: {e}") from e
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError as e:
+                    raise SplunkError(f"Unexpected line in Splunk export stream: {line[:200]}") from e
+                if event.get("preview") or "result" not in event:
+                    continue
+                row = event["result"]
+                yield {f: row[f] for f in fields if f in row} if fields else row
+                returned += 1
+                if max_results and returned >= max_results:
+                    break
+        finally:
+            await response.aclose()
+
+    async def stream_search(
+        self,
+        search_query,
+        earliest="-1h",
+        latest="now",
+        expected_results=SPLUNK_ONESHOT_MAX_RESULTS,
+        fields=None,
+        on_start=None,
+        on_progress=None,
+        max_results=None,
+    ):
+        # expected_results picks the mode; max_results (default: the same) caps the rows fetched in any mode
+        max_results = max_results or expected_results
+        mode = choose_search_mode(earliest, latest, expected_results)
+        key = make_cache_key(search_query, earliest, latest)
+        log.debug("Running Splunk search", extra={"mode": mode, "expected_results": expected_results, "max_results": max_results})
+
+        if mode == "oneshot":
+            if on_start is not None:
+                await on_start(mode, None)
+            results = await self.jobs.single_flight(
+                ("oneshot", key, max_results, tuple(fields or ())),
+                lambda: self.oneshot(search_query, max_results=max_results, fields=fields),
+            )
+            for row in results.get("results", []):
+                yield row
+            return
+        if mode == "export":
+            if on_start is not None:
+                await on_start(mode, None)
+            async for row in self.export(search_query, max_results=max_results, fields=fields):
+                yield row
+            return
+        # Job modes leave an artifact on the search head, so identical searches can read it by sid
+        sid = await self.jobs.get_sid(key, search_query, blocking=mode == "blocking", on_progress=on_progress)
+        if on_start is not None:
+            await on_start(mode, sid)
+        async for row in self.iter_results(sid, max_results=max_results, fields=fields):
+            yield row
+
+    async def run_search(self, search_query, earliest="-1h", latest="now", expected_results=SPLUNK_ONESHOT_MAX_RESULTS, fields=None):
+        started = {}
+
+        async def remember(mode, sid):
+            started.update(mode=mode, sid=sid)
+
+        rows = [
+            row
+            async for row in self.stream_search(
+                search_query, earliest, latest, expected_results, fields, on_start=remember
+            )
+        ]
+        return {"results": rows, **started}
+
+
+def choose_search_mode(earliest, latest, expected_results):
+    try:
+        window = window_seconds(earliest, latest)
+    except ValueError:
+        return "async"
+    if window <= SPLUNK_FAST_PATH_MAX_WINDOW:
+        # Oneshot returns results inline; blocking leaves a sid whose artifact can be paged
+        return "oneshot" if expected_results <= SPLUNK_ONESHOT_MAX_RESULTS else "blocking"
+    if window <= SPLUNK_EXPORT_MAX_WINDOW and expected_results <= SPLUNK_EXPORT_MAX_RESULTS:
+        return "export"
+    return "async"
+
+
+# --- Shared client used by the chatbot ---
+_client = None
+
+
+def get_splunk_client():
+    global _client
+    if _client is None:
+        if SPLUNK_BACKEND == "local":
+            from local_search import LocalSearchClient
+            _client = LocalSearchClient()
+        else:
+            _client = SplunkClient()
+    return _client
+
+
+async def close_splunk_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def splunk_login():
+    # Returns the cached session key; only hits /auth/login when it is missing or about to expire
+    try:
+        return await get_splunk_client().session.get_key()
+    except SplunkAuthError:
+        return None
+
+
+async def splunk_submit_search(search_query):
+    return await get_splunk_client().submit_search(search_query)
+
+
+async def splunk_wait_for_job(sid, on_progress=None):
+    return await get_splunk_client().wait_for_job(sid, on_progress=on_progress)
+
+
+async def splunk_cancel_job(sid):
+    return await get_splunk_client().cancel_job(sid)
+
+
+async def splunk_get_results(sid, max_results=None, fields=None):
+    return await get_splunk_client().get_results(sid, max_results, fields)
+
+
+def splunk_iter_results(sid, max_results=None, fields=None):
+    return get_splunk_client().iter_results(sid, max_results, fields)
+
+
+async def splunk_run_search(search_query, earliest="-1h", latest="now", expected_results=SPLUNK_ONESHOT_MAX_RESULTS, fields=None):
+    return await get_splunk_client().run_search(search_query, earliest, latest, expected_results, fields)
+
+
+def splunk_stream_search(
+    search_query,
+    earliest="-1h",
+    latest="now",
+    expected_results=SPLUNK_ONESHOT_MAX_RESULTS,
+    fields=None,
+    on_start=None,
+    on_progress=None,
+    max_results=None,
+):
+    return get_splunk_client().stream_search(
+        search_query, earliest, latest, expected_results, fields,
+        on_start=on_start, on_progress=on_progress, max_results=max_results,
     )
-    return response.json()
\ No newline at end of file
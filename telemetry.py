@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (key=value, one line per record) or "json" (one object per line, for log shippers)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "splunkbot")
+METRICS_LATENCY_BUCKETS = tuple(
+    float(b) for b in os.getenv(
+        "METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+
+# Attributes every LogRecord has; anything else on a record came in through `extra=` and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_trace_id = ContextVar("trace_id", default=None)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [*zip(labelnames, key), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        # Spans and counters are also hit from worker threads (local index, git blob lookups)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, [list(e[0]), e[1], e[2]]) for key, e in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", "+Inf" if bound == float("inf") else repr(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {repr(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def _add(self, cls, name, *args, **kwargs):
+        full_name = f"{self.prefix}_{name}" if self.prefix else name
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            metric = self._metrics[full_name] = cls(full_name, *args, **kwargs)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        return self._add(Histogram, name, help, labelnames, buckets)
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "stage_duration_seconds", "Time spent in each query pipeline stage.", ["stage", "status"]
+)
+LLM_TOKENS = metrics.counter("llm_tokens_total", "LLM tokens used, by kind (prompt/completion).", ["kind"])
+CACHE_LOOKUPS = metrics.counter("cache_lookups_total", "Cache lookups by cache and outcome (hit/miss).", ["cache", "outcome"])
+
+
+# --- Structured logging ---
+
+def _text_value(value):
+    # Quote strings only when they would otherwise be ambiguous in key=value output
+    if isinstance(value, str) and value and not any(c in value for c in ' "=\n'):
+        return value
+    return json.dumps(value, default=str)
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, json_output=False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+        trace_id = _trace_id.get()
+        if trace_id and "trace_id" not in fields:
+            fields["trace_id"] = trace_id
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+        message = record.getMessage()
+        if record.exc_info:
+            fields["exception"] = self.formatException(record.exc_info)
+        if self.json_output:
+            return json.dumps(
+                {"time": timestamp, "level": record.levelname, "logger": record.name, "message": message, **fields},
+                default=str,
+            )
+        rendered = " ".join(f"{k}={_text_value(v)}" for k, v in fields.items())
+        return f"{timestamp} {record.levelname:<7} {record.name}: {message}" + (f" {rendered}" if rendered else "")
+
+
+_configured = False
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(StructuredFormatter(json_output=fmt == "json"))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    # Per-request lines from the HTTP clients would drown out the spans
+    for name in ("httpx", "httpcore", "openai"):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(name)
+
+
+log = get_logger(__name__)
+
+
+# --- Tracing ---
+
+@contextmanager
+def trace(trace_id=None):
+    # Tags every log record and span emitted inside the block (including tasks it starts) with one id
+    token = _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+@contextmanager
+def span(stage, **fields):
+    # Times the block into the stage histogram; the yielded dict can be filled with fields for the span log line
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, status=status)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("span", extra={"stage": stage, "status": status, "duration_ms": round(elapsed * 1000, 1), **fields})
+
+
+def record_cache(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, outcome="hit" if hit else "miss")
+
+
+def record_llm_usage(usage):
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
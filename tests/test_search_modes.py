@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from intents import BUILTIN_INTENTS
+from splunk_helper import choose_search_mode
+from time_range import parse_time_range
+
+NOW = datetime(2025, 6, 4, 12, 0)
+
+# (intent, time range) -> mode the search should run in
+EXPECTED_MODES = {
+    ("check_status", None): "oneshot",
+    ("check_status", "last 24 hours"): "oneshot",
+    ("check_status", "last 3 days"): "export",
+    ("check_status", "last 30 days"): "async",
+    ("search_errors", None): "oneshot",
+    ("search_errors", "last 3 days"): "export",
+    ("search_errors", "last 30 days"): "async",
+    ("search_null_pointer_exceptions", None): "oneshot",
+    ("search_null_pointer_exceptions", "last 7 days"): "export",
+}
+
+
+def _mode(intent, time_range):
+    earliest, latest = parse_time_range(time_range or intent.default_time_range, NOW)
+    return choose_search_mode(earliest, latest, intent.expected_results)
+
+
+@pytest.mark.parametrize("intent", BUILTIN_INTENTS, ids=lambda intent: intent.name)
+def test_default_window_takes_the_oneshot_fast_path(intent):
+    assert _mode(intent, None) == "oneshot"
+
+
+@pytest.mark.parametrize("name,time_range", EXPECTED_MODES)
+def test_builtin_intent_modes(name, time_range):
+    intent = next(i for i in BUILTIN_INTENTS if i.name == name)
+    assert _mode(intent, time_range) == EXPECTED_MODES[name, time_range]
+
+
+@pytest.mark.parametrize("intent", BUILTIN_INTENTS, ids=lambda intent: intent.name)
+def test_row_cap_is_independent_of_the_mode_hint(intent):
+    assert intent.max_results >= intent.expected_results
@@ -0,0 +1,463 @@
+import re
+from datetime import datetime, timedelta
+from telemetry import get_logger
+
+log = get_logger(__name__)
+
+# Splunk relative time modifiers, e.g. "-24h", "@d", "@d-1d", "-7d@w1", "now"
+_UNITS = {
+    "s": "s", "sec": "s", "secs": "s", "second": "s", "seconds": "s",
+    "m": "m", "min": "m", "mins": "m", "minute": "m", "minutes": "m",
+    "h": "h", "hr": "h", "hrs": "h", "hour": "h", "hours": "h",
+    "d": "d", "day": "d", "days": "d",
+    "w": "w", "week": "w", "weeks": "w",
+    "mon": "mon", "month": "mon", "months": "mon",
+    "q": "q", "qtr": "q", "qtrs": "q", "quarter": "q", "quarters": "q",
+    "y": "y", "yr": "y", "yrs": "y", "year": "y", "years": "y",
+}
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+_OFFSET_RE = re.compile(r"([+-])(\d*)([a-z]+)")
+_SNAP_RE = re.compile(r"@([a-z]+)(\d?)")
+_ABSOLUTE_FORMAT = "%m/%d/%Y:%H:%M:%S"
+_EPOCH_RE = re.compile(r"\d+(\.\d+)?")
+# Bare numbers below this (September 2001) are counts or clock hours, not epoch seconds; 0 still means all time
+_MIN_EPOCH = 10 ** 9
+
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    month_index = moment.month - 1 + months
+    year = moment.year + month_index // 12
+    month = month_index % 12 + 1
+    # Clamp the day so "-1mon" from March 31st lands on the last day of February
+    for day in (moment.day, 30, 29, 28):
+        try:
+            return moment.replace(year=year, month=month, day=day)
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot shift {moment} by {months} months")
+
+
+def _shift(moment: datetime, sign: str, amount: int, unit: str) -> datetime:
+    amount = -amount if sign == "-" else amount
+    if unit in _UNIT_SECONDS:
+        return moment + timedelta(seconds=amount * _UNIT_SECONDS[unit])
+    if unit == "mon":
+        return _add_months(moment, amount)
+    if unit == "q":
+        return _add_months(moment, amount * 3)
+    return _add_months(moment, amount * 12)
+
+
+def _snap(moment: datetime, unit: str, weekday: str = "") -> datetime:
+    if unit == "s":
+        return moment.replace(microsecond=0)
+    if unit == "m":
+        return moment.replace(second=0, microsecond=0)
+    if unit == "h":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day_start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "d":
+        return day_start
+    if unit == "w":
+        # Splunk weeks start on Sunday (w0); @w1 snaps to Monday, etc.
+        target = int(weekday or 0)
+        days_back = (day_start.isoweekday() % 7 - target) % 7
+        return day_start - timedelta(days=days_back)
+    if unit == "mon":
+        return day_start.replace(day=1)
+    if unit == "q":
+        return day_start.replace(day=1, month=(day_start.month - 1) // 3 * 3 + 1)
+    return day_start.replace(day=1, month=1)
+
+
+def _epoch(text, modifier):
+    if 0 < float(text) < _MIN_EPOCH:
+        raise ValueError(f"Implausible epoch time {modifier!r}")
+    return datetime.fromtimestamp(float(text))
+
+
+def resolve_time_modifier(modifier: str, now: datetime | None = None) -> datetime:
+    now = now or datetime.now()
+    text = (modifier or "now").strip().lower().strip('"')
+    if text in ("", "now"):
+        return now
+    if _EPOCH_RE.fullmatch(text):
+        return _epoch(text, modifier)
+    try:
+        return datetime.strptime(text, _ABSOLUTE_FORMAT)
+    except ValueError:
+        pass
+
+    moment = now
+    position = 0
+    while position < len(text):
+        offset = _OFFSET_RE.match(text, position)
+        if offset:
+            sign, amount, unit = offset.groups()
+            if unit not in _UNITS:
+                raise ValueError(f"Unknown time unit in {modifier!r}")
+            moment = _shift(moment, sign, int(amount or 1), _UNITS[unit])
+            position = offset.end()
+            continue
+        snap = _SNAP_RE.match(text, position)
+        if snap:
+            unit, weekday = snap.groups()
+            if unit not in _UNITS:
+                raise ValueError(f"Unknown snap unit in {modifier!r}")
+            moment = _snap(moment, _UNITS[unit], weekday)
+            position = snap.end()
+            continue
+        raise ValueError(f"Unsupported time modifier {modifier!r}")
+    return moment
+
+
+def window_seconds(earliest: str, latest: str = "now", now: datetime | None = None) -> float:
+    now = now or datetime.now()
+    start = resolve_time_modifier(earliest, now)
+    end = resolve_time_modifier(latest, now)
+    return max(0.0, (end - start).total_seconds())
+
+
+# --- Natural-language time ranges -> canonical (earliest, latest) Splunk modifiers ---
+
+DEFAULT_TIME_RANGE = ("-1h", "now")
+
+_CANONICAL_SECONDS = (("d", 86400), ("h", 3600), ("m", 60), ("s", 1))
+_SNAP_NAMES = {"s": "s", "m": "m", "h": "h", "d": "d", "w": "w", "mon": "mon", "q": "q", "y": "y"}
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "thirty": 30,
+    "forty-five": 45, "sixty": 60, "ninety": 90,
+}
+_WEEKDAYS = {"sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6}
+_MONTH_NAMES = {m: i for i, m in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+_PERIODS = {"hour": "h", "day": "d", "week": "w", "month": "mon", "quarter": "q", "year": "y"}
+
+_UNIT_ALTERNATION = "|".join(sorted(map(re.escape, _UNITS), key=len, reverse=True))
+_NUMBER = rf"\d+(?:\.\d+)?|{'|'.join(sorted(map(re.escape, _NUMBER_WORDS), key=len, reverse=True))}"
+_TIME = r"(\d{1,2})(?::(\d{2}))?(?::(\d{2}))?\s*([ap]\.?m\.?)?"
+
+_EXPLICIT_RE = re.compile(r"\b(earliest|latest)\s*=\s*\"?([^\s\"]+)\"?")
+_RANGE_RE = re.compile(r"\b(?:between|from)\s+(.+?)\s+(?:and|to|until|till|through)\s+(.+)")
+_SINCE_RE = re.compile(r"\b(?:since|after|starting)\s+(.+)")
+_LAST_RE = re.compile(
+    rf"\b(?:last|past|previous|prior|recent|within)\s+(?:({_NUMBER})\s*)?(full\s+|whole\s+|complete\s+)?({_UNIT_ALTERNATION})\b"
+)
+_AGO_RE = re.compile(rf"\b({_NUMBER})\s*({_UNIT_ALTERNATION})\s+ago\b")
+_NAMED_RE = re.compile(r"\b(day before yesterday|yesterday|today|this (?:hour|day|week|month|quarter|year))\b")
+_ON_RE = re.compile(r"\bon\s+(.+)")
+_WEEKDAY_RE = re.compile(rf"\b(last\s+)?({'|'.join(_WEEKDAYS)})\b")
+_DATE_SEARCH_RE = re.compile(
+    r"\b(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{4}"
+    r"|(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?\b"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*)"
+)
+_MODIFIER_RE = re.compile(r"(?<!\S)([+-]\d*[a-z]+(?:@[a-z]+\d?)?|@[a-z]+\d?(?:[+-]\d*[a-z]+)*)(?!\S)")
+
+_ISO_RE = re.compile(rf"(\d{{4}})-(\d{{1,2}})-(\d{{1,2}})(?:[ t]{_TIME})?")
+_US_RE = re.compile(rf"(\d{{1,2}})/(\d{{1,2}})/(\d{{4}})(?:[ :]{_TIME})?")
+_MONTH_DAY_RE = re.compile(rf"([a-z]{{3}})[a-z]*\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(\d{{4}}))?(?:,?\s+(?:at\s+)?{_TIME})?")
+_DAY_MONTH_RE = re.compile(rf"(\d{{1,2}})(?:st|nd|rd|th)?\s+([a-z]{{3}})[a-z]*\.?(?:,?\s+(\d{{4}}))?(?:,?\s+(?:at\s+)?{_TIME})?")
+_TIME_ONLY_RE = re.compile(rf"(?:at\s+)?{_TIME}")
+_AGO_POINT_RE = re.compile(rf"({_NUMBER})\s*({_UNIT_ALTERNATION})\s+ago")
+
+
+def canonical_modifier(modifier: str) -> str:
+    # One spelling per window: "-24h" and "-1d" both become "-1d", absolute times use Splunk's own format
+    text = (modifier or "now").strip().lower().strip('"')
+    if text in ("", "now"):
+        return "now"
+    if _EPOCH_RE.fullmatch(text):
+        return _epoch(text, modifier).strftime(_ABSOLUTE_FORMAT)
+    try:
+        return datetime.strptime(text, _ABSOLUTE_FORMAT).strftime(_ABSOLUTE_FORMAT)
+    except ValueError:
+        pass
+
+    parts = []
+    position = 0
+    while position < len(text):
+        offset = _OFFSET_RE.match(text, position)
+        if offset:
+            sign, amount, unit = offset.groups()
+            if unit not in _UNITS:
+                raise ValueError(f"Unknown time unit in {modifier!r}")
+            parts.append(_canonical_offset(sign, int(amount or 1), _UNITS[unit]))
+            position = offset.end()
+            continue
+        snap = _SNAP_RE.match(text, position)
+        if snap:
+            unit, weekday = snap.groups()
+            if unit not in _UNITS:
+                raise ValueError(f"Unknown snap unit in {modifier!r}")
+            unit = _UNITS[unit]
+            parts.append(f"@{unit}{weekday or '0'}" if unit == "w" else f"@{_SNAP_NAMES[unit]}")
+            position = snap.end()
+            continue
+        raise ValueError(f"Unsupported time modifier {modifier!r}")
+    return "".join(parts)
+
+
+def _canonical_offset(sign, amount, unit):
+    if unit == "w":
+        amount, unit = amount * 7, "d"
+    if unit in _UNIT_SECONDS:
+        seconds = amount * _UNIT_SECONDS[unit]
+        for name, size in _CANONICAL_SECONDS:
+            if seconds % size == 0:
+                return f"{sign}{seconds // size}{name}"
+    return f"{sign}{amount}{unit}"
+
+
+def _number(text):
+    if text in _NUMBER_WORDS:
+        return _NUMBER_WORDS[text]
+    return int(text) if text.isdigit() else float(text)
+
+
+def _ago(amount, unit):
+    # Splunk offsets are whole numbers: "1.5 hours" is spelled -90m, fractional months or years are refused
+    unit = _UNITS[unit]
+    if amount != int(amount):
+        seconds = amount * _UNIT_SECONDS.get(unit, 0)
+        if not seconds or seconds != int(seconds):
+            raise ValueError(f"Unsupported fractional amount {amount:g}{unit}")
+        amount, unit = seconds, "s"
+    return canonical_modifier(f"-{int(amount)}{unit}")
+
+
+def _clock(hour, minute, second, meridiem):
+    hour, minute, second = int(hour), int(minute or 0), int(second or 0)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.startswith("p") else 0)
+    return hour, minute, second
+
+
+def _absolute(year, month, day, hour, minute, second, meridiem):
+    # Returns (start, end) modifiers covering what was said: a bare date is the whole day, "3pm" or "08:00"
+    # the whole hour, "08:17" that minute and "08:17:05" that second
+    moment = datetime(int(year), int(month), int(day))
+    if hour is None:
+        width = timedelta(days=1)
+    else:
+        moment = moment.replace(**dict(zip(("hour", "minute", "second"), _clock(hour, minute, second, meridiem))))
+        if second is not None:
+            width = timedelta(seconds=1)
+        elif minute is not None and int(minute):
+            width = timedelta(minutes=1)
+        else:
+            width = timedelta(hours=1)
+    return moment.strftime(_ABSOLUTE_FORMAT), (moment + width).strftime(_ABSOLUTE_FORMAT)
+
+
+def _clock_point(point):
+    # True for a point from a time of day, as opposed to a whole day or a relative modifier
+    try:
+        start, end = (datetime.strptime(p, _ABSOLUTE_FORMAT) for p in point)
+    except ValueError:
+        return False
+    return end - start < timedelta(days=1)
+
+
+def _named_month_year(month, day, year, now):
+    if year:
+        return int(year)
+    # "June 4" means the most recent June 4th, not one in the future
+    return now.year if (month, int(day)) <= (now.month, now.day) else now.year - 1
+
+
+def _parse_point(text, now):
+    # A single point in time -> (start, end) modifiers, or None when the text isn't one
+    text = text.strip(" ,.?!;")
+    if text == "now":
+        return "now", "now"
+    if text == "today":
+        return "@d", "now"
+    if text == "yesterday":
+        return "-1d@d", "@d"
+    if text in _WEEKDAYS:
+        return _weekday_window(_WEEKDAYS[text], False, now)
+    try:
+        match = _AGO_POINT_RE.fullmatch(text)
+        if match:
+            stamp = _ago(_number(match.group(1)), match.group(2))
+            return stamp, stamp
+        match = _ISO_RE.fullmatch(text)
+        if match:
+            return _absolute(*match.groups())
+        match = _US_RE.fullmatch(text)
+        if match:
+            month, day, year, *clock = match.groups()
+            return _absolute(year, month, day, *clock)
+        match = _MONTH_DAY_RE.fullmatch(text)
+        if match and match.group(1) in _MONTH_NAMES:
+            month_name, day, year, *clock = match.groups()
+            month = _MONTH_NAMES[month_name]
+            return _absolute(_named_month_year(month, day, year, now), month, day, *clock)
+        match = _DAY_MONTH_RE.fullmatch(text)
+        if match and match.group(2) in _MONTH_NAMES:
+            day, month_name, year, *clock = match.groups()
+            month = _MONTH_NAMES[month_name]
+            return _absolute(_named_month_year(month, day, year, now), month, day, *clock)
+        match = _TIME_ONLY_RE.fullmatch(text)
+        if match and (match.group(2) or match.group(4)):
+            # A time of day that hasn't come yet today means yesterday's
+            day = now if _clock(*match.groups()) <= (now.hour, now.minute, now.second) else now - timedelta(days=1)
+            return _absolute(day.year, day.month, day.day, *match.groups())
+    except ValueError:
+        return None
+    if _EPOCH_RE.fullmatch(text):
+        # A bare number in a sentence ("after 3 retries", "from 9 to 5") is never an epoch time;
+        # those are only accepted in explicit earliest=/latest= modifiers
+        return None
+    try:
+        return canonical_modifier(text), canonical_modifier(text)
+    except ValueError:
+        return None
+
+
+def _leading_point(text, now, max_words=6):
+    # The longest run of leading words that reads as a point in time ("2025-06-04 08:00 for AppServer1")
+    words = text.split()
+    for count in range(min(len(words), max_words), 0, -1):
+        point = _parse_point(" ".join(words[:count]), now)
+        if point is not None:
+            return point
+    return None
+
+
+def _weekday_window(weekday, previous, now):
+    start = f"@w{weekday}"
+    # "last monday" said on a Monday means a week ago, not today
+    if previous and now.isoweekday() % 7 == weekday:
+        start += "-7d"
+    return start, f"{start}+1d"
+
+
+def _last_window(amount, full, unit):
+    if full:
+        unit = _UNITS[unit]
+        if amount != int(amount):
+            raise ValueError(f"Unsupported fractional amount {amount:g} full {unit}")
+        snap = "w0" if unit == "w" else _SNAP_NAMES[unit]
+        return canonical_modifier(f"-{amount}{unit}@{snap}"), canonical_modifier(f"@{snap}")
+    return _ago(amount, unit), "now"
+
+
+def _time_of_day(text):
+    # The clock time a range bound starts with, when it gives no date ("9am", "10:30 pm for AppA")
+    words = text.split()
+    for count in (3, 2, 1):
+        match = _TIME_ONLY_RE.fullmatch(" ".join(words[:count]))
+        if match and (match.group(2) or match.group(4)):
+            try:
+                hour, minute, second = _clock(*match.groups())
+                return datetime.min.replace(hour=hour, minute=minute, second=second).time()
+            except ValueError:
+                return None
+    return None
+
+
+def _range(start_text, end_text, start, end, now):
+    # A range ending on a time of day stops at that time; one ending on a day includes the whole day
+    start_clock, end_clock = _time_of_day(start_text), _time_of_day(end_text)
+    if start_clock is not None and end_clock is not None:
+        # Two bare times are placed together: "between 10pm and 2am" runs past midnight,
+        # and a range that hasn't started yet today is yesterday's
+        first = datetime.combine(now.date(), start_clock)
+        last = datetime.combine(now.date(), end_clock)
+        if last <= first:
+            last += timedelta(days=1)
+        if first > now:
+            first, last = first - timedelta(days=1), last - timedelta(days=1)
+        return first.strftime(_ABSOLUTE_FORMAT), last.strftime(_ABSOLUTE_FORMAT)
+    last = end[0] if _clock_point(end) else end[1]
+    if resolve_time_modifier(start[0], now) > resolve_time_modifier(last, now):
+        return None
+    return start[0], last
+
+
+def parse_time_range(time_range: str, now: datetime | None = None, default=DEFAULT_TIME_RANGE) -> tuple[str, str]:
+    # Finds the time expression anywhere in the text (the fast router passes the whole message)
+    now = now or datetime.now()
+    text = " ".join((time_range or "").lower().split())
+    if not text:
+        return default
+
+    explicit = dict(_EXPLICIT_RE.findall(text))
+    if explicit:
+        try:
+            return canonical_modifier(explicit.get("earliest", default[0])), canonical_modifier(explicit.get("latest", "now"))
+        except ValueError:
+            pass
+
+    match = _RANGE_RE.search(text)
+    if match:
+        start, end = _leading_point(match.group(1), now), _leading_point(match.group(2), now)
+        if start and end:
+            window = _range(match.group(1), match.group(2), start, end, now)
+            if window is None:
+                # "from June 4 to June 6 2025": the start borrows the year given for the end
+                start = _leading_point(f"{match.group(1)} {resolve_time_modifier(end[0], now).year}", now) or start
+                window = _range(match.group(1), match.group(2), start, end, now)
+            if window is not None:
+                return window
+            log.debug("Ignoring a time range that ends before it starts", extra={"time_range": time_range})
+
+    match = _SINCE_RE.search(text)
+    if match:
+        start = _leading_point(match.group(1), now)
+        if start:
+            return start[0], "now"
+
+    match = _LAST_RE.search(text)
+    if match:
+        amount, full, unit = match.groups()
+        try:
+            return _last_window(_number(amount) if amount else 1, bool(full), unit)
+        except ValueError:
+            pass
+
+    match = _AGO_RE.search(text)
+    if match:
+        try:
+            return _ago(_number(match.group(1)), match.group(2)), "now"
+        except ValueError:
+            pass
+
+    match = _NAMED_RE.search(text)
+    if match:
+        name = match.group(1)
+        if name == "day before yesterday":
+            return "-2d@d", "-1d@d"
+        if name.startswith("this "):
+            unit = _PERIODS[name[5:]]
+            return ("@w0" if unit == "w" else f"@{unit}"), "now"
+        return _parse_point(name, now)
+
+    match = _ON_RE.search(text)
+    if match:
+        point = _leading_point(match.group(1), now)
+        if point:
+            return point
+
+    match = _WEEKDAY_RE.search(text)
+    if match:
+        return _weekday_window(_WEEKDAYS[match.group(2)], bool(match.group(1)), now)
+
+    match = _DATE_SEARCH_RE.search(text)
+    if match:
+        point = _leading_point(text[match.start():], now)
+        if point:
+            return point
+
+    for candidate in _MODIFIER_RE.findall(text):
+        try:
+            return canonical_modifier(candidate), "now"
+        except ValueError:
+            continue
+
+    log.debug("No time range recognised; using default", extra={"time_range": time_range, "earliest": default[0], "latest": default[1]})
+    return default